@@ -0,0 +1,223 @@
+"""
+Benchmarks for the lexer and parser, including a corpus of worst case
+(adversarial) checklists used to check lexing stays linear in the size of the
+input. Run with "python -m checklistdsl.bench".
+
+Also measures the memory used by get_tokens and get_form (with tracemalloc)
+across document sizes and checks it against declared budgets. Run with
+"python -m checklistdsl.bench memory".
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import sys
+import timeit
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.loadtest import make_checklist
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+def _long_line(size):
+    """
+    A single very long line of text.
+    """
+    return 'x' * size
+
+
+def _many_braces(size):
+    """
+    An item whose roles are opened many times but never closed.
+    """
+    return '[] ' + '{' * size
+
+
+def _nested_braces(size):
+    """
+    An item with many opening and closing braces.
+    """
+    return '() ' + '{}' * (size // 2) + ' item'
+
+
+def _deep_heading(size):
+    """
+    A heading that is all equals signs with no closing run.
+    """
+    return '=' * size + ' heading'
+
+
+def _equals_runs(size):
+    """
+    Runs of equals signs separated by spaces (a heading with no text).
+    """
+    return '= ' * (size // 2)
+
+
+def _long_break(size):
+    """
+    A very long break followed by a very long line that's almost a break.
+    """
+    return '-' * size + '\n' + '-' * size + 'x'
+
+
+def _many_lines(size):
+    """
+    Lots of short lines of every token type.
+    """
+    lines = ['= h =', '// c', '[] {a} i', '() {b} i', '---', 'text', '/', '(']
+    return '\n'.join(lines * (size // 40))
+
+
+"""
+The adversarial corpus. Each entry is a function that returns a checklist of
+roughly the given size in characters.
+"""
+ADVERSARIAL = {
+    'long_line': _long_line,
+    'many_braces': _many_braces,
+    'nested_braces': _nested_braces,
+    'deep_heading': _deep_heading,
+    'equals_runs': _equals_runs,
+    'long_break': _long_break,
+    'many_lines': _many_lines,
+}
+
+
+def time_lexing(source, repeat=3, number=1):
+    """
+    Return the best time (in seconds) taken to lex the source.
+    """
+    timer = timeit.Timer(lambda: get_tokens(source))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def lexing_growth(name, size, factor=8):
+    """
+    Return the ratio between the time taken to lex the named adversarial
+    checklist at size * factor and at size. For a linear lexer this is about
+    the same as the factor.
+    """
+    make = ADVERSARIAL[name]
+    small = time_lexing(make(size))
+    large = time_lexing(make(size * factor))
+    return large / max(small, 1e-9)
+
+
+"""
+The number of lines in the checklists whose memory use is measured.
+"""
+MEMORY_SIZES = (100, 1000, 10000)
+
+
+"""
+The memory budgets. The token budgets are in bytes per token (including the
+token's value and roles) and the render budgets in bytes per byte of output.
+Retained memory is what's still allocated afterwards (the tokens or the
+HTML), peak memory the most allocated at any point.
+"""
+BUDGETS = {
+    'token_retained': 200,
+    'token_peak': 300,
+    'render_retained': 1.1,
+    'render_peak': 1.5,
+}
+
+
+def measure_memory(lines, seed=0):
+    """
+    Return a dict of the memory used to lex and render a checklist (as
+    bytes, the way they're served) with the given number of lines: the
+    number of tokens and bytes of output, and the retained and peak memory
+    per token and per byte of output. The checklist is rendered once
+    beforehand so the (shared) fragment cache is already warm. Returns None
+    if tracemalloc isn't available (it was added in Python 3.4).
+    """
+    if tracemalloc is None:
+        return None
+    source = make_checklist(lines, seed).encode('utf-8')
+    get_form(get_tokens(source), 'memory')
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        # Clearing the traces also resets the peak.
+        tracemalloc.clear_traces()
+        tokens = get_tokens(source)
+        token_retained, token_peak = tracemalloc.get_traced_memory()
+        tracemalloc.clear_traces()
+        html = get_form(tokens, 'memory')
+        render_retained, render_peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    count = max(len(tokens), 1)
+    size = len(html)
+    return {
+        'lines': lines,
+        'tokens': len(tokens),
+        'output': size,
+        'token_retained': float(token_retained) / count,
+        'token_peak': float(token_peak) / count,
+        'render_retained': float(render_retained) / size,
+        'render_peak': float(render_peak) / size,
+    }
+
+
+def check_budgets(results, budgets=None):
+    """
+    Return a list of (lines, measure, value, budget) tuples for each result
+    (from measure_memory) that is over budget. An empty list means everything
+    is within budget.
+    """
+    budgets = budgets or BUDGETS
+    failures = []
+    for result in results:
+        for measure in sorted(budgets):
+            if result[measure] > budgets[measure]:
+                failures.append((result['lines'], measure, result[measure],
+                    budgets[measure]))
+    return failures
+
+
+def memory_report(sizes=MEMORY_SIZES):
+    """
+    Print the memory used for checklists of each size and return the list of
+    results over budget.
+    """
+    results = [measure_memory(lines) for lines in sizes]
+    if results and results[0] is None:
+        print('Memory can only be measured with tracemalloc (Python 3.4+).')
+        return []
+    print('%7s %7s %14s %10s %15s %11s' % ('lines', 'tokens',
+        'token retained', 'token peak', 'render retained', 'render peak'))
+    for result in results:
+        print('%7d %7d %14.1f %10.1f %15.2f %11.2f' % (result['lines'],
+            result['tokens'], result['token_retained'], result['token_peak'],
+            result['render_retained'], result['render_peak']))
+    failures = check_budgets(results)
+    for lines, measure, value, budget in failures:
+        print('%d lines: %s of %.2f is over the budget of %.2f' % (lines,
+            measure, value, budget))
+    return failures
+
+
+def main(argv=None):
+    """
+    Print how lexing time grows for each adversarial checklist or, given the
+    "memory" argument, the memory used compared to the budgets (exiting with
+    a status of 1 if anything is over budget).
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'memory':
+        return 1 if memory_report() else 0
+    for name in sorted(ADVERSARIAL):
+        print('%-15s %6.2fx (for 8x the input)' % (name,
+            lexing_growth(name, 100000)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Thread safe caches of lexed and rendered checklists and a helper for rendering
+many forms at once (for example, all the checklists on a dashboard page) from
+a single shared cache.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.compress import compress_form
+
+
+class TokenCache(object):
+    """
+    Caches the tokens lexed from checklist sources. Since tokens are immutable
+    the cached tuples may be shared freely between threads and requests.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_tokens(self, source, key=None):
+        """
+        Return a tuple of tokens for the given source, lexing it if it's not
+        already in the cache. The key defaults to the source itself.
+        """
+        if key is None:
+            key = source
+        try:
+            return self._tokens[key]
+        except KeyError:
+            pass
+        # Lex outside the lock. If two threads race to lex the same source
+        # the first one to finish wins and the other result is discarded.
+        tokens = tuple(get_tokens(source))
+        with self._lock:
+            return self._tokens.setdefault(key, tokens)
+
+    def invalidate(self, key):
+        """
+        Remove the entry with the given key (if it exists).
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def clear(self):
+        """
+        Empty the cache.
+        """
+        with self._lock:
+            self._tokens.clear()
+
+    def __contains__(self, key):
+        return key in self._tokens
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+class RenderCache(object):
+    """
+    Caches rendered forms along with their pre-compressed variants (see
+    checklistdsl.compress) so a cached form can be served without rendering
+    or compressing it again. Since the cached HTML is shared it never contains
+    a CSRF token.
+    """
+
+    def __init__(self, tokens=None, level=9):
+        """
+        tokens - the TokenCache to lex sources with (a new one by default).
+        level - the compression level to use.
+        """
+        if tokens is None:
+            tokens = TokenCache()
+        self.tokens = tokens
+        self.level = level
+        self._forms = {}
+        self._lock = threading.Lock()
+
+    def get_form(self, source, form_id=None, **kwargs):
+        """
+        Return a CompressedForm for the given source rendered with the given
+        form_id and form attributes, rendering and compressing it if it's not
+        already in the cache.
+        """
+        key = (source, form_id, tuple(sorted(kwargs.items())))
+        try:
+            return self._forms[key]
+        except KeyError:
+            pass
+        html = get_form(self.tokens.get_tokens(source), form_id, **kwargs)
+        form = compress_form(html, self.level)
+        with self._lock:
+            return self._forms.setdefault(key, form)
+
+    def clear(self):
+        """
+        Empty the cache (but not the underlying TokenCache).
+        """
+        with self._lock:
+            self._forms.clear()
+
+    def __len__(self):
+        return len(self._forms)
+
+
+def render_forms(cache, jobs, processes=None):
+    """
+    Given a TokenCache and a list of jobs will render each job's form in a
+    pool of threads and return the resulting HTML in the same order as the
+    jobs. Each job is a (source, arguments) pair where arguments is a dict of
+    the named arguments to pass to get_form (form_id, csrf_token and any form
+    attributes). The processes argument is the number of threads to use and
+    defaults to the number of CPUs.
+    """
+    def render(job):
+        source, arguments = job
+        return get_form(cache.get_tokens(source), **arguments)
+
+    pool = ThreadPool(processes)
+    try:
+        return pool.map(render, jobs)
+    finally:
+        pool.close()
+        pool.join()
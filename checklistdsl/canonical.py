@@ -0,0 +1,221 @@
+"""
+Turns tokens back into checklist source in a canonical form so copies of a
+checklist that differ only cosmetically (whitespace, blank lines, comments,
+the order and case of roles, unbalanced or extra equals signs around a
+heading, the length of a break) have the same source and so the same hash.
+For example, both of:
+
+    ===Heading=          and     === Heading ===
+    [] {Nurse,doctor}  Item      // A comment
+                                 [] {doctor, nurse} Item
+
+become:
+
+    === Heading ===
+    [] {doctor, nurse} Item
+
+Values are kept verbatim (an item without roles whose value starts with a
+brace is separated from it by a tab rather than a space). Lexing the
+canonical source gives the canonical tokens, which render the same HTML as
+the original tokens apart from the order of the roles.
+
+CanonicalStore uses the canonical hash to keep a single copy (and a single
+cached list of tokens) of every distinct checklist.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import hashlib
+import threading
+from checklistdsl.lex import Token, get_tokens
+from checklistdsl.cache import TokenCache
+
+
+def canonical_token(token):
+    """
+    Return the canonical version of the token: headings no smaller than h6,
+    sorted roles and a break of exactly three minus signs.
+    """
+    if token.token == 'HEADING' and token.size and token.size > 6:
+        return Token('HEADING', token.value, size=6)
+    if token.roles and token.token in ('AND_ITEM', 'OR_ITEM'):
+        return Token(token.token, token.value, roles=sorted(token.roles))
+    if token.token == 'BREAK':
+        value = '---'
+        if isinstance(token.value, bytes):
+            value = b'---'
+        return Token('BREAK', value)
+    return token
+
+
+def _get_formats(encode):
+    """
+    Return a dict of the (text or bytes) pieces canonical source is made of.
+    """
+    formats = dict((key, encode(key)) for key in ('=', '[]', '()', '---',
+        '{', ', ', '\n', ''))
+    formats['heading'] = encode('%s %s %s')
+    formats['roles'] = encode('%s {%s} %s')
+    formats['item'] = encode('%s %s')
+    # An item without roles whose value starts with a brace is separated
+    # from its value by a tab, which isn't skipped when looking for roles.
+    formats['brace_item'] = encode('%s\t%s')
+    return formats
+
+
+"""
+The pieces used to format tokens with text and bytes values. Bytes values
+are formatted without decoding so values that aren't valid UTF-8 are kept.
+"""
+_TEXT = _get_formats(lambda text: text)
+_BYTES = _get_formats(lambda text: text.encode('ascii'))
+
+
+def format_token(token):
+    """
+    Return the canonical line of source (of the same type, text or bytes, as
+    the token's value) for the token. Raises ValueError for token types that
+    can't be formatted.
+    """
+    value = token.value
+    formats = _BYTES if isinstance(value, bytes) else _TEXT
+    if token.token == 'HEADING':
+        if not token.size:
+            # A heading without text: the token's value is the whole line.
+            return value
+        equals = formats['='] * min(token.size, 6)
+        return formats['heading'] % (equals, value, equals)
+    if token.token in ('AND_ITEM', 'OR_ITEM'):
+        marker = formats['[]' if token.token == 'AND_ITEM' else '()']
+        if token.roles:
+            roles = formats[', '].join(sorted(token.roles))
+            return formats['roles'] % (marker, roles, value)
+        if value[:1] == formats['{']:
+            return formats['brace_item'] % (marker, value)
+        return formats['item'] % (marker, value)
+    if token.token == 'BREAK':
+        return formats['---']
+    if token.token == 'TEXT':
+        return value
+    raise ValueError('Cannot format %s tokens.' % token.token)
+
+
+def format_tokens(tokens):
+    """
+    Return the canonical source for the tokens (of the same type, text or
+    bytes, as the tokens' values).
+    """
+    formats = _TEXT
+    if tokens and isinstance(tokens[0].value, bytes):
+        formats = _BYTES
+    newline = formats['\n']
+    return formats[''].join([format_token(token) + newline
+        for token in tokens])
+
+
+def canonicalize(source):
+    """
+    Return the canonical version of the source (text or bytes).
+    """
+    return format_tokens(get_tokens(source))
+
+
+def _hash(canonical):
+    """
+    Return the hex SHA-256 digest of source that's already canonical.
+    """
+    if not isinstance(canonical, bytes):
+        canonical = canonical.encode('utf-8')
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def canonical_hash(source):
+    """
+    Return the hex SHA-256 digest of the canonical version of the source
+    (text or bytes, the same source gives the same hash either way).
+    """
+    return _hash(canonicalize(source))
+
+
+class CanonicalStore(object):
+    """
+    Stores checklists by name, keeping only one copy of the canonical source
+    (and lexing it only once) for each distinct checklist however many names
+    refer to it.
+    """
+
+    def __init__(self, tokens=None):
+        """
+        tokens - the TokenCache to keep the lexed checklists in (a new one by
+        default). Its keys are canonical hashes.
+        """
+        if tokens is None:
+            tokens = TokenCache()
+        self.tokens = tokens
+        self._sources = {}
+        self._names = {}
+        # The number of names referring to each hash.
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, source):
+        """
+        Store the source under the given name (replacing any earlier version)
+        and return its canonical hash.
+        """
+        canonical = canonicalize(source)
+        digest = _hash(canonical)
+        with self._lock:
+            old = self._names.get(name)
+            if old != digest:
+                self._sources.setdefault(digest, canonical)
+                self._counts[digest] = self._counts.get(digest, 0) + 1
+                self._names[name] = digest
+                if old is not None:
+                    self._forget(old)
+        return digest
+
+    def remove(self, name):
+        """
+        Remove the named checklist.
+        """
+        with self._lock:
+            self._forget(self._names.pop(name))
+
+    def _forget(self, digest):
+        """
+        Drop a reference to the hash, throwing away its source and tokens if
+        nothing else refers to it.
+        """
+        self._counts[digest] -= 1
+        if not self._counts[digest]:
+            del self._counts[digest]
+            del self._sources[digest]
+            self.tokens.invalidate(digest)
+
+    def get_hash(self, name):
+        """
+        Return the canonical hash of the named checklist.
+        """
+        return self._names[name]
+
+    def get_source(self, name):
+        """
+        Return the canonical source of the named checklist.
+        """
+        return self._sources[self._names[name]]
+
+    def get_tokens(self, name):
+        """
+        Return the (cached) tuple of tokens of the named checklist.
+        """
+        digest = self._names[name]
+        return self.tokens.get_tokens(self._sources[digest], key=digest)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        """
+        The number of distinct checklists.
+        """
+        return len(self._sources)
@@ -0,0 +1,285 @@
+"""
+The checklistdsl command. At the moment it has a single sub-command to find
+out why a checklist is slow to lex or render:
+
+    checklistdsl profile FILE.chkl [--json] [--top N] [--repeat N]
+
+This reports the time taken by each stage (reading, lexing and rendering,
+the last both with an empty fragment cache and with the fragments already
+cached), the functions that took longest (from cProfile), the slowest lines
+of the source (with the token type and MATCHER pattern that matched each and
+how many scanners were tried), the memory allocated (from tracemalloc, when
+available) and how many bytes of output each token type produced. The
+report is printed as text or as JSON.
+
+Rendering is profiled from an empty fragment cache (FRAGMENTS is cleared
+first) so the report shows the cost of rendering a checklist for the first
+time rather than of joining cached fragments.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import timeit
+import uuid
+from checklistdsl.registry import REGISTRY, IGNORE
+from checklistdsl.lex import MATCHER, get_tokens, _BYTES, _TEXT
+from checklistdsl.parse import FRAGMENTS, get_form
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+def _best(function, repeat, setup='pass'):
+    """
+    Return the best time (in seconds) of repeat calls to the function, each
+    after a call to setup (that isn't timed).
+    """
+    return min(timeit.Timer(function, setup).repeat(repeat, 1))
+
+
+def _get_scanner_types():
+    """
+    Return a dict mapping the registered scanners to their token types.
+    """
+    return dict((token_type.scanner, name)
+        for name, token_type in REGISTRY.types.items())
+
+
+def profile_lines(data, repeat=3):
+    """
+    Lex each line of the data on its own and return a list of dicts (one per
+    non-empty line, in order) with the line's number, the best time (in
+    seconds) taken to lex it, the type of token that matched (None if
+    nothing did), the MATCHER pattern for the type (if it's built in) and how
+    many scanners were tried.
+    """
+    if isinstance(data, bytes):
+        literals = _BYTES
+        table, fallbacks = REGISTRY.get_dispatch(True)
+    else:
+        literals = _TEXT
+        table, fallbacks = REGISTRY.get_dispatch(False)
+    scanner_types = _get_scanner_types()
+    patterns = dict((token_type, pattern)
+        for pattern, token_type in MATCHER.items())
+    result = []
+    for number, line in enumerate(data.split(literals['\n']), 1):
+        line = literals['strip'](line)
+        if not line:
+            continue
+        scanners = table.get(line[:1], fallbacks)
+
+        def scan():
+            tried = 0
+            for scanner in scanners:
+                tried += 1
+                token = scanner(line, literals)
+                if token is not None:
+                    return scanner, tried
+            return None, tried
+        scanner, tried = scan()
+        token_type = scanner_types.get(scanner)
+        result.append({
+            'line': number,
+            'time': _best(scan, repeat),
+            'type': token_type,
+            'pattern': patterns.get(token_type),
+            'tried': tried,
+            'length': len(line),
+        })
+    return result
+
+
+def profile_output(tokens, form_id='profile'):
+    """
+    Return a dict mapping token types to the number of bytes (UTF-8) of
+    output their tokens produced. The form's own tags are counted as FORM.
+    """
+    # get_form names each radio button group with a random uuid, so use one
+    # (of the same length) for the fragments of grouped tokens.
+    radio_name = str(uuid.uuid4())
+    grouped = REGISTRY.grouped
+    result = {}
+    for token in tokens:
+        name = radio_name if token.token in grouped else form_id
+        tag = FRAGMENTS.get_tag(token, name)
+        if not isinstance(tag, bytes):
+            tag = tag.encode('utf-8')
+        result[token.token] = result.get(token.token, 0) + len(tag)
+    html = get_form(tokens, form_id)
+    if not isinstance(html, bytes):
+        html = html.encode('utf-8')
+    result['FORM'] = len(html) - sum(result.values())
+    return result
+
+
+def profile_functions(data, top=10):
+    """
+    Lex and render the data (from an empty fragment cache) under cProfile and
+    return a list of dicts for the top functions by cumulative time.
+    """
+    FRAGMENTS.clear()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    get_form(get_tokens(data), 'profile')
+    profiler.disable()
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: -item[1][3])[:top]
+    result = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in rows:
+        result.append({
+            'function': '%s:%d(%s)' % (os.path.basename(filename), line,
+                name),
+            'calls': calls,
+            'time': total,
+            'cumulative': cumulative,
+        })
+    return result
+
+
+def profile_allocations(data, top=5):
+    """
+    Lex and render the data (from an empty fragment cache) while tracing
+    memory allocations. Returns a dict with the peak memory, the size and
+    number (count) of the blocks still allocated after rendering (e.g. the
+    cached fragments) and the top lines of code by memory allocated. Returns
+    None if tracemalloc isn't available (it was added in Python 3.4).
+    """
+    if tracemalloc is None:
+        return None
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    FRAGMENTS.clear()
+    try:
+        tracemalloc.clear_traces()
+        html = get_form(get_tokens(data), 'profile')
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    stats = snapshot.statistics('lineno')
+    del html
+    return {
+        'peak': peak,
+        'size': sum(stat.size for stat in stats),
+        'count': sum(stat.count for stat in stats),
+        'top': [{
+            'where': '%s:%d' % (os.path.basename(stat.traceback[0].filename),
+                stat.traceback[0].lineno),
+            'size': stat.size,
+            'count': stat.count,
+        } for stat in stats[:top]],
+    }
+
+
+def profile(path, top=10, repeat=3):
+    """
+    Profile lexing and rendering the checklist in the file at the given path
+    (read as bytes, just as checklistdsl.wsgi does). Returns the report as a
+    dict (see the module's docstring).
+    """
+    def read():
+        with open(path, 'rb') as source:
+            return source.read()
+    data = read()
+    tokens = get_tokens(data)
+    lines = profile_lines(data, repeat)
+    stages = {
+        'read': _best(read, repeat),
+        'lex': _best(lambda: get_tokens(data), repeat),
+        'render': _best(lambda: get_form(tokens, 'profile'), repeat,
+            FRAGMENTS.clear),
+        'render_warm': _best(lambda: get_form(tokens, 'profile'), repeat),
+    }
+    types = {}
+    for token in tokens:
+        types[token.token] = types.get(token.token, 0) + 1
+    return {
+        'file': path,
+        'bytes': len(data),
+        'lines': len(data.split(b'\n')),
+        'tokens': len(tokens),
+        'token_types': types,
+        'stages': stages,
+        'functions': profile_functions(data, top),
+        'slowest_lines': sorted(lines, key=lambda line: -line['time'])[:top],
+        'allocations': profile_allocations(data),
+        'output': profile_output(tokens),
+    }
+
+
+def format_report(report):
+    """
+    Return the report as text.
+    """
+    result = ['%(file)s: %(bytes)d bytes, %(lines)d lines, %(tokens)d tokens'
+        % report, '', 'Stages:']
+    for stage in ('read', 'lex', 'render', 'render_warm'):
+        result.append('  %-11s %10.3fms' % (stage,
+            report['stages'][stage] * 1000))
+    result += ['', 'Functions (by cumulative time):']
+    for function in report['functions']:
+        result.append('  %8.3fms %8.3fms %7d  %s' % (
+            function['cumulative'] * 1000, function['time'] * 1000,
+            function['calls'], function['function']))
+    result += ['', 'Slowest lines:']
+    for line in report['slowest_lines']:
+        result.append('  line %-6d %9.2fus %-10s tried %d  %s' % (
+            line['line'], line['time'] * 1e6, line['type'], line['tried'],
+            line['pattern'] or ''))
+    result += ['', 'Allocations:']
+    allocations = report['allocations']
+    if allocations is None:
+        result.append('  (tracemalloc is not available)')
+    else:
+        result.append('  peak %d bytes, %d bytes in %d live blocks after '
+            'render' % (allocations['peak'], allocations['size'],
+            allocations['count']))
+        for stat in allocations['top']:
+            result.append('  %10d bytes %7d blocks  %s' % (stat['size'],
+                stat['count'], stat['where']))
+    result += ['', 'Output (bytes by token type):']
+    output = report['output']
+    for name in sorted(output, key=lambda name: -output[name]):
+        result.append('  %-10s %10d  (%d tokens)' % (name, output[name],
+            report['token_types'].get(name, 0)))
+    return '\n'.join(result)
+
+
+def main(argv=None):
+    """
+    Run the checklistdsl command.
+    """
+    parser = argparse.ArgumentParser(prog='checklistdsl')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('profile',
+        help='profile lexing and rendering a checklist')
+    command.add_argument('file', help='the checklist to profile')
+    command.add_argument('--json', action='store_true',
+        help='print the report as JSON')
+    command.add_argument('--top', type=int, default=10,
+        help='the number of functions and lines to report')
+    command.add_argument('--repeat', type=int, default=3,
+        help='the number of times to time each stage and line')
+    args = parser.parse_args(argv)
+    if args.command != 'profile':
+        parser.print_help()
+        return 2
+    report = profile(args.file, top=args.top, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
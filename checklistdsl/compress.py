@@ -0,0 +1,112 @@
+"""
+Pre-compressed variants of rendered checklists. Rendered forms are very
+repetitive (the same few templates are used over and over again) so they
+compress well and, since a cached form doesn't change, it only needs to be
+compressed once rather than for every response.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import io
+import gzip
+import re
+import zlib
+from checklistdsl.parse import (FORM, ROLES, HEADER, PARA, BREAK, RADIO,
+    CHECKBOX, CSRF)
+
+
+"""
+A preset dictionary for zlib made from the static parts of the templates.
+zlib gives the end of the dictionary the shortest back references so the most
+frequently used templates come last.
+"""
+ZDICT = ''.join([re.sub(r'%\(\w+\)[sd]', '', template) for template in
+    (FORM, CSRF, BREAK, HEADER, PARA, ROLES, RADIO, CHECKBOX)]).encode('ascii')
+
+
+try:
+    zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9,
+        zlib.Z_DEFAULT_STRATEGY, ZDICT)
+    HAS_ZDICT = True
+except TypeError:
+    # Older versions of Python don't support preset dictionaries.
+    HAS_ZDICT = False
+
+
+class CompressedForm(object):
+    """
+    A rendered form along with its compressed variants.
+
+    html - the UTF-8 encoded form.
+    gzip - the gzip compressed form (for "Content-Encoding: gzip").
+    deflate - the zlib compressed form (for "Content-Encoding: deflate").
+    zdict - the form compressed by zlib with the ZDICT preset dictionary. This
+    is the smallest variant but browsers can't decode it, so it's meant for
+    storage. None if unsupported.
+    """
+
+    def __init__(self, html, gzip, deflate, zdict=None):
+        self.html = html
+        self.gzip = gzip
+        self.deflate = deflate
+        self.zdict = zdict
+
+    def negotiate(self, accept_encoding=None):
+        """
+        Given the value of an HTTP Accept-Encoding header will return a tuple
+        containing the content encoding to use (None for no encoding) and the
+        matching body. The accepted coding with the highest quality is used
+        (gzip if they're equal). "*" stands for any coding not listed, so a
+        coding listed with q=0 is never used.
+        """
+        qualities = {}
+        for encoding in (accept_encoding or '').split(','):
+            encoding, _, params = encoding.partition(';')
+            quality = 1.0
+            for param in params.split(';'):
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0
+            qualities[encoding.strip().lower()] = quality
+        default = qualities.get('*', 0)
+        gzip_quality = qualities.get('gzip', default)
+        deflate_quality = qualities.get('deflate', default)
+        if gzip_quality > 0 and gzip_quality >= deflate_quality:
+            return 'gzip', self.gzip
+        if deflate_quality > 0:
+            return 'deflate', self.deflate
+        return None, self.html
+
+
+def compress_form(html, level=9):
+    """
+    Given a rendered form (text or UTF-8 encoded bytes) will return a
+    CompressedForm containing it and its compressed variants. The gzip output
+    has no timestamp so the same form always compresses to the same bytes.
+    """
+    if not isinstance(html, bytes):
+        html = html.encode('utf-8')
+    buf = io.BytesIO()
+    gzip_file = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level,
+        mtime=0)
+    try:
+        gzip_file.write(html)
+    finally:
+        gzip_file.close()
+    zdict = None
+    if HAS_ZDICT:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS,
+            9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+        zdict = compressor.compress(html) + compressor.flush()
+    return CompressedForm(html, buf.getvalue(), zlib.compress(html, level),
+        zdict)
+
+
+def decompress_zdict(data):
+    """
+    Decompress a form that was compressed with the ZDICT preset dictionary.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS, ZDICT)
+    return decompressor.decompress(data) + decompressor.flush()
@@ -0,0 +1,147 @@
+"""
+Works out what changed between two versions of a checklist by comparing their
+tokens (so changes to comments and whitespace are ignored). Tokens are hashed
+to integers and compared with difflib's sequence matcher, after trimming the
+unchanged tokens at the start and end.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import difflib
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+
+class Change(object):
+    """
+    A change between two versions of a checklist.
+
+    kind - one of ADDED, REMOVED or MODIFIED.
+    old_index - the position of the token in the old version (None if added).
+    new_index - the position of the token in the new version (None if
+    removed).
+    old - the old token (None if added).
+    new - the new token (None if removed).
+    fields - for MODIFIED changes, a tuple of the names of the token's
+    attributes that changed ('value', 'roles' and/or 'size').
+    """
+
+    def __init__(self, kind, old_index, new_index, old, new, fields=()):
+        self.kind = kind
+        self.old_index = old_index
+        self.new_index = new_index
+        self.old = old
+        self.new = new
+        self.fields = fields
+
+    def __eq__(self, other):
+        if not isinstance(other, Change):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        if self.kind == ADDED:
+            return '+%d %r' % (self.new_index, self.new)
+        if self.kind == REMOVED:
+            return '-%d %r' % (self.old_index, self.old)
+        return '~%d/%d %r -> %r' % (self.old_index, self.new_index, self.old,
+            self.new)
+
+
+def _get_fields(old, new):
+    """
+    Return the names of the attributes that differ between two tokens of the
+    same type.
+    """
+    return tuple([name for name in ('value', 'roles', 'size')
+        if getattr(old, name) != getattr(new, name)])
+
+
+def diff_tokens(old, new, ids=None):
+    """
+    Given the old and new lists of tokens will return a list of Changes (in
+    order) that turn the old tokens into the new ones. A replaced token of
+    the same type is reported as MODIFIED, otherwise tokens are ADDED and
+    REMOVED. Both lists should be lexed from the same kind of input (text or
+    bytes).
+
+    ids is an optional dict used to turn tokens into integers; sharing one
+    between calls (as diff_history does) means each distinct token is only
+    hashed once.
+    """
+    if ids is None:
+        ids = {}
+    old_keys = [ids.setdefault(token, len(ids)) for token in old]
+    new_keys = [ids.setdefault(token, len(ids)) for token in new]
+    if old_keys == new_keys:
+        return []
+    # Trim the common prefix and suffix.
+    start = 0
+    limit = min(len(old_keys), len(new_keys))
+    while start < limit and old_keys[start] == new_keys[start]:
+        start += 1
+    old_end = len(old_keys)
+    new_end = len(new_keys)
+    while (old_end > start and new_end > start and
+            old_keys[old_end - 1] == new_keys[new_end - 1]):
+        old_end -= 1
+        new_end -= 1
+    matcher = difflib.SequenceMatcher(None, old_keys[start:old_end],
+        new_keys[start:new_end], autojunk=False)
+    changes = []
+    for opcode, i1, i2, j1, j2 in matcher.get_opcodes():
+        i1 += start
+        i2 += start
+        j1 += start
+        j2 += start
+        if opcode == 'equal':
+            continue
+        if opcode == 'replace':
+            # Pair up the replaced tokens.
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                if old[i].token == new[j].token:
+                    changes.append(Change(MODIFIED, i, j, old[i], new[j],
+                        _get_fields(old[i], new[j])))
+                else:
+                    changes.append(Change(REMOVED, i, None, old[i], None))
+                    changes.append(Change(ADDED, None, j, None, new[j]))
+            paired = min(i2 - i1, j2 - j1)
+            i1 += paired
+            j1 += paired
+        for i in range(i1, i2):
+            changes.append(Change(REMOVED, i, None, old[i], None))
+        for j in range(j1, j2):
+            changes.append(Change(ADDED, None, j, None, new[j]))
+    return changes
+
+
+def diff_history(versions, ids=None):
+    """
+    Given a list of versions (each a list of tokens) of a checklist, oldest
+    first, will return a list of the changes between each version and the
+    next.
+    """
+    if ids is None:
+        ids = {}
+    return [diff_tokens(old, new, ids)
+        for old, new in zip(versions, versions[1:])]
+
+
+def diff_corpus(histories):
+    """
+    Given a dict mapping the names of checklists to their versions (as
+    passed to diff_history) will return a dict mapping the names to the
+    changes between their versions. Identical tokens across the whole corpus
+    are only hashed once.
+    """
+    ids = {}
+    return dict((name, diff_history(versions, ids))
+        for name, versions in histories.items())
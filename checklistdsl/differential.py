@@ -0,0 +1,202 @@
+"""
+Checks the fast engine against the reference engine (see
+checklistdsl.engine). Each checklist in a corpus (generated from the DSL's
+syntax, including its edge cases, and fuzzed from random characters) is
+lexed and rendered by both engines, as text and as UTF-8 bytes, and the
+first divergence is reported: either the first token that differs or the
+first character of the rendered forms that differs. Errors count as results
+so both engines must fail in the same way on the same input.
+
+Random names (of forms without an id and of radio button groups) are
+replaced with placeholders before the forms are compared. Run with:
+
+    python -m checklistdsl.differential [COUNT]
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import random
+import re
+import sys
+from checklistdsl.engine import FAST, REFERENCE
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+
+
+UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-' +
+    r'[0-9a-f]{12}')
+UUID_BYTES = re.compile(UUID.pattern.encode('ascii'))
+
+"""
+Lines used to generate checklists: every token type plus the edge cases
+(empty values, roles only, odd braces, long headings and so on).
+"""
+LINES = [
+    '= Heading =', '== Sub heading ==', '======== Tiny heading ========',
+    '=Heading', '= =', '=== Unbalanced =', '= Trailing = text',
+    '// A comment', '//', '/ Not a comment',
+    '[] An item', '[]', '[] {Doctor, NURSE} Roles', '[]{a}x', '[] {a}',
+    '[] {} Empty roles', '[] {a} {b} Two role lists', '[] {a Unclosed',
+    '[] a} b', '[] {a, , b} Gaps', '[x] Not an item',
+    '() A choice', '()', '() {Surgeon} Choice', '() {a}', '(x) Not a choice',
+    '---', '-----', '--', '--- x', '-', '- - -',
+    'Some text', 'Text with <b>html</b> & "quotes" \'here\'',
+    '{roles} in text', u'Caf\u00e9 \u00c9CLAIR',
+    u'[] {\u00c9QUIPE} \u00e9t\u00e9',
+    '  indented  ', '\t[] tabbed', 'line\r', '',
+]
+
+"""
+Characters used to fuzz checklists: the DSL's syntax, whitespace, HTML
+special characters and non-ASCII letters.
+"""
+ALPHABET = u'=/[](){},- \t\r\n\n\nabcABC<>&"\'\u00e9\u00c9\u2603'
+
+
+class Divergence(object):
+    """
+    A difference between the results of the two engines.
+
+    source - the checklist's source.
+    stage - 'tokens' or 'form'.
+    index - the index of the first differing token, or the offset of the
+    first differing character of the rendered form.
+    reference - what the reference engine produced there (or the exception it
+    raised).
+    fast - what the fast engine produced there (or the exception it raised).
+    """
+
+    def __init__(self, source, stage, index, reference, fast):
+        self.source = source
+        self.stage = stage
+        self.index = index
+        self.reference = reference
+        self.fast = fast
+
+    def __str__(self):
+        return ('The engines diverge in the %s at %d:\n  reference: %r\n' +
+            '  fast:      %r\nfor the source:\n%r') % (self.stage, self.index,
+            self.reference, self.fast, self.source)
+
+
+def normalise(html):
+    """
+    Replace the random names in the rendered form with placeholders numbered
+    in the order they first appear.
+    """
+    names = {}
+    if isinstance(html, bytes):
+        regex = UUID_BYTES
+        placeholder = b'uuid-%d'
+    else:
+        regex = UUID
+        placeholder = 'uuid-%d'
+
+    def replace(match):
+        return names.setdefault(match.group(0), placeholder % (len(names) + 1))
+    return regex.sub(replace, html)
+
+
+def _call(function, *args, **kwargs):
+    """
+    Return a tuple of the result of the call and None or, if it raised an
+    exception, None and the name of the exception.
+    """
+    try:
+        return function(*args, **kwargs), None
+    except Exception as ex:
+        return None, 'raised %s' % type(ex).__name__
+
+
+def compare(source, form_id=None, csrf_token=None, **kwargs):
+    """
+    Lex and render the source with both engines and return the first
+    Divergence (or None if they agree). An engine raising an exception is
+    always a divergence, even if the other raises the same one, since neither
+    should ever fail.
+    """
+    reference, reference_error = _call(get_tokens, source, engine=REFERENCE)
+    fast, fast_error = _call(get_tokens, source, engine=FAST)
+    if reference_error or fast_error:
+        return Divergence(source, 'tokens', 0, reference_error or reference,
+            fast_error or fast)
+    if reference != fast:
+        index = 0
+        while (index < len(reference) and index < len(fast) and
+                reference[index] == fast[index]):
+            index += 1
+        return Divergence(source, 'tokens', index,
+            reference[index] if index < len(reference) else None,
+            fast[index] if index < len(fast) else None)
+    reference, reference_error = _call(get_form, reference, form_id,
+        csrf_token, engine=REFERENCE, **kwargs)
+    fast, fast_error = _call(get_form, fast, form_id, csrf_token,
+        engine=FAST, **kwargs)
+    if reference_error or fast_error:
+        return Divergence(source, 'form', 0, reference_error or reference,
+            fast_error or fast)
+    reference = normalise(reference)
+    fast = normalise(fast)
+    if reference == fast:
+        return None
+    index = 0
+    while (index < len(reference) and index < len(fast) and
+            reference[index] == fast[index]):
+        index += 1
+    start = max(index - 20, 0)
+    return Divergence(source, 'form', index, reference[start:index + 40],
+        fast[start:index + 40])
+
+
+def generate_corpus(count=200, seed=0, lines=20):
+    """
+    Return a list of count checklists of up to the given number of lines
+    made from LINES.
+    """
+    rng = random.Random(seed)
+    return [u'\n'.join(rng.choice(LINES)
+        for _ in range(rng.randint(1, lines))) for _ in range(count)]
+
+
+def fuzz_corpus(count=1000, seed=0, length=80):
+    """
+    Return a list of count checklists of up to the given length made of
+    random characters from ALPHABET.
+    """
+    rng = random.Random(seed)
+    return [u''.join(rng.choice(ALPHABET)
+        for _ in range(rng.randint(0, length))) for _ in range(count)]
+
+
+def run(sources, binary=True, **kwargs):
+    """
+    Compare the engines on each of the sources (and, if binary is True, on
+    each source encoded as UTF-8). Returns the first Divergence or None.
+    Further named arguments are passed to compare.
+    """
+    for source in sources:
+        divergence = compare(source, **kwargs)
+        if divergence is None and binary:
+            divergence = compare(source.encode('utf-8'), **kwargs)
+        if divergence is not None:
+            return divergence
+    return None
+
+
+def main(argv=None):
+    """
+    Compare the engines on generated and fuzzed corpora. Exits with a
+    non-zero status if they diverge.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 1000
+    sources = generate_corpus(count) + fuzz_corpus(count)
+    for form_id, csrf_token in ((None, None), ('My Form', 'token')):
+        divergence = run(sources, form_id=form_id, csrf_token=csrf_token)
+        if divergence is not None:
+            print(divergence)
+            sys.exit(1)
+    print('The engines agree on all %d checklists.' % len(sources))
+
+
+if __name__ == '__main__':
+    main()
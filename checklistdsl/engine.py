@@ -0,0 +1,44 @@
+"""
+Selects the engine used by get_tokens and get_form. The FAST engine is the
+optimised lexer and renderer (the dispatch table of scanners and the
+fragment cache). The REFERENCE engine (see checklistdsl.reference) is a
+straightforward implementation of the DSL's original regex based semantics
+kept to check the fast engine against (see checklistdsl.differential) and to
+fall back to if it's ever found wanting.
+
+Either pass engine=REFERENCE to get_tokens and get_form or change the default
+for the whole process with set_default(REFERENCE).
+
+(c) 2012 Nicholas H.Tollervey
+"""
+
+
+FAST = 'fast'
+REFERENCE = 'reference'
+ENGINES = (FAST, REFERENCE)
+
+
+"""
+The engine used when none is given.
+"""
+DEFAULT = FAST
+
+
+def get_engine(engine=None):
+    """
+    Return the name of the engine to use: the given engine or, if it's None,
+    the default. Raises ValueError for unknown engines.
+    """
+    if engine is None:
+        return DEFAULT
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine: %r' % (engine, ))
+    return engine
+
+
+def set_default(engine):
+    """
+    Set the engine used when none is given.
+    """
+    global DEFAULT
+    DEFAULT = get_engine(engine)
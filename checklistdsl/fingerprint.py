@@ -0,0 +1,85 @@
+"""
+Computes a stable fingerprint of a rendered checklist straight from its tokens
+(so there's no need to render the HTML) for use as an HTTP ETag.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import hashlib
+from checklistdsl.parse import make_id_safe
+from checklistdsl.version import get_version
+
+
+def _encode(value):
+    """
+    Return the value as length prefixed UTF-8 encoded bytes so that adjacent
+    fields can't run into each other. None is distinct from an empty value.
+    """
+    if value is None:
+        return b'-'
+    if not isinstance(value, bytes):
+        value = ('%s' % value).encode('utf-8')
+    return ('%d:' % len(value)).encode('ascii') + value
+
+
+def get_fingerprint(tokens, form_id=None, **kwargs):
+    """
+    Given a list of tokens and the form_id and form attributes they would be
+    rendered with by get_form will return a hex digest that changes whenever
+    the rendered form would change (ignoring the random names generated when
+    there's no form_id and for radio button groups). The version of this
+    library is part of the digest. Text and bytes tokens with the same content
+    have the same fingerprint.
+    """
+    digest = hashlib.sha1()
+    digest.update(_encode(get_version()))
+    if form_id:
+        form_id = make_id_safe(form_id)
+    digest.update(_encode(form_id))
+    for name, value in sorted(kwargs.items()):
+        digest.update(_encode(name))
+        digest.update(_encode(value))
+    for token in tokens:
+        # Headings are rendered no smaller than <h6>.
+        size = token.size
+        if size is not None and size > 6:
+            size = 6
+        digest.update(_encode(token.token))
+        digest.update(_encode(token.value))
+        digest.update(_encode(size))
+        if token.roles is None:
+            digest.update(_encode(None))
+        else:
+            digest.update(_encode(len(token.roles)))
+            for role in token.roles:
+                digest.update(_encode(role))
+    return digest.hexdigest()
+
+
+def get_etag(tokens, form_id=None, **kwargs):
+    """
+    Return a weak HTTP ETag for the form rendered from the given tokens. It's
+    weak because the rendered bytes may differ (random names and CSRF tokens)
+    even though the form itself doesn't.
+    """
+    return 'W/"%s"' % get_fingerprint(tokens, form_id, **kwargs)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Given the value of an HTTP If-None-Match header and an ETag will return
+    True if the ETag matches (using the weak comparison required by the HTTP
+    spec for If-None-Match).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
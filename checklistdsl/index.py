@@ -0,0 +1,246 @@
+"""
+An inverted index of a corpus of checklists so questions like "which
+checklists have an item for an anaesthetist that mentions allergies" can be
+answered without lexing every checklist again. Each token of a checklist is
+indexed under a number of terms, each prefixed with its field:
+
+    type:AND_ITEM - the type of the token.
+    role:anaesthetist - a role the token is assigned to.
+    heading:consent - a word in a heading.
+    text:allergy - a word in any other token.
+
+Words and roles are lower cased (token types are not). The postings for a
+term map the names of the checklists containing it to the (sorted) positions
+of the tokens in the checklist. Queries are a string of clauses that must all
+match, e.g.:
+
+    role:anaesthetist text:allergy      - both terms.
+    text:allergy|text:allergies         - either term.
+    type:AND_ITEM -role:patient         - not the second term.
+
+By default all of the clauses must match the same token. Search across the
+whole of each checklist with scope=DOCUMENT.
+
+The index is saved as JSON and can be brought up to date with a directory of
+checklists, re-indexing only the files that have changed.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import json
+import os
+import re
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import _as_text
+
+
+TOKEN = 'token'
+DOCUMENT = 'document'
+FORMAT_VERSION = 1
+WORD = re.compile(r'\w+', re.UNICODE)
+FIELDS = ('type', 'role', 'heading', 'text')
+
+
+def get_terms(token):
+    """
+    Return the set of terms the given token is indexed under.
+    """
+    terms = set(['type:' + token.token])
+    for role in token.roles or ():
+        terms.add('role:' + _as_text(role).lower())
+    field = 'heading:' if token.token == 'HEADING' else 'text:'
+    for word in WORD.findall(_as_text(token.value).lower()):
+        terms.add(field + word)
+    return terms
+
+
+def _normalise(term):
+    """
+    Lower case a term in a query (other than the name of a token type).
+    Raises ValueError if the term doesn't start with one of the FIELDS.
+    """
+    field, colon, word = term.partition(':')
+    field = field.lower()
+    if not colon or field not in FIELDS:
+        raise ValueError('Unknown field in query term %r.' % term)
+    if field != 'type':
+        word = word.lower()
+    return field + ':' + word
+
+
+class CorpusIndex(object):
+    """
+    An inverted index of a corpus of checklists.
+    """
+
+    def __init__(self):
+        # term -> {name: [position, ...]}
+        self.postings = {}
+        # name -> {'length': number of tokens, 'terms': [term, ...],
+        # 'stamp': whatever identifies the indexed version (or None)}
+        self.documents = {}
+
+    def __contains__(self, name):
+        return name in self.documents
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, name, tokens, stamp=None):
+        """
+        Index the tokens of the named checklist, replacing any earlier
+        version. The stamp is stored with it (see update_directory).
+        """
+        self.remove(name)
+        terms = {}
+        for position, token in enumerate(tokens):
+            for term in get_terms(token):
+                terms.setdefault(term, []).append(position)
+        for term, positions in terms.items():
+            self.postings.setdefault(term, {})[name] = positions
+        self.documents[name] = {
+            'length': len(tokens),
+            'terms': sorted(terms),
+            'stamp': stamp,
+        }
+
+    def remove(self, name):
+        """
+        Remove the named checklist from the index (if it's there).
+        """
+        document = self.documents.pop(name, None)
+        if document is None:
+            return
+        for term in document['terms']:
+            postings = self.postings[term]
+            del postings[name]
+            if not postings:
+                del self.postings[term]
+
+    def update_directory(self, directory, extension='.chkl'):
+        """
+        Bring the index up to date with the checklists in a directory (named
+        after their files without the extension). Only files whose
+        modification time or size have changed are lexed again and the
+        checklists of deleted files are removed. Returns a tuple of the sorted
+        lists of the names that were (re-)indexed and removed.
+        """
+        seen = set()
+        indexed = []
+        for filename in os.listdir(directory):
+            if not filename.endswith(extension):
+                continue
+            name = filename[:-len(extension)]
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen.add(name)
+            stamp = [stat.st_mtime, stat.st_size]
+            document = self.documents.get(name)
+            if document is None or document['stamp'] != stamp:
+                with open(path, 'rb') as source:
+                    self.add(name, get_tokens(source.read()), stamp)
+                indexed.append(name)
+        removed = sorted(set(self.documents) - seen)
+        for name in removed:
+            self.remove(name)
+        return sorted(indexed), removed
+
+    def _parse(self, query):
+        """
+        Return the lists of the positive and negative clauses (each a list of
+        alternative terms) in the query.
+        """
+        positive = []
+        negative = []
+        for clause in query.split():
+            clauses = positive
+            if clause.startswith('-'):
+                clauses = negative
+                clause = clause[1:]
+            clauses.append([_normalise(term) for term in clause.split('|')])
+        if not positive and not negative:
+            raise ValueError('Empty query.')
+        return positive, negative
+
+    def _get_postings(self, terms):
+        """
+        Return a dict mapping names to sets of positions for any of the terms.
+        """
+        result = {}
+        for term in terms:
+            for name, positions in self.postings.get(term, {}).items():
+                result.setdefault(name, set()).update(positions)
+        return result
+
+    def search(self, query, scope=TOKEN):
+        """
+        Return the results of the query (see the module's docstring). For a
+        TOKEN scoped query the result is a dict mapping the names of the
+        checklists to the sorted positions of the matching tokens. For a
+        DOCUMENT scoped query it's a sorted list of the names of the matching
+        checklists. Raises ValueError for an empty query or a term without a
+        known field.
+        """
+        positive, negative = self._parse(query)
+        positive = sorted([self._get_postings(terms) for terms in positive],
+            key=len)
+        negative = [self._get_postings(terms) for terms in negative]
+        if positive:
+            names = set(positive[0])
+            for postings in positive[1:]:
+                names.intersection_update(postings)
+        else:
+            names = set(self.documents)
+        if scope == DOCUMENT:
+            for postings in negative:
+                names.difference_update(postings)
+            return sorted(names)
+        result = {}
+        for name in names:
+            if positive:
+                positions = set(positive[0][name])
+                for postings in positive[1:]:
+                    positions.intersection_update(postings[name])
+            else:
+                positions = set(range(self.documents[name]['length']))
+            for postings in negative:
+                positions.difference_update(postings.get(name, ()))
+            if positions:
+                result[name] = sorted(positions)
+        return result
+
+    def save(self, path):
+        """
+        Save the index as JSON. The file is replaced in one go so readers
+        never see a partly written index.
+        """
+        temp = path + '.tmp'
+        with open(temp, 'w') as output:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'documents': self.documents,
+                'postings': self.postings,
+            }, output, separators=(',', ':'))
+        if hasattr(os, 'replace'):
+            os.replace(temp, path)
+        else:
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save. Raises ValueError if the file isn't a
+        saved index.
+        """
+        with open(path) as source:
+            data = json.load(source)
+        if not isinstance(data, dict) or data.get('version') != FORMAT_VERSION:
+            raise ValueError('%s is not a saved index.' % path)
+        index = cls()
+        index.documents = data['documents']
+        index.postings = data['postings']
+        return index
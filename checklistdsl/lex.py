@@ -4,86 +4,274 @@ Tokeniser for a checklist DSL. (I was using Ply, but it sucked and this is a
 
 (c) 2012 Nicholas H.Tollervey
 """
-import re
+from checklistdsl.registry import REGISTRY, IGNORE, split_roles
+from checklistdsl.engine import get_engine, REFERENCE
+
+try:
+    unichr
+except NameError:  # Python 3
+    unichr = chr
+
 
 class Token(object):
     """
-    Represents a token matched by the lexer.
+    Represents a token matched by the lexer. Tokens are immutable once
+    created so lists of them can be cached and shared between threads (the
+    parser never changes the tokens it is given).
     """
 
+    __slots__ = ('token', 'value', 'roles', 'size')
+
     def __init__(self, token, value, roles=None, size=None):
         """
         token - the type of token this is.
         value - the matched value.
-        roles - named roles who have authority to action the item.
+        roles - named roles who have authority to action the item (stored as
+        a tuple).
         size - the "size" of the heading. 1 = big, 6 = small.
         """
-        self.token = token
-        self.value = value
-        self.roles = roles
-        self.size = size
+        if roles is not None:
+            roles = tuple(roles)
+        object.__setattr__(self, 'token', token)
+        object.__setattr__(self, 'value', value)
+        object.__setattr__(self, 'roles', roles)
+        object.__setattr__(self, 'size', size)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Token instances are immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Token instances are immutable.')
+
+    def __reduce__(self):
+        # Needed since the default pickle / copy protocol for __slots__ sets
+        # attributes after instantiation.
+        return (Token, (self.token, self.value, self.roles, self.size))
+
+    def __eq__(self, other):
+        if not isinstance(other, Token):
+            return NotImplemented
+        return ((self.token, self.value, self.roles, self.size) ==
+            (other.token, other.value, other.roles, other.size))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.token, self.value, self.roles, self.size))
 
     def __repr__(self):
         return '%s: "%s"' % (self.token, self.value)
 
 """
 A dictionary that contains the regex used to match tokens and the associated
-token types.
+token types. This is the definitive description of the DSL's grammar but,
+rather than trying each regex against each line in turn, get_tokens uses the
+hand written scanners below (registered with checklistdsl.registry), which
+look at a line's first character to pick the only token type it could be and
+then scan it once. This guarantees that lexing takes time linear in the size
+of the input however hostile it is.
 """
 MATCHER = {
     # == Heading == (becomes an h* element where * is number of equal signs)
-    '(?P<depth_start>=+)(?P<value>[^=]+)(?P<depth_end>=+)': 'HEADING',
+    r'(?P<depth_start>=+)(?P<value>[^=]+)(?P<depth_end>=+)': 'HEADING',
     # // This is a comment (ignored)
-    '\/\/(?P<value>.*)': 'COMMENT',
+    r'\/\/(?P<value>.*)': 'COMMENT',
     # [] item 1 (becomes a check box)
-    '\[\] *(?P<roles>{.*}|) *(?P<value>.*)': 'AND_ITEM',
+    r'\[\] *(?P<roles>{.*}|) *(?P<value>.*)': 'AND_ITEM',
     # () item 1 (becomes a radio button)
-    '\(\) *(?P<roles>{.*}|) *(?P<value>.*)': 'OR_ITEM',
+    r'\(\) *(?P<roles>{.*}|) *(?P<value>.*)': 'OR_ITEM',
     # --- (becomes an <hr/>)
-    '^-{3,}$': 'BREAK',
+    r'^-{3,}$': 'BREAK',
     # Some text (becomes a <p>)
-    '(?P<value>[^=\/\[\(].*)': 'TEXT'
+    r'(?P<value>[^=\/\[\(].*)': 'TEXT'
 }
 
-def get_tokens(data):
+
+def _scan_heading(line, literals):
+    """
+    == Heading == (the text must be followed by at least one equals sign,
+    anything after that is ignored).
+    """
+    equals = literals['=']
+    size = len(line) - len(line.lstrip(equals))
+    end = line.find(equals, size)
+    if end <= size:
+        return None
+    value = literals['strip'](line[size:end])
+    if value:
+        return Token('HEADING', value, size=size)
+    return Token('HEADING', line)
+
+
+def _scan_comment(line, literals):
+    """
+    // A comment (ignored).
+    """
+    if line[1:2] == literals['/']:
+        return IGNORE
+    return None
+
+
+def _scan_item(line, literals, token_type, closing):
+    """
+    [] {roles} An item or () {roles} An item. Roles are everything from an
+    opening brace directly after the spaces following the item marker to the
+    last closing brace on the line.
+    """
+    if line[1:2] != closing:
+        return None
+    empty = literals['empty']
+    strip = literals['strip']
+    rest = line[2:].lstrip(literals[' '])
+    roles = None
+    if rest[:1] == literals['{']:
+        end = rest.rfind(literals['}'])
+        if end != -1:
+            roles = strip(rest[1:end].replace(literals['{'], empty).replace(
+                literals['}'], empty))
+            rest = rest[end + 1:]
+    value = strip(rest)
+    if not value:
+        return Token(token_type, line)
+    if roles:
+        roles = split_roles(roles, literals[','])
+    else:
+        roles = None
+    return Token(token_type, value, roles=roles)
+
+
+def _scan_and_item(line, literals):
+    return _scan_item(line, literals, 'AND_ITEM', literals[']'])
+
+
+def _scan_or_item(line, literals):
+    return _scan_item(line, literals, 'OR_ITEM', literals[')'])
+
+
+def _scan_break(line, literals):
+    """
+    --- (three or more minus signs on their own).
+    """
+    if len(line) >= 3 and not line.strip(literals['-']):
+        return Token('BREAK', line)
+    return None
+
+
+def _scan_text(line, literals):
+    """
+    Any line not starting with one of the built-in token types' characters.
+    """
+    if line[:1] in literals['not_text']:
+        return None
+    return Token('TEXT', line)
+
+
+"""
+The whitespace characters removed by text's strip method (there are none
+above U+3000), and their UTF-8 encodings (other than those bytes.strip
+already removes) for stripping bytes in the same way.
+"""
+_SPACES = [c for c in (unichr(i) for i in range(0x3001)) if c.isspace()]
+_BYTE_SPACES = [c.encode('utf-8') for c in _SPACES
+    if not c.encode('utf-8').isspace()]
+# The first and last bytes of those encodings (a line needs stripping again
+# only if it starts or ends with one of them).
+_BYTE_SPACE_STARTS = b''.join(set(c[:1] for c in _BYTE_SPACES))
+_BYTE_SPACE_ENDS = b''.join(set(c[-1:] for c in _BYTE_SPACES))
+
+
+def _strip_bytes(value):
+    """
+    Strip (UTF-8 encoded) bytes in the same way as text's strip method, so
+    lines and values lexed from bytes are the encoded versions of those lexed
+    from text.
+    """
+    value = value.strip()
+    while value and (value[:1] in _BYTE_SPACE_STARTS or
+            value[-1:] in _BYTE_SPACE_ENDS):
+        stripped = value
+        for space in _BYTE_SPACES:
+            if stripped.startswith(space):
+                stripped = stripped[len(space):]
+            if stripped.endswith(space):
+                stripped = stripped[:-len(space)]
+        stripped = stripped.strip()
+        if stripped == value:
+            break
+        value = stripped
+    return value
+
+
+def _get_literals(encode, strip):
+    """
+    Return a dict of the literals (as text or bytes) used when lexing, and
+    the function used to strip whitespace from them.
+    """
+    literals = dict((char, encode(char)) for char in '\n=/[](){},- ')
+    literals['empty'] = encode('')
+    literals['not_text'] = frozenset(encode(char) for char in '=/[(')
+    literals['strip'] = strip
+    return literals
+
+
+"""
+The literals used to lex text (unicode) and bytes input. UTF-8 encoded bytes
+can be lexed directly since all the DSL's syntax is ASCII.
+"""
+_TEXT = _get_literals(lambda char: char, lambda value: value.strip())
+_BYTES = _get_literals(lambda char: char.encode('ascii'), _strip_bytes)
+
+
+"""
+Register the built-in token types. The registry picks the scanners to try
+from the first character of each line.
+"""
+REGISTRY.register('HEADING', lead='=', scanner=_scan_heading)
+REGISTRY.register('COMMENT', lead='/', scanner=_scan_comment)
+REGISTRY.register('AND_ITEM', lead='[', scanner=_scan_and_item, named=True)
+REGISTRY.register('OR_ITEM', lead='(', scanner=_scan_or_item, named=True,
+    grouped=True)
+REGISTRY.register('BREAK', lead='-', scanner=_scan_break)
+# Text is tried for any line after everything else.
+REGISTRY.register('TEXT', scanner=_scan_text, precedence=-100)
+
+
+def get_tokens(data, engine=None):
     """
     Given some raw data will return a list of matched tokens. An example of the
     simplest possible lexer.
+
+    If the data is bytes (assumed to be UTF-8) then it is lexed without being
+    decoded and the values and roles of the resulting tokens are also bytes
+    (the UTF-8 encoded values and roles of the same data lexed as text).
+
+    The engine (see checklistdsl.engine) defaults to the process wide default.
     """
+    if get_engine(engine) == REFERENCE:
+        # Imported here since the reference engine imports this module.
+        from checklistdsl import reference
+        return reference.get_tokens(data)
+    if isinstance(data, bytes):
+        literals = _BYTES
+        table, fallbacks = REGISTRY.get_dispatch(True)
+    else:
+        literals = _TEXT
+        table, fallbacks = REGISTRY.get_dispatch(False)
+    strip = literals['strip']
     result = []
-    # Split on newline and throw away empty (un-needed) lines
-    split_by_lines = [line.strip() for line in data.split('\n')
-        if line.strip()]
-    for line in split_by_lines:
-        for regex in MATCHER.keys():
-            match = re.match(regex, line)
-            if match:
-                # Grab the named groups.
-                val = match.groupdict().get('value', '').strip()
-                roles = match.groupdict().get('roles', '').replace(
-                    '{', '').replace('}', '').strip()
-                depth_start = match.groupdict().get('depth_start', '')
-
-                # Post process roles.
-                if roles:
-                    roles = [role.lower().strip() for role in roles.split(',')]
-                else:
-                    roles = None
-
-                # Post process depth_start to give the size of the heading.
-                if depth_start:
-                    size = len(depth_start)
-                else:
-                    size = None
-
-                # Instantiate the token depending on the match for the val
-                # named group.
-                if val:
-                    token = Token(MATCHER[regex], val, roles=roles, size=size)
-                else:
-                    token = Token(MATCHER[regex], match.string)
-                # Ignore comments
-                if token.token != 'COMMENT':
-                    result.append(token)
-                break
+    for line in data.split(literals['\n']):
+        # Throw away empty (un-needed) lines.
+        line = strip(line)
+        if line:
+            for scanner in table.get(line[:1], fallbacks):
+                token = scanner(line, literals)
+                if token is not None:
+                    # Comments match but are ignored.
+                    if token is not IGNORE:
+                        result.append(token)
+                    break
     return result
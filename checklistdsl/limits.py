@@ -0,0 +1,216 @@
+"""
+Lexes and renders checklists from untrusted sources within configurable
+limits. Unlike get_tokens and get_form, which accept input of any size, the
+limits are checked as the source is read and the form is rendered so an
+oversized or hostile checklist is rejected (with LimitExceeded) as soon as it
+goes over a limit rather than after everything has been built in memory.
+Each render also returns what it cost so callers can budget and rate limit
+(e.g. per tenant):
+
+    from checklistdsl.limits import Limits, LimitExceeded, render_untrusted
+
+    try:
+        html, cost = render_untrusted(upload, Limits(max_lines=500))
+    except LimitExceeded as ex:
+        ...
+
+(c) 2012 Nicholas H.Tollervey
+"""
+from checklistdsl.registry import REGISTRY, IGNORE
+from checklistdsl import lex, parse
+from checklistdsl.parse import (_get_form_id, _iter_tags, _get_form_tags,
+    _fill, _as_type)
+
+
+class LimitExceeded(ValueError):
+    """
+    Raised when a checklist goes over one of its limits.
+
+    name - the name of the limit (e.g. 'max_lines').
+    limit - the limit's value.
+    """
+
+    def __init__(self, name, limit, description):
+        super(LimitExceeded, self).__init__('%s (the limit is %d).' % (
+            description, limit))
+        self.name = name
+        self.limit = limit
+
+
+class Limits(object):
+    """
+    The limits on a checklist. Each is a maximum, or None for no limit.
+
+    max_bytes - the size of the source in bytes.
+    max_lines - the number of lines in the source.
+    max_line_length - the length of any line in bytes.
+    max_tokens - the number of tokens.
+    max_roles - the number of roles of any token.
+    max_output - the size of the rendered form in bytes.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024, max_lines=10000,
+            max_line_length=4096, max_tokens=5000, max_roles=20,
+            max_output=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.max_line_length = max_line_length
+        self.max_tokens = max_tokens
+        self.max_roles = max_roles
+        self.max_output = max_output
+
+
+class Cost(object):
+    """
+    What lexing and rendering a checklist cost.
+
+    bytes_in - the size of the source in bytes.
+    lines - the number of lines read.
+    tokens - the number of tokens lexed.
+    bytes_out - the size of the rendered form in bytes.
+    """
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.lines = 0
+        self.tokens = 0
+        self.bytes_out = 0
+
+    def as_dict(self):
+        return {
+            'bytes_in': self.bytes_in,
+            'lines': self.lines,
+            'tokens': self.tokens,
+            'bytes_out': self.bytes_out,
+        }
+
+    def __repr__(self):
+        return ('<Cost bytes_in=%(bytes_in)d lines=%(lines)d ' +
+            'tokens=%(tokens)d bytes_out=%(bytes_out)d>') % self.as_dict()
+
+
+def _encode(source):
+    """
+    Return the source as UTF-8 encoded bytes.
+    """
+    if isinstance(source, bytes):
+        return source
+    return source.encode('utf-8')
+
+
+def get_tokens_limited(data, limits, cost=None):
+    """
+    Like get_tokens but raises LimitExceeded as soon as the data goes over one
+    of the limits. Text is encoded as UTF-8 first, so the values of the
+    tokens are always bytes. If a Cost is given it's updated with the size of
+    the data and the number of lines and tokens.
+    """
+    if cost is None:
+        cost = Cost()
+    if (limits.max_bytes is not None and not isinstance(data, bytes) and
+            len(data) > limits.max_bytes):
+        # Every character is at least one byte, so don't bother encoding it.
+        raise LimitExceeded('max_bytes', limits.max_bytes,
+            'The source is too large')
+    data = _encode(data)
+    cost.bytes_in = len(data)
+    if limits.max_bytes is not None and len(data) > limits.max_bytes:
+        raise LimitExceeded('max_bytes', limits.max_bytes,
+            'The source is too large')
+    literals = lex._BYTES
+    strip = literals['strip']
+    table, fallbacks = REGISTRY.get_dispatch(True)
+    newline = literals['\n']
+    max_lines = limits.max_lines
+    max_line_length = limits.max_line_length
+    max_tokens = limits.max_tokens
+    max_roles = limits.max_roles
+    result = []
+    start = 0
+    size = len(data)
+    # Lines are found one at a time (rather than splitting the whole source)
+    # so no more than one line is copied before its length is checked. The
+    # empty piece after a trailing newline isn't counted as a line.
+    while start < size:
+        end = data.find(newline, start)
+        if end == -1:
+            end = size
+        cost.lines += 1
+        if max_lines is not None and cost.lines > max_lines:
+            raise LimitExceeded('max_lines', max_lines,
+                'Too many lines')
+        if max_line_length is not None and end - start > max_line_length:
+            raise LimitExceeded('max_line_length', max_line_length,
+                'Line %d is too long' % cost.lines)
+        line = strip(data[start:end])
+        start = end + 1
+        if not line:
+            continue
+        for scanner in table.get(line[:1], fallbacks):
+            token = scanner(line, literals)
+            if token is not None:
+                if token is not IGNORE:
+                    if (max_roles is not None and token.roles and
+                            len(token.roles) > max_roles):
+                        raise LimitExceeded('max_roles', max_roles,
+                            'Line %d has too many roles' % cost.lines)
+                    result.append(token)
+                    cost.tokens += 1
+                    if max_tokens is not None and cost.tokens > max_tokens:
+                        raise LimitExceeded('max_tokens', max_tokens,
+                            'Too many tokens')
+                break
+    return result
+
+
+def get_form_limited(tokens, limits, cost=None, form_id=None,
+        csrf_token=None, **kwargs):
+    """
+    Like get_form (for tokens lexed from bytes) but raises LimitExceeded as
+    soon as the rendered form goes over limits.max_output. If a Cost is given
+    its bytes_out is set to the size of the form.
+    """
+    if cost is None:
+        cost = Cost()
+    if not tokens:
+        cost.bytes_out = 0
+        return b''
+    literals = parse._BYTES
+    form_id = _get_form_id(form_id, literals)
+    head, tail = _get_form_tags(form_id, kwargs, literals)
+    max_output = limits.max_output
+    html_tags = [head]
+    size = len(head) + len(tail)
+    if csrf_token:
+        html_tags.append(_fill(literals['CSRF'], {
+            'token': _as_type(csrf_token, literals)}))
+        size += len(html_tags[-1])
+    for piece in _iter_tags(tokens, form_id, literals):
+        size += len(piece)
+        if max_output is not None and size > max_output:
+            raise LimitExceeded('max_output', max_output,
+                'The rendered form is too large')
+        html_tags.append(piece)
+    if max_output is not None and size > max_output:
+        raise LimitExceeded('max_output', max_output,
+            'The rendered form is too large')
+    html_tags.append(tail)
+    cost.bytes_out = size
+    return b''.join(html_tags)
+
+
+def render_untrusted(source, limits=None, form_id=None, csrf_token=None,
+        **kwargs):
+    """
+    Lex and render a checklist from an untrusted source (text or bytes)
+    within the given Limits (the defaults if None). Returns a tuple of the
+    rendered form (as UTF-8 encoded bytes) and its Cost. Raises LimitExceeded
+    if the source or form goes over a limit.
+    """
+    if limits is None:
+        limits = Limits()
+    cost = Cost()
+    tokens = get_tokens_limited(source, limits, cost)
+    html = get_form_limited(tokens, limits, cost, form_id, csrf_token,
+        **kwargs)
+    return html, cost
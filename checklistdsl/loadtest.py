@@ -0,0 +1,368 @@
+"""
+A load test for lexing and rendering checklists. A local WSGI server renders
+a mix of generated checklists (of different sizes) from scratch with
+get_tokens and get_form on every request while a number of concurrent
+clients request them as fast as they can. Reports the p50/p95/p99 latency,
+the throughput and how the server's memory use (RSS) changes over time, and
+saves the results as JSON for comparison between versions. Run with:
+
+    python -m checklistdsl.loadtest --clients 8 --requests 2000 \\
+        --mix small:5,medium:3,large:1 --output results.json
+
+The clients run in the same process as the server so the numbers are only
+comparable between runs on the same machine.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.version import get_version
+try:
+    from socketserver import ThreadingMixIn
+    from urllib.request import urlopen
+except ImportError:  # Python 2
+    from SocketServer import ThreadingMixIn
+    from urllib2 import urlopen
+
+
+"""
+The number of lines in the checklists of each size.
+"""
+SIZES = {
+    'small': 20,
+    'medium': 200,
+    'large': 2000,
+}
+
+
+"""
+The default mix of checklist sizes (name, weight).
+"""
+DEFAULT_MIX = [('small', 5), ('medium', 3), ('large', 1)]
+
+
+def make_checklist(lines, seed=0):
+    """
+    Return a checklist (as text) with the given number of lines made of a
+    realistic mix of token types.
+    """
+    rng = random.Random(seed)
+    roles = ['doctor', 'nurse', 'patient', 'surgeon']
+    result = []
+    for i in range(lines):
+        kind = rng.random()
+        if kind < 0.05:
+            result.append('== Section %d ==' % i)
+        elif kind < 0.1:
+            result.append('// Comment %d' % i)
+        elif kind < 0.45:
+            role = ''
+            if rng.random() < 0.3:
+                role = '{%s} ' % rng.choice(roles)
+            result.append('[] %sCheck thing number %d & confirm' % (role, i))
+        elif kind < 0.7:
+            result.append('() Choose option %d' % i)
+        elif kind < 0.75:
+            result.append('---')
+        else:
+            result.append('Some explanatory text for line %d <b>.' % i)
+    return '\n'.join(result)
+
+
+def parse_mix(mix):
+    """
+    Turn a mix given as "name:weight,name:weight" into a list of (name,
+    weight) tuples. Raises ValueError for unknown sizes or bad weights.
+    """
+    result = []
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition(':')
+        if name not in SIZES:
+            raise ValueError('Unknown checklist size: %s' % name)
+        weight = int(weight or 1)
+        if weight < 1:
+            raise ValueError('Weights must be positive: %s' % item)
+        result.append((name, weight))
+    return result
+
+
+def percentile(values, percent):
+    """
+    Return the given percentile (0-100) of the sorted values using the
+    nearest rank method, or None if there are no values.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def get_rss():
+    """
+    Return the resident set size of this process in bytes (or None if it
+    can't be found).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS (in kilobytes on Linux, bytes on OS X).
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+class RenderApp(object):
+    """
+    A stand-in WSGI application that lexes and renders the named checklist
+    from its source on every request to /name.
+    """
+
+    def __init__(self, checklists):
+        """
+        checklists - a dict mapping names to the source of checklists.
+        """
+        self.checklists = checklists
+
+    def __call__(self, environ, start_response):
+        name = environ.get('PATH_INFO', '/').lstrip('/')
+        source = self.checklists.get(name)
+        if source is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain'),
+                ('Content-Length', '9')])
+            return [b'Not Found']
+        body = get_form(get_tokens(source), form_id=name).encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/html; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+
+class _ThreadingServer(ThreadingMixIn, WSGIServer):
+    """
+    Handles each request in its own thread.
+    """
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    """
+    Doesn't log every request to stderr.
+    """
+
+    def log_message(self, *args):
+        pass
+
+
+def _summarise(latencies):
+    """
+    Return a dict of statistics (in milliseconds) for a list of latencies (in
+    seconds).
+    """
+    latencies = sorted(latencies)
+    result = {'count': len(latencies)}
+    for name, percent in (('p50', 50), ('p95', 95), ('p99', 99)):
+        value = percentile(latencies, percent)
+        result[name] = value * 1000 if value is not None else None
+    if latencies:
+        result['mean'] = sum(latencies) * 1000 / len(latencies)
+        result['max'] = latencies[-1] * 1000
+    else:
+        result['mean'] = result['max'] = None
+    return result
+
+
+def run(clients=4, requests=1000, duration=None, mix=None,
+        sample_interval=0.5, seed=0, host='127.0.0.1', port=0):
+    """
+    Run a load test and return the results as a dict.
+
+    clients - the number of concurrent clients.
+    requests - the total number of requests to make (shared between the
+    clients).
+    duration - if given, stop after this many seconds even if not all of the
+    requests have been made.
+    mix - a list of (size, weight) tuples (see parse_mix). Defaults to
+    DEFAULT_MIX.
+    sample_interval - the number of seconds between samples of the RSS.
+    seed - the seed used to generate the checklists and pick between them.
+    host, port - where to run the server (port 0 picks a free port).
+    """
+    mix = mix or DEFAULT_MIX
+    checklists = dict((name, make_checklist(SIZES[name], seed))
+        for name, weight in mix)
+    names = [name for name, weight in mix]
+    cumulative = []
+    total = 0
+    for name, weight in mix:
+        total += weight
+        cumulative.append(total)
+
+    server = make_server(host, port, RenderApp(checklists),
+        server_class=_ThreadingServer, handler_class=_QuietHandler)
+    base = 'http://%s:%d/' % (host, server.server_port)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    lock = threading.Lock()
+    remaining = [requests]
+    latencies = dict((name, []) for name in names)
+    errors = [0]
+    samples = []
+    done = threading.Event()
+    start = time.time()
+    deadline = start + duration if duration else None
+
+    def client(number):
+        rng = random.Random(seed + number)
+        while True:
+            if deadline and time.time() >= deadline:
+                return
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            name = names[bisect.bisect(cumulative, rng.random() * total)]
+            began = time.time()
+            try:
+                response = urlopen(base + name)
+                try:
+                    response.read()
+                finally:
+                    response.close()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.time() - began
+            with lock:
+                latencies[name].append(elapsed)
+
+    def sampler():
+        while True:
+            samples.append((round(time.time() - start, 3), get_rss()))
+            if done.wait(sample_interval):
+                return
+
+    sample_thread = threading.Thread(target=sampler)
+    sample_thread.start()
+    threads = [threading.Thread(target=client, args=(i, ))
+        for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    done.set()
+    sample_thread.join()
+    samples.append((round(elapsed, 3), get_rss()))
+    server.shutdown()
+    server.server_close()
+
+    everything = []
+    for values in latencies.values():
+        everything.extend(values)
+    rss = [value for _, value in samples if value is not None]
+    return {
+        'version': get_version(),
+        'python': platform.python_version(),
+        'config': {
+            'clients': clients,
+            'requests': requests,
+            'duration': duration,
+            'mix': dict(mix),
+            'sizes': dict((name, SIZES[name]) for name in names),
+            'seed': seed,
+        },
+        'elapsed': elapsed,
+        'completed': len(everything),
+        'errors': errors[0],
+        'throughput': len(everything) / elapsed if elapsed else None,
+        'latency': _summarise(everything),
+        'latency_by_size': dict((name, _summarise(values))
+            for name, values in latencies.items()),
+        'rss': {
+            'start': rss[0] if rss else None,
+            'end': rss[-1] if rss else None,
+            'peak': max(rss) if rss else None,
+            'growth': rss[-1] - rss[0] if rss else None,
+            'samples': samples,
+        },
+    }
+
+
+def _format_ms(value):
+    if value is None:
+        return '-'
+    return '%.2fms' % value
+
+
+def main(argv=None):
+    """
+    Run a load test from the command line, print a summary and optionally
+    save the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description='Load test rendering of ' +
+        'checklists.')
+    parser.add_argument('--clients', type=int, default=4,
+        help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=1000,
+        help='total number of requests')
+    parser.add_argument('--duration', type=float, default=None,
+        help='stop after this many seconds')
+    parser.add_argument('--mix', default='small:5,medium:3,large:1',
+        help='weighted mix of checklist sizes (%s)' %
+        ', '.join(sorted(SIZES)))
+    parser.add_argument('--interval', type=float, default=0.5,
+        help='seconds between RSS samples')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results as JSON here')
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as ex:
+        parser.error(str(ex))
+    results = run(clients=args.clients, requests=args.requests,
+        duration=args.duration, mix=mix, sample_interval=args.interval,
+        seed=args.seed)
+    latency = results['latency']
+    print('%d requests (%d errors) in %.2fs: %.1f requests/s' % (
+        results['completed'], results['errors'], results['elapsed'],
+        results['throughput'] or 0))
+    print('latency p50 %s p95 %s p99 %s max %s' % tuple(_format_ms(
+        latency[name]) for name in ('p50', 'p95', 'p99', 'max')))
+    for name in sorted(results['latency_by_size']):
+        stats = results['latency_by_size'][name]
+        print('  %-8s %6d requests p50 %s p99 %s' % (name, stats['count'],
+            _format_ms(stats['p50']), _format_ms(stats['p99'])))
+    rss = results['rss']
+    if rss['start'] is not None:
+        print('RSS %.1fMB -> %.1fMB (peak %.1fMB)' % (rss['start'] / 1e6,
+            rss['end'] / 1e6, rss['peak'] / 1e6))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print('Saved results to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Lexes a single very large checklist on a pool of processes. The source is
+split into chunks at line boundaries, each chunk is lexed by get_tokens in a
+separate process and the resulting tokens are joined back together in order.
+
+Since each line is lexed independently of the others and radio button groups
+(adjacent OR items) are only worked out when the tokens are rendered, the
+joined tokens are identical to those produced by lexing the whole source at
+once, even when a group of OR items spans the boundary between two chunks.
+
+Note that token types registered at runtime (see checklistdsl.registry) are
+only known to the pool's processes if they were forked after registration.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+from multiprocessing import Pool, cpu_count
+from checklistdsl.lex import get_tokens
+
+
+def split_lines(data, chunks):
+    """
+    Split the data (text or bytes) into at most the given number of chunks of
+    roughly equal size. Chunks only ever end at the end of a line.
+    """
+    newline = b'\n' if isinstance(data, bytes) else '\n'
+    size = max(len(data) // max(chunks, 1), 1)
+    result = []
+    start = 0
+    while start < len(data):
+        end = data.find(newline, start + size)
+        if end == -1:
+            result.append(data[start:])
+            break
+        result.append(data[start:end])
+        start = end + 1
+    return result
+
+
+def get_tokens_parallel(data, processes=None, chunks=None, pool=None,
+        min_size=65536):
+    """
+    Given some raw data (text or bytes) will return the same list of tokens
+    as get_tokens, lexing chunks of it in parallel.
+
+    processes - the number of processes to use (defaults to the number of
+    CPUs).
+    chunks - the number of chunks to split the data into (defaults to four
+    per process so uneven chunks balance out).
+    pool - an existing multiprocessing pool to use rather than starting (and
+    stopping) a new one.
+    min_size - data smaller than this (in characters) is lexed in this
+    process since it isn't worth the overhead.
+    """
+    if len(data) < min_size:
+        return get_tokens(data)
+    if processes is None:
+        processes = cpu_count()
+    if chunks is None:
+        chunks = processes * 4
+    parts = split_lines(data, chunks)
+    if pool is None:
+        own_pool = Pool(processes)
+    else:
+        own_pool = None
+    try:
+        results = (pool or own_pool).map(get_tokens, parts)
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+            own_pool.join()
+    tokens = []
+    for result in results:
+        tokens.extend(result)
+    return tokens
@@ -4,8 +4,16 @@ a block of HTML to display.
 
 (c) 2012 Nicholas H.Tollervey
 """
+import io
+import itertools
 import uuid
 import re
+import threading
+from collections import OrderedDict
+from checklistdsl.registry import REGISTRY
+from checklistdsl.engine import get_engine, REFERENCE
+# Importing the lexer registers the built-in token types.
+import checklistdsl.lex
 
 
 # Templates.
@@ -24,138 +32,516 @@ CHECKBOX = ('<label class="checkbox">' +
 CSRF = '<input type="hidden" name="csrfmiddlewaretoken" value="%(token)s"/>'
 
 
+"""
+The templates (and other literals) used to render text and UTF-8 encoded
+bytes. Rendering bytes tokens produces bytes without ever decoding them.
+"""
+_TEXT = {
+    'FORM': FORM,
+    'ROLES': ROLES,
+    'HEADER': HEADER,
+    'PARA': PARA,
+    'BREAK': BREAK,
+    'RADIO': RADIO,
+    'CHECKBOX': CHECKBOX,
+    'CSRF': CSRF,
+    'empty': '',
+    'space': ' ',
+    'minus': '-',
+    'separator': ', ',
+    'checked': ' checked="checked"',
+    'non_alphanumerics': re.compile(r'\W+', re.UNICODE),
+    'escapes': (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'),
+        ("'", '&#39;'), ('"', '&#34;')),
+}
+_BYTES = dict((key, value.encode('ascii')) for key, value in _TEXT.items()
+    if key not in ('non_alphanumerics', 'escapes'))
+_BYTES['escapes'] = tuple((char.encode('ascii'), entity.encode('ascii'))
+    for char, entity in _TEXT['escapes'])
+
+
+def _get_literals(raw):
+    """
+    Return the templates and literals to use for the type of the raw value.
+    """
+    if isinstance(raw, bytes):
+        return _BYTES
+    return _TEXT
+
+
+def _as_type(value, literals):
+    """
+    Ensure an argument passed in by the caller (a name, id or CSRF token) is of
+    the same type (text or bytes) as the rest of the output.
+    """
+    if literals is _BYTES and not isinstance(value, bytes):
+        return str(value).encode('utf-8')
+    return value
+
+
+def _as_text(value):
+    """
+    Return the value (e.g. a token's value or role) as text, decoding bytes
+    from UTF-8. Bytes that aren't valid UTF-8 (which the lexer accepts) are
+    replaced with U+FFFD rather than raising an error.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _typed_key(value, *rest):
+    """
+    Return a cache key for the value (and anything else the cached result
+    depends on) that includes the value's type, since Python 2 treats equal
+    ASCII text and bytes as the same key.
+    """
+    return (value.__class__, value) + rest
+
+
+def _fill(template, values):
+    """
+    Fill in the named fields of a text or bytes template. (Python 3 needs the
+    keys to be bytes for a bytes template.)
+    """
+    if not isinstance(template, str):
+        values = dict((key.encode('ascii'), value)
+            for key, value in values.items())
+    return template % values
+
+
 def make_html_safe(raw):
     """
     Given some raw input will make it HTML safe by encoding the <, >, ", ' and
-    & characters.
+    & characters. Works on both text and bytes.
     """
-    return (raw.replace('&', '&amp;')
-        .replace('<', '&lt;')
-        .replace('>', '&gt;')
-        .replace("'", '&#39;')
-        .replace('"', '&#34;'))
+    for char, entity in _get_literals(raw)['escapes']:
+        raw = raw.replace(char, entity)
+    return raw
+
+
+"""
+The ids already made safe by make_id_safe (since the same form ids and titles
+turn up again and again), keyed by the raw id and its type. Emptied when it
+holds _SAFE_IDS_SIZE ids.
+"""
+_SAFE_IDS = {}
+_SAFE_IDS_SIZE = 10000
 
 
 def make_id_safe(raw):
     """
     Given a potential form id will make it safe to use as an id or name
-    attribute of an HTML tag.
+    attribute of an HTML tag. Works on both text and bytes (which are decoded
+    from UTF-8 so they give the same id as text, invalid bytes are dropped).
+    """
+    key = _typed_key(raw)
+    safe = _SAFE_IDS.get(key)
+    if safe is None:
+        text = raw
+        if isinstance(raw, bytes):
+            text = raw.decode('utf-8', 'replace')
+        no_alphanumerics = _TEXT['non_alphanumerics'].sub(u' ', text).strip(
+            ).lower()
+        safe = no_alphanumerics.replace(u' ', u'-')
+        if isinstance(raw, bytes):
+            safe = safe.encode('utf-8')
+        if len(_SAFE_IDS) >= _SAFE_IDS_SIZE:
+            _SAFE_IDS.clear()
+        _SAFE_IDS[key] = safe
+    return safe
+
+
+class SlugAllocator(object):
+    """
+    Allocates ids, made from titles with make_id_safe, that are unique within
+    a page (use a new allocator for each page). Titles that give the same id
+    (e.g. "Sign-in" and "Sign in") get a numbered suffix in the order they're
+    allocated: "sign-in", "sign-in-2", "sign-in-3" and so on. Titles with
+    nothing safe in them are treated as "form".
     """
-    no_alphanumerics = re.sub(r'\W+', ' ', raw).strip().lower()
-    return no_alphanumerics.replace(' ', '-')
+
+    def __init__(self):
+        self._used = set()
+        # The next suffix to try for each id.
+        self._next = {}
+
+    def allocate(self, title):
+        """
+        Return a unique id (of the same type, text or bytes, as the title) for
+        the title.
+        """
+        slug = make_id_safe(title)
+        literals = _get_literals(slug)
+        if not slug:
+            slug = _as_type('form', literals)
+        if slug not in self._used:
+            self._used.add(slug)
+            return slug
+        number = self._next.get(slug, 2)
+        candidate = slug + _as_type('-%d' % number, literals)
+        while candidate in self._used:
+            number += 1
+            candidate = slug + _as_type('-%d' % number, literals)
+        self._next[slug] = number + 1
+        self._used.add(candidate)
+        return candidate
+
+    def allocate_all(self, titles):
+        """
+        Return a list of unique ids for the titles (in order).
+        """
+        allocate = self.allocate
+        return [allocate(title) for title in titles]
+
+    def __contains__(self, slug):
+        return slug in self._used
+
+
+def _get_safe_roles(token, literals):
+    """
+    Return the HTML for the token's roles (if it has any).
+    """
+    if token.roles:
+        return _fill(literals['ROLES'], {
+            'roles': make_html_safe(literals['separator'].join(token.roles))})
+    return literals['empty']
+
+
+def _render_heading(token, name):
+    literals = _get_literals(token.value)
+    if token.size is None:
+        # A heading without any text (e.g. "= =") is shown as it was typed.
+        return _fill(literals['PARA'], {
+            'content': make_html_safe(token.value)
+        })
+    # Clamp to the smallest HTML heading without changing the token.
+    size = token.size
+    if size > 6:
+        size = 6
+    return _fill(literals['HEADER'], {
+        'size': size,
+        'title': make_html_safe(token.value)
+    })
+
+
+def _render_and_item(token, name):
+    literals = _get_literals(token.value)
+    safe_value = make_html_safe(token.value)
+    return _fill(literals['CHECKBOX'], {
+        'name': _as_type(name, literals),
+        'value': safe_value,
+        'text': safe_value,
+        'roles': _get_safe_roles(token, literals)
+    })
+
+
+def _render_or_item(token, name):
+    literals = _get_literals(token.value)
+    safe_value = make_html_safe(token.value)
+    return _fill(literals['RADIO'], {
+        'name': _as_type(name, literals),
+        'value': safe_value,
+        'text': safe_value,
+        'roles': _get_safe_roles(token, literals)
+    })
+
+
+def _render_break(token, name):
+    return _get_literals(token.value)['BREAK']
+
+
+def _render_text(token, name):
+    literals = _get_literals(token.value)
+    return _fill(literals['PARA'], {
+        'content': make_html_safe(token.value)
+    })
+
+
+"""
+Register the renderers of the built-in token types.
+"""
+REGISTRY.set_renderer('HEADING', _render_heading)
+REGISTRY.set_renderer('AND_ITEM', _render_and_item)
+REGISTRY.set_renderer('OR_ITEM', _render_or_item)
+REGISTRY.set_renderer('BREAK', _render_break)
+REGISTRY.set_renderer('TEXT', _render_text)
 
 
 def get_tag(token, name=None):
     """
     Given a token will return a string containing an HTML representation of it.
     If the name argument is given, this will be used as the 'name' attribute
-    of an input HTML tag.
+    of an input HTML tag. Tokens lexed from bytes are rendered to bytes.
+
+    The renderer for the token's type is looked up in the registry (see
+    checklistdsl.registry). Tokens of an unknown type give an empty string.
     """
-    # The default result to return.
-    tag = ''
+    renderer = REGISTRY.renderers.get(token.token)
+    if renderer is None:
+        return _get_literals(token.value)['empty']
+    return renderer(token, name)
 
-    # Some sanitization operations on token attributes that derive from user
-    # input.
-    safe_value = make_html_safe(token.value)
-    safe_roles = ''
-    if token.roles:
-        safe_roles = ROLES % {'roles': make_html_safe(', '.join(token.roles))}
-
-    # Parse the correct template depending on the type of token.
-    if token.token == 'HEADING':
-        if token.size > 6:
-            token.size = 6
-        tag = HEADER % {
-            'size': token.size,
-            'title': safe_value
-        }
-    elif token.token == 'AND_ITEM':
-        tag = CHECKBOX % {
-            'name': name,
-            'value': safe_value,
-            'text': safe_value,
-            'roles': safe_roles
-        }
-    elif token.token == 'OR_ITEM':
-        tag = RADIO % {
-            'name': name,
-            'value': safe_value,
-            'text': safe_value,
-            'roles': safe_roles
-        }
-    elif token.token == 'BREAK':
-        tag = BREAK
-    elif token.token == 'TEXT':
-        tag = PARA % {
-            'content': safe_value
-        }
-    else:
-        pass
-    return tag
-
-
-def get_form(tokens, form_id=None, csrf_token=None, **kwargs):
+
+class FragmentCache(object):
     """
-    Given a list of tokens produced by the lexer, will return a string
-    containing an HTML representation of the checklist. If provided,
-    the form_id will be used as the id attribute of the form tag and also as
-    the name attribute for radio buttton tags. If provided, the csrf_token
-    will be used in a hidden input element to help avoid cross site request
-    forgery. Any further named arguments passed via **kwargs will become an
-    attribute of the form tag.
+    A bounded, thread safe cache of the HTML fragments rendered for tokens
+    (when full, the oldest fragments are evicted first). Since the same lines
+    (for example "[] {nurse} Confirm patient identity") turn up in many
+    checklists, the cache is shared between documents. A fragment for a
+    token with a name attribute is stored split around the name so a cached
+    fragment is used with any name. The cache empties itself if the
+    registry's renderers change.
     """
-    if not tokens:
-        return ''
 
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._version = REGISTRY.version
+        self._lock = threading.Lock()
+
+    def get_parts(self, token):
+        """
+        Return a (before, after) tuple of the token's HTML either side of its
+        name attribute. The after part is None if the token's type doesn't
+        have a name attribute.
+        """
+        if self._version != REGISTRY.version:
+            self.clear()
+        key = _typed_key(token.value, token.token, token.roles, token.size)
+        # Hits don't take the lock (or reorder the cache) so lookups are as
+        # cheap as possible.
+        parts = self._data.get(key)
+        if parts is not None:
+            self.hits += 1
+            return parts
+        if token.token in REGISTRY.named:
+            # Templates put the name attribute before the value so the first
+            # placeholder is always the name.
+            placeholder = _as_type('\x00', _get_literals(token.value))
+            before, _, after = get_tag(token, placeholder).partition(
+                placeholder)
+            parts = (before, after)
+        else:
+            parts = (get_tag(token), None)
+        with self._lock:
+            self.misses += 1
+            if self.maxsize > 0:
+                self._data[key] = parts
+                # Evict the oldest fragments.
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return parts
+
+    def get_tag(self, token, name=None):
+        """
+        Return the same result as get_tag(token, name), using the cache.
+        """
+        before, after = self.get_parts(token)
+        if after is None:
+            return before
+        if name is None:
+            # The templates render a missing name as "None".
+            name = 'None'
+        return before + _as_type(name, _get_literals(before)) + after
+
+    def clear(self):
+        """
+        Empty the cache and reset the statistics.
+        """
+        with self._lock:
+            self._data.clear()
+            self._version = REGISTRY.version
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return a dict of statistics to help size the cache: its size,
+        maxsize, hits, misses, evictions and hit_rate (between 0 and 1). Hits
+        are counted without a lock so may be slightly undercounted when many
+        threads share the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+"""
+The fragment cache shared by all calls to get_form.
+"""
+FRAGMENTS = FragmentCache()
+
+
+def _get_form_id(form_id, literals):
+    """
+    Return the safe form id to use for the given form_id (of the type of the
+    literals).
+    """
     if form_id:
         # Ensure the form's id can be used in an id or name attribute in HTML.
-        form_id = make_id_safe(form_id)
-    else:
-        # if no form_id is given then use something random and unique.
-        form_id = str(uuid.uuid4())
+        return make_id_safe(_as_type(form_id, literals))
+    # if no form_id is given then use something random and unique.
+    return _as_type(str(uuid.uuid4()), literals)
+
 
-    html_tags = []
+def _get_form_parts(tokens, form_id, csrf_token, attributes):
+    """
+    Does the work for get_form and write_form. Returns the opening form tag,
+    an iterator over the pieces of HTML for the form's content and the
+    closing tag.
+    """
+    literals = _get_literals(tokens[0].value)
+    form_id = _get_form_id(form_id, literals)
+
+    html_tags = _iter_tags(tokens, form_id, literals)
 
     # Handle the CSRF token if it exists.
     if csrf_token:
-        html_tags.append(CSRF % { 'token': csrf_token})
+        html_tags = itertools.chain([_fill(literals['CSRF'], {
+            'token': _as_type(csrf_token, literals)})], html_tags)
+
+    head, tail = _get_form_tags(form_id, attributes, literals)
+    return head, html_tags, tail
 
-    # Used to track the name of the current radio button group.
-    radio_name = ''
+
+def _iter_tags(tokens, form_id, literals):
+    """
+    Yield the HTML for the tokens (other than those that render to nothing) a
+    piece at a time. form_id should already be safe. The cached fragments
+    either side of a name attribute are yielded as they are (with the name
+    between them) rather than joined into a new string for every tag, so
+    joining the pieces is the only copy of the output made.
+    """
+    # Used to track the name and token type of the current radio button
+    # group (or other group of adjacent tokens of a grouped type).
+    radio_name = literals['empty']
+    group_type = None
+    grouped = REGISTRY.grouped
 
     for token in tokens:
         # Radio button group state check
-        if token.token == 'OR_ITEM':
-            if not radio_name:
-                # Currently not in a radio button group so create a new name.
-                radio_name = str(uuid.uuid4())
-            tag = get_tag(token, radio_name)
+        if token.token in grouped:
+            if token.token != group_type:
+                # Currently not in this group so create a new name.
+                group_type = token.token
+                radio_name = _as_type(str(uuid.uuid4()), literals)
+            name = radio_name
         else:
             # Not in a radio button group so reset it and use form_id for name
             # attributes.
-            radio_name = ''
-            tag = get_tag(token, form_id)
-        if tag:
-            html_tags.append(tag)
+            group_type = None
+            name = form_id
+        before, after = FRAGMENTS.get_parts(token)
+        if after is None:
+            if before:
+                yield before
+        else:
+            yield before
+            yield name
+            yield after
+
 
+def _get_form_tags(form_id, attributes, literals):
+    """
+    Return the opening and closing form tags for the given (safe) form_id and
+    form attributes.
+    """
     # Default form attributes.
-    attributes = {
+    attributes = dict({
         'action': '.',
         'method': 'POST'
-    }
-    # Overridden with the named arguments into this function.
-    if kwargs:
-        attributes.update(kwargs)
+    }, **attributes)
 
     attr_list = []
-    for name, value in attributes.iteritems():
+    for name, value in attributes.items():
         attr_list.append(
             '%(name)s="%(value)s"' % {'name': name, 'value': value})
 
-    attrs = ' '.join(attr_list)
+    attrs = _as_type(' '.join(attr_list), literals)
 
-    return FORM % {
-        'content': ''.join(html_tags),
+    # Split the form template around its content.
+    head, content, tail = literals['FORM'].partition(
+        _as_type('%(content)s', literals))
+    head = _fill(head, {
         'id': form_id,
         'attrs': attrs
-    }
+    })
+    return head, tail
+
+
+def get_form(tokens, form_id=None, csrf_token=None, engine=None, **kwargs):
+    """
+    Given a list of tokens produced by the lexer, will return a string
+    containing an HTML representation of the checklist. If provided,
+    the form_id will be used as the id attribute of the form tag and also as
+    the name attribute for radio buttton tags. If provided, the csrf_token
+    will be used in a hidden input element to help avoid cross site request
+    forgery. Any further named arguments passed via **kwargs will become an
+    attribute of the form tag.
+
+    If the tokens were lexed from bytes the result is UTF-8 encoded bytes.
+
+    The fragments rendered for each token are cached in FRAGMENTS.
+
+    This function is re-entrant: it never modifies the tokens it is given and
+    only keeps state in the (thread safe) fragment cache, so the same (cached)
+    list of tokens may be rendered by many threads at once.
+
+    The engine (see checklistdsl.engine) defaults to the process wide default.
+    """
+    if get_engine(engine) == REFERENCE:
+        # Imported here since the reference engine imports this module.
+        from checklistdsl import reference
+        return reference.get_form(tokens, form_id, csrf_token, **kwargs)
+    if not tokens:
+        return ''
+
+    if isinstance(tokens[0].value, bytes):
+        # bytes.join needs extra memory for every piece joined (several times
+        # the size of the output for a typical form) whereas a BytesIO grows
+        # in place and hands over its buffer without copying it.
+        out = io.BytesIO()
+        write_form(out, tokens, form_id, csrf_token, **kwargs)
+        return out.getvalue()
+    head, html_tags, tail = _get_form_parts(tokens, form_id, csrf_token,
+        kwargs)
+    html = [head]
+    html.extend(html_tags)
+    html.append(tail)
+    return _get_literals(head)['empty'].join(html)
+
+
+def write_form(out, tokens, form_id=None, csrf_token=None, **kwargs):
+    """
+    Like get_form but writes the HTML representation of the checklist into
+    the given output rather than returning it. The output is either a
+    bytearray (that may be re-used between renders) or a file-like object
+    with a write method. The tokens should have been lexed from bytes. Returns
+    the number of bytes written.
+    """
+    if not tokens:
+        return 0
+    write = getattr(out, 'write', None) or out.extend
+    head, html_tags, tail = _get_form_parts(tokens, form_id, csrf_token,
+        kwargs)
+    write(head)
+    size = len(head) + len(tail)
+    for tag in html_tags:
+        write(tag)
+        size += len(tag)
+    write(tail)
+    return size
@@ -0,0 +1,166 @@
+"""
+Pre-compiles the tokens of a checklist into a form that can be rendered again
+and again with a different form id and CSRF token without touching the tokens
+or templates. Rendering a compiled form is a handful of list assignments and a
+join.
+
+A compiled form can also be rendered with the state of a saved submission
+(see checklistdsl.store) so the inputs that were checked are rendered checked
+(the checked attribute is put straight into an empty slot at the end of each
+input tag).
+
+(c) 2012 Nicholas H.Tollervey
+"""
+from checklistdsl.registry import REGISTRY
+from checklistdsl.parse import (FRAGMENTS, _get_literals, _as_type, _as_text,
+    _fill, _get_form_id, _get_form_tags)
+
+
+# The kinds of slot in a compiled form that are filled in when it's rendered.
+FORM_ID = 'FORM_ID'
+CSRF_TOKEN = 'CSRF_TOKEN'
+RADIO_NAME = 'RADIO_NAME'
+
+
+def get_radio_name(form_id, group):
+    """
+    Return the name attribute of the radio buttons in the given group (the
+    groups of adjacent OR items in a form are numbered from 1) of a compiled
+    form. Unlike get_form, which uses a random name for each group, a compiled
+    form's radio button names are derived from the form_id so they stay the
+    same each time the form is rendered.
+    """
+    return form_id + _as_type('-%d' % group, _get_literals(form_id))
+
+
+class CompiledForm(object):
+    """
+    A checklist compiled into a tuple of literal parts with slots for the
+    parts that change between renders. Compiled forms are never changed once
+    created so they may be shared between threads (and forked processes).
+
+    parts - the literal parts of the form (slots are empty).
+    slots - a tuple of (position, kind, group) tuples for the slots in the
+    parts, kind is one of FORM_ID, CSRF_TOKEN or RADIO_NAME. group is the
+    radio button group number for RADIO_NAME slots (otherwise None).
+    groups - the number of radio button groups.
+    checks - a tuple of (position, group, value) tuples for the slots (at the
+    end of each input tag) for the checked attribute. group is the input's
+    radio button group number (0 for check boxes) and value is the input's
+    value as text.
+    """
+
+    def __init__(self, parts, slots, groups, checks=()):
+        self.parts = parts
+        self.slots = slots
+        self.groups = groups
+        self.checks = checks
+
+    def render(self, form_id=None, csrf_token=None, state=None):
+        """
+        Return the form rendered with the given form_id and csrf_token. These
+        behave in the same way as the arguments of the same name to get_form.
+        If given, state is a submission (a dict mapping the name attributes
+        of the inputs to a set of their checked values, see
+        checklistdsl.store) and the inputs it contains are rendered checked.
+        """
+        literals = _get_literals(self.parts[0])
+        form_id = _get_form_id(form_id, literals)
+        csrf = literals['empty']
+        if csrf_token:
+            csrf = _fill(literals['CSRF'], {
+                'token': _as_type(csrf_token, literals)})
+        values = {
+            FORM_ID: form_id,
+            CSRF_TOKEN: csrf,
+        }
+        radio_names = [get_radio_name(form_id, group)
+            for group in range(self.groups + 1)]
+        result = list(self.parts)
+        for position, kind, group in self.slots:
+            if kind == RADIO_NAME:
+                result[position] = radio_names[group]
+            else:
+                result[position] = values[kind]
+        if state:
+            # The checked values of the check boxes (named after the form)
+            # followed by those of each radio button group.
+            names = [form_id] + radio_names[1:]
+            checked = [set(_as_text(value)
+                for value in state.get(_as_text(name), ())) for name in names]
+            attribute = literals['checked']
+            for position, group, value in self.checks:
+                if value in checked[group]:
+                    result[position] = attribute
+        return literals['empty'].join(result)
+
+
+def compile_form(tokens, **kwargs):
+    """
+    Given a list of tokens produced by the lexer will return a CompiledForm
+    (or None if there are no tokens). Any named arguments will become
+    attributes of the form tag (just like get_form).
+    """
+    if not tokens:
+        return None
+    literals = _get_literals(tokens[0].value)
+    empty = literals['empty']
+    # A placeholder for the form id in the form's opening tag.
+    placeholder = _as_type('\x00', literals)
+    # The end of an input tag (where the checked attribute goes). Values are
+    # HTML safe so the first one after the name attribute ends the tag.
+    end = _as_type('>', literals)
+    parts = []
+    slots = []
+    checks = []
+    # Literals since the last slot (joined in one go when the next slot is
+    # added).
+    pending = []
+    add = pending.append
+
+    def add_slot(kind, group=None):
+        parts.append(empty.join(pending))
+        del pending[:]
+        slots.append((len(parts), kind, group))
+        parts.append(empty)
+
+    def add_check(group, value):
+        parts.append(empty.join(pending))
+        del pending[:]
+        checks.append((len(parts), group, _as_text(value)))
+        parts.append(empty)
+
+    head, tail = _get_form_tags(placeholder, kwargs, literals)
+    before, _, after = head.partition(placeholder)
+    add(before)
+    add_slot(FORM_ID)
+    add(after)
+    add_slot(CSRF_TOKEN)
+
+    group = 0
+    group_type = None
+    grouped = REGISTRY.grouped
+    for token in tokens:
+        if token.token in grouped:
+            if token.token != group_type:
+                group += 1
+                group_type = token.token
+        else:
+            group_type = None
+        before, after = FRAGMENTS.get_parts(token)
+        add(before)
+        if after is not None:
+            if group_type:
+                add_slot(RADIO_NAME, group)
+            else:
+                add_slot(FORM_ID)
+            position = after.find(end)
+            if position == -1:
+                add(after)
+            else:
+                add(after[:position])
+                add_check(group if group_type else 0, token.value)
+                add(after[position:])
+    add(tail)
+    parts.append(empty.join(pending))
+    return CompiledForm(tuple(parts), tuple(slots), group, tuple(checks))
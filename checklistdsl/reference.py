@@ -0,0 +1,216 @@
+"""
+The reference engine: the DSL's original lexer and renderer. Each line is
+matched against the regular expressions in MATCHER (in order) and the tokens
+are rendered one by one with the templates, exactly as the first versions of
+get_tokens and get_form did. It is deliberately simple rather than fast and
+is the definition of what the fast engine must produce (see
+checklistdsl.differential). Only the built-in token types are supported.
+
+Apart from handling bytes, the only differences from the original code are
+that tokens are immutable and so the size of a heading is clamped to 6 when
+it's rendered rather than by changing the token, and that a heading without
+text (e.g. "= =", whose token has no size and the whole line as its value)
+is rendered as a paragraph by both engines where the original raised a
+TypeError.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import re
+import uuid
+from checklistdsl import lex
+from checklistdsl.lex import Token, MATCHER
+from checklistdsl.registry import split_roles
+from checklistdsl.parse import (make_html_safe, make_id_safe, _get_literals,
+    _as_type, _fill)
+
+
+"""
+The order in which the regular expressions in MATCHER are tried.
+"""
+ORDER = ('HEADING', 'COMMENT', 'AND_ITEM', 'OR_ITEM', 'BREAK', 'TEXT')
+
+
+def _compile(encode):
+    """
+    Return a list of (compiled regex, token type) tuples in ORDER.
+    """
+    patterns = dict((token_type, pattern)
+        for pattern, token_type in MATCHER.items())
+    return [(re.compile(encode(patterns[token_type])), token_type)
+        for token_type in ORDER]
+
+
+_TEXT_PATTERNS = _compile(lambda pattern: pattern)
+_BYTES_PATTERNS = _compile(lambda pattern: pattern.encode('ascii'))
+
+
+def get_tokens(data):
+    """
+    Given some raw data (text or UTF-8 encoded bytes) will return a list of
+    matched tokens.
+    """
+    if isinstance(data, bytes):
+        literals = lex._BYTES
+        patterns = _BYTES_PATTERNS
+    else:
+        literals = lex._TEXT
+        patterns = _TEXT_PATTERNS
+    empty = literals['empty']
+    strip = literals['strip']
+    result = []
+    # Split on newline and throw away empty (un-needed) lines
+    split_by_lines = [strip(line) for line in data.split(literals['\n'])
+        if strip(line)]
+    for line in split_by_lines:
+        for regex, token_type in patterns:
+            match = regex.match(line)
+            if match:
+                # Grab the named groups.
+                groups = match.groupdict()
+                val = strip(groups.get('value') or empty)
+                roles = strip((groups.get('roles') or empty).replace(
+                    literals['{'], empty).replace(literals['}'], empty))
+                depth_start = groups.get('depth_start') or empty
+
+                # Post process roles.
+                if roles:
+                    roles = split_roles(roles, literals[','])
+                else:
+                    roles = None
+
+                # Post process depth_start to give the size of the heading.
+                if depth_start:
+                    size = len(depth_start)
+                else:
+                    size = None
+
+                # Instantiate the token depending on the match for the val
+                # named group.
+                if val:
+                    token = Token(token_type, val, roles=roles, size=size)
+                else:
+                    token = Token(token_type, match.string)
+                # Ignore comments
+                if token.token != 'COMMENT':
+                    result.append(token)
+                break
+    return result
+
+
+def get_tag(token, name=None):
+    """
+    Given a token will return its HTML representation (of the same type as
+    the token's value). If the name argument is given, this will be used as
+    the 'name' attribute of an input HTML tag.
+    """
+    literals = _get_literals(token.value)
+    # The default result to return.
+    tag = literals['empty']
+
+    # Some sanitization operations on token attributes that derive from user
+    # input.
+    safe_value = make_html_safe(token.value)
+    safe_roles = literals['empty']
+    if token.roles:
+        safe_roles = _fill(literals['ROLES'], {
+            'roles': make_html_safe(literals['separator'].join(token.roles))})
+
+    # Parse the correct template depending on the type of token.
+    if token.token == 'HEADING' and token.size is None:
+        # A heading without any text (e.g. "= =") is shown as it was typed.
+        tag = _fill(literals['PARA'], {
+            'content': safe_value
+        })
+    elif token.token == 'HEADING':
+        size = token.size
+        if size > 6:
+            size = 6
+        tag = _fill(literals['HEADER'], {
+            'size': size,
+            'title': safe_value
+        })
+    elif token.token == 'AND_ITEM':
+        tag = _fill(literals['CHECKBOX'], {
+            'name': name,
+            'value': safe_value,
+            'text': safe_value,
+            'roles': safe_roles
+        })
+    elif token.token == 'OR_ITEM':
+        tag = _fill(literals['RADIO'], {
+            'name': name,
+            'value': safe_value,
+            'text': safe_value,
+            'roles': safe_roles
+        })
+    elif token.token == 'BREAK':
+        tag = literals['BREAK']
+    elif token.token == 'TEXT':
+        tag = _fill(literals['PARA'], {
+            'content': safe_value
+        })
+    return tag
+
+
+def get_form(tokens, form_id=None, csrf_token=None, **kwargs):
+    """
+    Given a list of tokens will return an HTML representation of the
+    checklist. See checklistdsl.parse.get_form for the arguments.
+    """
+    if not tokens:
+        return ''
+    literals = _get_literals(tokens[0].value)
+
+    if form_id:
+        # Ensure the form's id can be used in an id or name attribute in HTML.
+        form_id = make_id_safe(_as_type(form_id, literals))
+    else:
+        # if no form_id is given then use something random and unique.
+        form_id = _as_type(str(uuid.uuid4()), literals)
+
+    html_tags = []
+
+    # Handle the CSRF token if it exists.
+    if csrf_token:
+        html_tags.append(_fill(literals['CSRF'], {
+            'token': _as_type(csrf_token, literals)}))
+
+    # Used to track the name of the current radio button group.
+    radio_name = literals['empty']
+
+    for token in tokens:
+        # Radio button group state check
+        if token.token == 'OR_ITEM':
+            if not radio_name:
+                # Currently not in a radio button group so create a new name.
+                radio_name = _as_type(str(uuid.uuid4()), literals)
+            tag = get_tag(token, radio_name)
+        else:
+            # Not in a radio button group so reset it and use form_id for name
+            # attributes.
+            radio_name = literals['empty']
+            tag = get_tag(token, form_id)
+        if tag:
+            html_tags.append(tag)
+
+    # Default form attributes.
+    attributes = {
+        'action': '.',
+        'method': 'POST'
+    }
+    # Overridden with the named arguments into this function.
+    if kwargs:
+        attributes.update(kwargs)
+
+    attr_list = []
+    for name, value in attributes.items():
+        attr_list.append(
+            '%(name)s="%(value)s"' % {'name': name, 'value': value})
+
+    attrs = _as_type(' '.join(attr_list), literals)
+
+    return _fill(literals['FORM'], {
+        'content': literals['empty'].join(html_tags),
+        'id': form_id,
+        'attrs': attrs
+    })
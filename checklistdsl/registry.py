@@ -0,0 +1,246 @@
+"""
+A registry of the token types of the DSL. Each token type has a scanner (or a
+regex pattern) used by the lexer, the leading character(s) of the lines it
+can match, a precedence and a renderer used by the parser. The lexer doesn't
+try every token type against every line: the registry compiles a dispatch
+table from a line's first character to the few token types that could match
+it, so registering extra token types doesn't make lexing any slower.
+
+For example, to add a timed item ("@ 10:00 Give the medication"), rendering
+HTML of the same type (text or bytes) as the token's value:
+
+    from checklistdsl.registry import register
+    from checklistdsl.parse import make_html_safe
+
+    def render_timed(token, name):
+        template = '<p class="timed">%s</p>'
+        if isinstance(token.value, bytes):
+            template = template.encode('ascii')
+        return template % make_html_safe(token.value)
+
+    register('TIMED_ITEM', lead='@', pattern=r'@ *(?P<value>.*)',
+        renderer=render_timed)
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import re
+import threading
+
+
+"""
+Returned by a scanner to show it matched the line but there's no token to
+emit (e.g. for a comment).
+"""
+IGNORE = object()
+
+
+def split_roles(roles, separator):
+    """
+    Split the roles (text or bytes) at the separator, lower casing and
+    stripping each of them. Bytes roles are decoded to do this (and encoded
+    again) since bytes.lower only lower cases ASCII characters: the roles of
+    tokens lexed from bytes are the UTF-8 encoded roles of those lexed from
+    text. Bytes that aren't valid UTF-8 are only lower cased for ASCII.
+    """
+    if isinstance(roles, bytes):
+        try:
+            text = roles.decode('utf-8')
+        except UnicodeDecodeError:
+            return [role.lower().strip() for role in roles.split(separator)]
+        return [role.lower().strip().encode('utf-8')
+            for role in text.split(separator.decode('utf-8'))]
+    return [role.lower().strip() for role in roles.split(separator)]
+
+
+class TokenType(object):
+    """
+    Describes a type of token.
+
+    name - the name of the token type (e.g. 'AND_ITEM').
+    lead - a string of the ASCII characters that lines of this type may start
+    with. None means lines starting with any character are tried.
+    scanner - a function that takes a stripped line (text or bytes) and the
+    lexer's literals (see lex.py) and returns a Token, None if the line
+    doesn't match, or IGNORE if the line matches but should be ignored.
+    precedence - token types with a higher precedence are tried first.
+    renderer - a function that takes a token and the name attribute to use
+    for any input and returns its HTML (of the same type as token.value).
+    named - True if the rendered HTML is an input whose name attribute comes
+    before any other use of the token's value.
+    grouped - True if adjacent tokens of this type share their name attribute
+    (like the radio buttons of OR items).
+    """
+
+    def __init__(self, name, lead, scanner, precedence, renderer, named,
+            grouped):
+        self.name = name
+        self.lead = lead
+        self.scanner = scanner
+        self.precedence = precedence
+        self.renderer = renderer
+        self.named = named
+        self.grouped = grouped
+
+
+def _make_pattern_scanner(token_type, pattern, ignore):
+    """
+    Return a scanner for the given regex pattern. The value, roles and
+    depth_start named groups are post processed in the same way as the
+    built-in token types.
+    """
+    # Imported here since the lexer imports this module.
+    from checklistdsl.lex import Token
+    text = re.compile(pattern)
+    binary = re.compile(pattern.encode('ascii'))
+
+    def scanner(line, literals):
+        regex = binary if isinstance(line, bytes) else text
+        match = regex.match(line)
+        if not match:
+            return None
+        if ignore:
+            return IGNORE
+        empty = literals['empty']
+        strip = literals['strip']
+        groups = match.groupdict()
+        value = strip(groups.get('value') or empty)
+        if not value:
+            return Token(token_type, line)
+        roles = strip((groups.get('roles') or empty).replace(literals['{'],
+            empty).replace(literals['}'], empty))
+        if roles:
+            roles = split_roles(roles, literals[','])
+        else:
+            roles = None
+        size = len(groups.get('depth_start') or empty) or None
+        return Token(token_type, value, roles=roles, size=size)
+    return scanner
+
+
+class Registry(object):
+    """
+    A registry of token types. The dispatch tables used by the lexer are
+    compiled when they're first needed after a change. The version is
+    incremented on every change (so caches of rendered tokens know when to
+    throw away their contents).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.types = {}
+        self.renderers = {}
+        self.named = frozenset()
+        self.grouped = frozenset()
+        self._order = []
+        self._dispatch = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, lead=None, scanner=None, pattern=None,
+            precedence=0, renderer=None, named=False, grouped=False,
+            ignore=False):
+        """
+        Register (or replace) a token type. Either a scanner function or a
+        regex pattern (as text, matched against the start of each stripped
+        line) must be given. If ignore is True lines matching the pattern
+        produce no token. See TokenType for the other arguments.
+
+        Giving a lead is strongly recommended: token types without one are
+        tried against every line that nothing else matches.
+        """
+        if (scanner is None) == (pattern is None):
+            raise ValueError('Give exactly one of scanner or pattern.')
+        if lead is not None:
+            try:
+                lead.encode('ascii')
+            except (UnicodeError, AttributeError):
+                raise ValueError('Lead characters must be ASCII text.')
+        if pattern is not None:
+            scanner = _make_pattern_scanner(name, pattern, ignore)
+        with self._lock:
+            if renderer is None and name in self.types:
+                renderer = self.types[name].renderer
+            self.types[name] = TokenType(name, lead, scanner, precedence,
+                renderer, named, grouped)
+            if name not in self._order:
+                self._order.append(name)
+            self._changed()
+
+    def unregister(self, name):
+        """
+        Remove the named token type.
+        """
+        with self._lock:
+            del self.types[name]
+            self._order.remove(name)
+            self._changed()
+
+    def set_renderer(self, name, renderer):
+        """
+        Set the renderer of an already registered token type.
+        """
+        with self._lock:
+            self.types[name].renderer = renderer
+            self._changed()
+
+    def _changed(self):
+        """
+        Rebuild the renderer table and forget the compiled dispatch tables.
+        """
+        self.version += 1
+        types = self.types.values()
+        self.renderers = dict((token_type.name, token_type.renderer)
+            for token_type in types if token_type.renderer)
+        self.named = frozenset(token_type.name for token_type in types
+            if token_type.named)
+        self.grouped = frozenset(token_type.name for token_type in types
+            if token_type.grouped)
+        self._dispatch = {}
+
+    def get_dispatch(self, binary=False):
+        """
+        Return a tuple containing the dispatch table (mapping a line's first
+        character to the scanners to try, in order) and the scanners to try
+        for characters not in the table. Characters are bytes if binary is
+        True.
+        """
+        try:
+            return self._dispatch[binary]
+        except KeyError:
+            pass
+        with self._lock:
+            order = self._order
+            types = sorted([self.types[name] for name in order],
+                key=lambda token_type: (-token_type.precedence,
+                    order.index(token_type.name)))
+            fallbacks = tuple(token_type.scanner for token_type in types
+                if token_type.lead is None)
+            leads = set()
+            for token_type in types:
+                leads.update(token_type.lead or '')
+            table = {}
+            for char in leads:
+                key = char.encode('ascii') if binary else char
+                table[key] = tuple(token_type.scanner for token_type in types
+                    if token_type.lead is None or char in token_type.lead)
+            self._dispatch[binary] = (table, fallbacks)
+            return self._dispatch[binary]
+
+
+"""
+The registry used by get_tokens and get_tag.
+"""
+REGISTRY = Registry()
+
+
+def register(name, **kwargs):
+    """
+    Register a token type with the default registry. See Registry.register.
+    """
+    REGISTRY.register(name, **kwargs)
+
+
+def unregister(name):
+    """
+    Remove a token type from the default registry.
+    """
+    REGISTRY.unregister(name)
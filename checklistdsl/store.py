@@ -0,0 +1,280 @@
+"""
+An append-only store for completed checklists. Rather than keeping a blob of
+JSON per submission, each submission is packed into a fixed width row: one
+bit per check box (AND item) followed by the index of the chosen radio button
+(OR item) in each group. The rows are appended to a file after a small
+header that records the layout of the checklist they belong to. Reads use
+mmap so scans and random access by row don't copy the file into memory.
+
+A submission (or "state") is a dict mapping the name attributes of a
+compiled form's inputs (see checklistdsl.precompile) to a set of the values
+that were checked, e.g.:
+
+    {'my-form': set(['Item 1', 'Item 3']), 'my-form-1': set(['Choice 2'])}
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from checklistdsl.registry import REGISTRY
+from checklistdsl.parse import make_id_safe, _as_text
+from checklistdsl.precompile import get_radio_name
+
+
+MAGIC = b'CHKLSTOR'
+FORMAT_VERSION = 1
+# Magic, format version, row size and the layout's digest. Padded to
+# HEADER_SIZE bytes.
+HEADER = struct.Struct('<8sHI20s')
+HEADER_SIZE = 64
+
+
+class Layout(object):
+    """
+    The layout of the inputs in a checklist, worked out from its tokens in
+    the same way as compile_form (so the names match those of a compiled
+    form rendered with the same form_id).
+
+    form_id - the (safe) form id.
+    checkboxes - a list of the values of the check boxes in order.
+    groups - a list of (name, values) tuples for the radio button groups.
+    row_size - the number of bytes needed to store a submission.
+    digest - a digest of the layout (the same for identical layouts).
+    """
+
+    def __init__(self, tokens, form_id):
+        self.form_id = _as_text(make_id_safe(form_id))
+        self.checkboxes = []
+        self.groups = []
+        named = REGISTRY.named
+        grouped = REGISTRY.grouped
+        group_type = None
+        for token in tokens:
+            if token.token in grouped:
+                if token.token != group_type:
+                    group_type = token.token
+                    name = get_radio_name(self.form_id, len(self.groups) + 1)
+                    self.groups.append((name, []))
+                self.groups[-1][1].append(_as_text(token.value))
+            else:
+                group_type = None
+                if token.token in named:
+                    self.checkboxes.append(_as_text(token.value))
+        # Bytes per group: 0 means nothing chosen, n the nth value.
+        self._group_widths = [1 if len(values) < 255 else 2
+            for name, values in self.groups]
+        self._bitmap_size = (len(self.checkboxes) + 7) // 8
+        self.row_size = self._bitmap_size + sum(self._group_widths)
+        digest = hashlib.sha1()
+        for value in [self.form_id] + self.checkboxes:
+            digest.update(value.encode('utf-8') + b'\x00')
+        for name, values in self.groups:
+            digest.update(b'\x01')
+            for value in values:
+                digest.update(value.encode('utf-8') + b'\x00')
+        self.digest = digest.digest()
+
+    def encode(self, state):
+        """
+        Pack a submission into a row (bytes).
+        """
+        row = bytearray(self.row_size)
+        checked = set(_as_text(value)
+            for value in state.get(self.form_id, ()))
+        for index, value in enumerate(self.checkboxes):
+            if value in checked:
+                row[index // 8] |= 1 << (index % 8)
+        offset = self._bitmap_size
+        for (name, values), width in zip(self.groups, self._group_widths):
+            chosen = 0
+            for value in state.get(name, ()):
+                value = _as_text(value)
+                if value in values:
+                    chosen = values.index(value) + 1
+                    break
+            if width == 1:
+                row[offset] = chosen
+            else:
+                row[offset:offset + 2] = struct.pack('<H', chosen)
+            offset += width
+        return bytes(row)
+
+    def decode(self, row):
+        """
+        Unpack a row into a submission.
+        """
+        row = bytearray(row)
+        checked = set()
+        for index, value in enumerate(self.checkboxes):
+            if row[index // 8] & (1 << (index % 8)):
+                checked.add(value)
+        state = {self.form_id: checked}
+        offset = self._bitmap_size
+        for (name, values), width in zip(self.groups, self._group_widths):
+            if width == 1:
+                chosen = row[offset]
+            else:
+                chosen = struct.unpack('<H', bytes(row[offset:offset + 2]))[0]
+            state[name] = set([values[chosen - 1]]) if chosen else set()
+            offset += width
+        return state
+
+
+class SubmissionStore(object):
+    """
+    An append-only file of submissions for one checklist layout. Use as a
+    context manager or call close() when done.
+    """
+
+    def __init__(self, path, layout):
+        """
+        Open (or create) the store at the given path. Raises ValueError if the
+        file isn't a store, was created for a different layout or the layout
+        has no inputs (so there's nothing to store).
+
+        A partial row at the end of the file (left by a write that was cut
+        short) is truncated so later rows are written in the right place.
+        """
+        if layout.row_size == 0:
+            raise ValueError('The checklist has no inputs to store.')
+        self.path = path
+        self.layout = layout
+        self._lock = threading.Lock()
+        self._map = None
+        self._file = open(path, 'a+b')
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() == 0:
+            header = HEADER.pack(MAGIC, FORMAT_VERSION, layout.row_size,
+                layout.digest)
+            self._file.write(header.ljust(HEADER_SIZE, b'\x00'))
+            self._file.flush()
+        else:
+            self._file.seek(0)
+            header = self._file.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+                self._file.close()
+                raise ValueError('%s is not a submission store.' % path)
+            magic, version, row_size, digest = HEADER.unpack(
+                header[:HEADER.size])
+            if (version != FORMAT_VERSION or row_size != layout.row_size or
+                    digest != layout.digest):
+                self._file.close()
+                raise ValueError('%s was created for a different layout.' %
+                    path)
+            size = HEADER_SIZE + len(self) * row_size
+            if os.fstat(self._file.fileno()).st_size > size:
+                self._file.truncate(size)
+
+    def append(self, state):
+        """
+        Append a submission and return its row number.
+        """
+        return self.append_many([state])
+
+    def append_many(self, states):
+        """
+        Append many submissions in one write and return the row number of the
+        first of them.
+        """
+        rows = b''.join([self.layout.encode(state) for state in states])
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            row = (self._file.tell() - HEADER_SIZE) // self.layout.row_size
+            self._file.write(rows)
+            self._file.flush()
+        return row
+
+    def __len__(self):
+        size = os.fstat(self._file.fileno()).st_size
+        return (size - HEADER_SIZE) // self.layout.row_size
+
+    def _get_map(self):
+        """
+        Return an mmap of the file, remapping it if the file has grown. The
+        old map isn't closed since scans may still be reading it; it's
+        unmapped once the last of them lets it go.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        with self._lock:
+            if self._map is None or len(self._map) < size:
+                self._map = mmap.mmap(self._file.fileno(), size,
+                    access=mmap.ACCESS_READ)
+            return self._map
+
+    def get_row(self, index):
+        """
+        Return the packed row at the given index (negative indexes count from
+        the end).
+        """
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('Row %d out of range.' % index)
+        start = HEADER_SIZE + index * self.layout.row_size
+        return self._get_map()[start:start + self.layout.row_size]
+
+    def __getitem__(self, index):
+        return self.layout.decode(self.get_row(index))
+
+    def scan(self):
+        """
+        Iterate over all the (packed) rows.
+        """
+        count = len(self)
+        data = self._get_map()
+        row_size = self.layout.row_size
+        for start in range(HEADER_SIZE, HEADER_SIZE + count * row_size,
+                row_size):
+            yield data[start:start + row_size]
+
+    def __iter__(self):
+        decode = self.layout.decode
+        for row in self.scan():
+            yield decode(row)
+
+    def totals(self):
+        """
+        Return a tuple containing a list of how many times each check box was
+        checked and, for each radio button group, a list of how many times
+        each of its values was chosen.
+        """
+        layout = self.layout
+        checkboxes = [0] * len(layout.checkboxes)
+        groups = [[0] * len(values) for name, values in layout.groups]
+        bitmap_size = layout._bitmap_size
+        widths = layout._group_widths
+        for row in self.scan():
+            row = bytearray(row)
+            for byte in range(bitmap_size):
+                bits = row[byte]
+                while bits:
+                    low = bits & -bits
+                    checkboxes[byte * 8 + low.bit_length() - 1] += 1
+                    bits ^= low
+            offset = bitmap_size
+            for counts, width in zip(groups, widths):
+                if width == 1:
+                    chosen = row[offset]
+                else:
+                    chosen = row[offset] | (row[offset + 1] << 8)
+                if chosen:
+                    counts[chosen - 1] += 1
+                offset += width
+        return checkboxes, groups
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,181 @@
+"""
+Push style lexing and rendering for checklists that arrive in chunks (e.g.
+a chunked upload). Rather than buffering the whole source and then calling
+get_tokens, feed each chunk to a PushLexer as it arrives: the tokens of every
+line completed by the chunk are returned straight away and only the
+unfinished last line is kept. Lines may be split anywhere, including between
+the \\r and \\n of a \\r\\n. A PushRenderer does the same but returns the
+rendered form a piece at a time:
+
+    renderer = PushRenderer(form_id='my-form')
+    for chunk in upload:
+        output.write(renderer.feed(chunk))
+    output.write(renderer.close())
+
+The tokens (and, apart from the random names of radio button groups, the
+HTML) are exactly those of get_tokens (and get_form) for the whole source.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import uuid
+from checklistdsl.registry import REGISTRY
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import (FRAGMENTS, _get_literals, _as_type, _fill,
+    _get_form_id, _get_form_tags)
+from checklistdsl.limits import LimitExceeded
+
+
+class PushLexer(object):
+    """
+    Lexes a checklist fed to it a chunk (of text or bytes) at a time.
+    """
+
+    def __init__(self, max_line_length=None):
+        """
+        max_line_length - if given, LimitExceeded is raised as soon as more
+        than this much of an unfinished line would have to be buffered.
+        """
+        self.max_line_length = max_line_length
+        self._pending = []
+        self._pending_size = 0
+        self._closed = False
+
+    @property
+    def pending(self):
+        """
+        The size of the buffered, unfinished, line.
+        """
+        return self._pending_size
+
+    def feed(self, chunk):
+        """
+        Feed the next chunk of the source and return a list of the tokens of
+        the lines it completes.
+        """
+        if self._closed:
+            raise ValueError('Cannot feed a closed lexer.')
+        if not chunk:
+            return []
+        newline = b'\n' if isinstance(chunk, bytes) else u'\n'
+        end = chunk.rfind(newline)
+        if end == -1:
+            self._buffer(chunk)
+            return []
+        complete = chunk[:end]
+        if self._pending:
+            self._pending.append(complete)
+            complete = chunk[:0].join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+        self._buffer(chunk[end + 1:])
+        return get_tokens(complete)
+
+    def _buffer(self, data):
+        """
+        Keep (part of) the unfinished line.
+        """
+        if not data:
+            return
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if (self.max_line_length is not None and
+                self._pending_size > self.max_line_length):
+            raise LimitExceeded('max_line_length', self.max_line_length,
+                'A line is too long')
+
+    def close(self):
+        """
+        Finish lexing and return a list of the tokens of the last line (if it
+        wasn't ended with a newline).
+        """
+        self._closed = True
+        if not self._pending:
+            return []
+        rest = self._pending[0][:0].join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        return get_tokens(rest)
+
+
+class PushRenderer(object):
+    """
+    Lexes and renders a checklist fed to it a chunk (of text or bytes) at a
+    time. The output is of the same type as the chunks.
+    """
+
+    def __init__(self, form_id=None, csrf_token=None, max_line_length=None,
+            **kwargs):
+        """
+        The form_id, csrf_token and further named arguments behave in the same
+        way as those passed to get_form. See PushLexer for max_line_length.
+        """
+        self.lexer = PushLexer(max_line_length)
+        self.form_id = form_id
+        self.csrf_token = csrf_token
+        self.attributes = kwargs
+        self._literals = None
+        self._tail = None
+        # Empty text or bytes (the type of the chunks).
+        self._empty = ''
+        # The state of the current radio button group (kept between feeds).
+        self._group_type = None
+        self._radio_name = None
+
+    def feed(self, chunk):
+        """
+        Feed the next chunk of the source and return the HTML for the lines it
+        completes (empty if there are none).
+        """
+        if chunk:
+            self._empty = chunk[:0]
+        return self._render(self.lexer.feed(chunk))
+
+    def close(self):
+        """
+        Finish rendering and return the rest of the HTML (including the form's
+        closing tags).
+        """
+        html = self._render(self.lexer.close())
+        if self._tail is None:
+            return html
+        html += self._tail
+        self._tail = None
+        return html
+
+    def _start(self, literals):
+        """
+        Return the opening form tag (and CSRF token) for the first token.
+        """
+        self._literals = literals
+        form_id = _get_form_id(self.form_id, literals)
+        self._form_id = form_id
+        head, self._tail = _get_form_tags(form_id, self.attributes, literals)
+        if self.csrf_token:
+            head += _fill(literals['CSRF'], {
+                'token': _as_type(self.csrf_token, literals)})
+        return head
+
+    def _render(self, tokens):
+        """
+        Render the tokens (as _iter_tags does, keeping the state of the
+        current radio button group between calls).
+        """
+        if not tokens:
+            return self._empty
+        html = []
+        if self._literals is None:
+            html.append(self._start(_get_literals(tokens[0].value)))
+        literals = self._literals
+        grouped = REGISTRY.grouped
+        for token in tokens:
+            if token.token in grouped:
+                if token.token != self._group_type:
+                    self._group_type = token.token
+                    self._radio_name = _as_type(str(uuid.uuid4()), literals)
+                tag = FRAGMENTS.get_tag(token, self._radio_name)
+            else:
+                self._group_type = None
+                tag = FRAGMENTS.get_tag(token, self._form_id)
+            if tag:
+                html.append(tag)
+        return literals['empty'].join(html)
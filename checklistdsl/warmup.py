@@ -0,0 +1,238 @@
+"""
+Warms up a pre-fork server. The master process lexes and compiles the whole
+corpus of checklists once, before forking its workers, so the workers share
+the results (copy-on-write) rather than each lexing and caching their own
+copy and starting cold.
+
+Everything built by warm_up is immutable (tuples of tokens and compiled
+forms) and nothing is changed when a form is rendered, so the pages holding
+the corpus are only ever written to by reference counting. Calling
+freeze_heap (warm_up does so by default) moves everything into the garbage
+collector's permanent generation (with gc.freeze on Python 3.7+) so the
+collector doesn't touch, and so copy, those pages in the workers either.
+
+Use measure_workers to see how much memory each worker really uses, or run:
+
+    python -m checklistdsl.warmup [WORKERS]
+
+to compare workers forked from a cold and a warmed up master.
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import gc
+import json
+import os
+import sys
+from checklistdsl.lex import get_tokens
+from checklistdsl.precompile import compile_form
+from checklistdsl.fingerprint import get_fingerprint
+
+
+class Corpus(object):
+    """
+    A corpus of lexed and compiled checklists. Treat it as read-only: it's
+    meant to be built once (by warm_up) and shared.
+    """
+
+    def __init__(self, entries):
+        """
+        entries - a dict mapping the names of checklists to a tuple of their
+        tokens (as a tuple), compiled form and fingerprint.
+        """
+        self._entries = entries
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def names(self):
+        """
+        Return a sorted list of the names of the checklists.
+        """
+        return sorted(self._entries)
+
+    def get_tokens(self, name):
+        """
+        Return the tuple of tokens of the named checklist.
+        """
+        return self._entries[name][0]
+
+    def get_compiled(self, name):
+        """
+        Return the CompiledForm of the named checklist (None if it has no
+        tokens).
+        """
+        return self._entries[name][1]
+
+    def get_fingerprint(self, name):
+        """
+        Return the fingerprint of the named checklist (see
+        checklistdsl.fingerprint).
+        """
+        return self._entries[name][2]
+
+    def get_form(self, name, form_id=None, csrf_token=None):
+        """
+        Render the named checklist. See CompiledForm.render. Like get_form,
+        returns an empty string for a checklist with no tokens.
+        """
+        compiled = self._entries[name][1]
+        if compiled is None:
+            return ''
+        return compiled.render(form_id, csrf_token)
+
+
+def freeze_heap():
+    """
+    Collect garbage and then move every remaining object into the garbage
+    collector's permanent generation so it's never scanned (and its pages are
+    never written to by the collector) again. Returns True if the objects
+    were frozen, False if this version of Python can't (gc.freeze was added
+    in Python 3.7).
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+        return True
+    return False
+
+
+def warm_up(sources, freeze=True, **kwargs):
+    """
+    Given a dict mapping the names of checklists to their sources (text or
+    bytes) will return a Corpus of them lexed and compiled. Call this in the
+    master process before forking. If freeze is True the heap is frozen
+    afterwards (see freeze_heap). Any further named arguments become
+    attributes of the form tags.
+    """
+    entries = {}
+    for name, source in sources.items():
+        tokens = tuple(get_tokens(source))
+        entries[name] = (tokens, compile_form(tokens, **kwargs),
+            get_fingerprint(tokens, **kwargs))
+    corpus = Corpus(entries)
+    if freeze:
+        freeze_heap()
+    return corpus
+
+
+def warm_up_app(app, freeze=True):
+    """
+    Load every checklist served by a ChecklistApp (see checklistdsl.wsgi)
+    along with its pre-compressed default page so no worker has to lex,
+    render or compress anything for its first requests. If freeze is True
+    the heap is frozen afterwards (see freeze_heap).
+    """
+    app.preload()
+    if freeze:
+        freeze_heap()
+
+
+def get_memory(pid='self'):
+    """
+    Return a dict of the memory used by the given process (in bytes) with
+    the keys rss, pss, shared and private, read from Linux's
+    /proc/<pid>/smaps_rollup. Returns None if it can't be read (e.g. not on
+    Linux 4.14+).
+    """
+    fields = {
+        'Rss': 'rss',
+        'Pss': 'pss',
+        'Shared_Clean': 'shared',
+        'Shared_Dirty': 'shared',
+        'Private_Clean': 'private',
+        'Private_Dirty': 'private',
+    }
+    result = dict((key, 0) for key in set(fields.values()))
+    try:
+        with open('/proc/%s/smaps_rollup' % pid) as rollup:
+            for line in rollup:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0][:-1] in fields:
+                    result[fields[parts[0][:-1]]] += int(parts[1]) * 1024
+    except (IOError, OSError, ValueError):
+        return None
+    return result
+
+
+def measure_workers(work, workers=2):
+    """
+    Fork the given number of workers, one after the other, each of which
+    calls work() and then measures its memory (see get_memory). Returns a
+    list of the measurements. Only works where os.fork is available.
+    """
+    results = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read)
+                work()
+                data = json.dumps(get_memory()).encode('utf-8')
+                os.write(write, data)
+                os.close(write)
+            finally:
+                os._exit(0)
+        os.close(write)
+        chunks = []
+        while True:
+            chunk = os.read(read, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(read)
+        os.waitpid(pid, 0)
+        data = b''.join(chunks)
+        results.append(json.loads(data.decode('utf-8')) if data else None)
+    return results
+
+
+def _average_private(measurements):
+    measurements = [item for item in measurements if item]
+    if not measurements:
+        return None
+    return sum(item['private'] for item in measurements) / len(measurements)
+
+
+def main(argv=None):
+    """
+    Compare the private memory of workers forked from a cold master (each
+    lexes and compiles the corpus itself) with that of workers forked from a
+    warmed up master (each only renders the shared compiled forms).
+    """
+    # Imported here since it's only needed for the generated corpus.
+    from checklistdsl.loadtest import make_checklist
+    argv = sys.argv[1:] if argv is None else argv
+    workers = int(argv[0]) if argv else 2
+    sources = dict(('checklist%d' % i, make_checklist(500, seed=i))
+        for i in range(200))
+
+    def cold():
+        corpus = warm_up(sources, freeze=False)
+        for name in corpus.names():
+            corpus.get_form(name, name)
+
+    before = measure_workers(cold, workers)
+    corpus = warm_up(sources)
+
+    def warm():
+        for name in corpus.names():
+            corpus.get_form(name, name)
+
+    after = measure_workers(warm, workers)
+    before = _average_private(before)
+    after = _average_private(after)
+    if before is None or after is None:
+        print('Memory use can only be measured on Linux.')
+        return
+    print('Private memory per worker (%d checklists, %d workers)' % (
+        len(sources), workers))
+    print('  cold master: %.1fMB' % (before / 1e6))
+    print('  warm master: %.1fMB' % (after / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+A WSGI application that serves a directory of checklists (*.chkl files) as
+HTML forms. Checklists are lexed and pre-compiled once and kept in memory.
+The directory is polled (with os.stat, at most once every poll_interval
+seconds) and only new or changed files are lexed again. Responses carry an
+ETag so conditional GETs are answered with a 304 without rendering anything
+(apart from those with a CSRF token, which are only good for one request).
+
+Try it locally with:
+
+    python -m checklistdsl.wsgi DIRECTORY [PORT]
+
+(c) 2012 Nicholas H.Tollervey
+"""
+import os
+import sys
+import threading
+import time
+from wsgiref.simple_server import make_server
+try:
+    from urllib.parse import quote
+except ImportError:  # Python 2
+    from urllib import quote
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import make_html_safe
+from checklistdsl.precompile import compile_form
+from checklistdsl.compress import compress_form
+from checklistdsl.fingerprint import get_fingerprint, etag_matches
+
+
+PAGE = ('<!DOCTYPE html><html><head><meta charset="utf-8"/>' +
+    '<title>%(title)s</title></head><body>%(content)s</body></html>')
+INDEX_ITEM = '<li><a href="%(href)s">%(name)s</a></li>'
+
+
+class _Entry(object):
+    """
+    A checklist loaded from a file.
+    """
+
+    def __init__(self, name, stat, tokens, attributes):
+        self.name = name
+        self.stat = stat
+        self.tokens = tokens
+        self.compiled = compile_form(tokens, **attributes)
+        self.fingerprint = get_fingerprint(tokens, **attributes)
+        # The page for the default form id (the checklist's name) without a
+        # CSRF token, pre-compressed, for when nothing needs injecting.
+        self.static = None
+
+
+class ChecklistApp(object):
+    """
+    The WSGI application. The checklist in DIRECTORY/name.chkl is served at
+    /name and an index of the checklists is served at /.
+    """
+
+    def __init__(self, directory, csrf_token=None, form_id=None,
+            poll_interval=1.0, extension='.chkl', **kwargs):
+        """
+        directory - the directory containing the checklists.
+        csrf_token - a function that takes the WSGI environ and returns the
+        CSRF token for the request (or None).
+        form_id - a function that takes the WSGI environ and the checklist's
+        name and returns the form id to use for the request. Defaults to the
+        checklist's name.
+        poll_interval - the minimum number of seconds between checks of the
+        directory for changed files.
+        extension - the extension of checklist files.
+        Any further named arguments become attributes of the form tags.
+        """
+        self.directory = directory
+        self.csrf_token = csrf_token
+        self.form_id = form_id
+        self.poll_interval = poll_interval
+        self.extension = extension
+        self.attributes = kwargs
+        self._entries = {}
+        self._last_poll = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+        Bring the in-memory checklists up to date with the directory, lexing
+        only those files whose modification time or size have changed.
+        Unless forced, does nothing if the directory was checked less than
+        poll_interval seconds ago.
+
+        A file that can't be read, lexed or compiled is left out (and tried
+        again on the next check) so the others are still served.
+        """
+        now = time.time()
+        if (not force and self._last_poll is not None and
+                now - self._last_poll < self.poll_interval):
+            return
+        with self._lock:
+            entries = {}
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(self.extension):
+                    continue
+                name = filename[:-len(self.extension)]
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Deleted since listing the directory.
+                    continue
+                stat = (stat.st_mtime, stat.st_size)
+                entry = self._entries.get(name)
+                if entry is None or entry.stat != stat:
+                    try:
+                        with open(path, 'rb') as source:
+                            tokens = tuple(get_tokens(source.read()))
+                        entry = _Entry(name, stat, tokens, self.attributes)
+                    except Exception:
+                        continue
+                entries[name] = entry
+            # Replaced in one go so readers never see a partial update.
+            self._entries = entries
+            # Only once the whole directory has been checked, so a failure
+            # part way through is tried again on the next request.
+            self._last_poll = now
+
+    def preload(self):
+        """
+        Load every checklist, along with its pre-compressed default page,
+        so the first requests for them don't have to lex, render or compress
+        anything (see checklistdsl.warmup).
+        """
+        self.refresh(force=True)
+        for entry in self._entries.values():
+            self._get_static(entry)
+
+    def get_entry(self, name):
+        """
+        Return the up to date entry for the named checklist or None.
+        """
+        self.refresh()
+        return self._entries.get(name)
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return self._respond(start_response, '405 Method Not Allowed',
+                b'Method Not Allowed', [('Allow', 'GET, HEAD'),
+                ('Content-Type', 'text/plain')])
+        name = environ.get('PATH_INFO', '/').lstrip('/')
+        if not name:
+            return self._index(environ, start_response)
+        entry = None
+        if '/' not in name and '\\' not in name:
+            entry = self.get_entry(name)
+        if entry is None:
+            return self._respond(start_response, '404 Not Found',
+                b'Not Found', [('Content-Type', 'text/plain')])
+
+        form_id = name
+        if self.form_id:
+            form_id = self.form_id(environ, name)
+        csrf_token = None
+        if self.csrf_token:
+            csrf_token = self.csrf_token(environ)
+
+        headers = [('Vary', 'Accept-Encoding')]
+        if not csrf_token:
+            # A page with a CSRF token has no ETag, since a client holding
+            # a cached copy would keep using its old token.
+            etag = 'W/"%s-%s"' % (entry.fingerprint,
+                get_fingerprint((), form_id))
+            headers.insert(0, ('ETag', etag))
+            if etag_matches(environ.get('HTTP_IF_NONE_MATCH'), etag):
+                return self._respond(start_response, '304 Not Modified',
+                    b'', headers)
+        headers.append(('Content-Type', 'text/html; charset=utf-8'))
+
+        if form_id == name and not csrf_token:
+            # Nothing to inject so serve the pre-compressed page.
+            encoding, body = self._get_static(entry).negotiate(
+                environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+        else:
+            body = self._page(entry, form_id, csrf_token)
+        if method == 'HEAD':
+            headers.append(('Content-Length', str(len(body))))
+            body = b''
+        return self._respond(start_response, '200 OK', body, headers)
+
+    def _get_static(self, entry):
+        """
+        Return the entry's pre-compressed default page, making it if needed.
+        """
+        if entry.static is None:
+            entry.static = compress_form(self._page(entry, entry.name, None))
+        return entry.static
+
+    def _page(self, entry, form_id, csrf_token):
+        """
+        Return the HTML page for the entry as bytes.
+        """
+        form = b''
+        if entry.compiled is not None:
+            form = entry.compiled.render(form_id, csrf_token)
+        head, _, tail = PAGE.partition('%(content)s')
+        head = head % {'title': make_html_safe(entry.name)}
+        return head.encode('utf-8') + form + tail.encode('utf-8')
+
+    def _index(self, environ, start_response):
+        """
+        Respond with a list of links to the checklists.
+        """
+        self.refresh()
+        items = ''.join([INDEX_ITEM % {
+            'href': make_html_safe(quote(name)),
+            'name': make_html_safe(name),
+        } for name in sorted(self._entries)])
+        body = PAGE % {
+            'title': 'Checklists',
+            'content': '<ul>%s</ul>' % items,
+        }
+        return self._respond(start_response, '200 OK', body.encode('utf-8'),
+            [('Content-Type', 'text/html; charset=utf-8')])
+
+    def _respond(self, start_response, status, body, headers):
+        if (status != '304 Not Modified' and
+                'Content-Length' not in dict(headers)):
+            headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+
+def serve(directory, host='127.0.0.1', port=8000, **kwargs):
+    """
+    Serve the checklists in the directory with wsgiref's simple server (for
+    trying things out locally, not for production). Further named arguments
+    are passed to ChecklistApp.
+    """
+    server = make_server(host, port, ChecklistApp(directory, **kwargs))
+    print('Serving %s on http://%s:%d/' % (directory, host, port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python -m checklistdsl.wsgi DIRECTORY [PORT]')
+        sys.exit(1)
+    port = 8000
+    if len(sys.argv) > 2:
+        port = int(sys.argv[2])
+    serve(sys.argv[1], port=port)
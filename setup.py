@@ -11,6 +11,7 @@ setup(
     author_email='ntoll@ntoll.org',
     url='http://packages.python.org/checklistdsl',
     packages=['checklistdsl'],
+    scripts=['bin/checklistdsl'],
     license='MIT',
     classifiers=[
         'Development Status :: 1 - Planning',
@@ -0,0 +1,39 @@
+"""
+Ensures the memory used by the lexer and parser stays within budget.
+"""
+import unittest
+from checklistdsl import bench
+
+
+@unittest.skipIf(bench.tracemalloc is None, 'Needs tracemalloc')
+class TestMemory(unittest.TestCase):
+    """
+    Checks memory is measured correctly and is within the budgets.
+    """
+
+    def test_measure_memory(self):
+        result = bench.measure_memory(100)
+        self.assertEqual(100, result['lines'])
+        self.assertTrue(result['tokens'] > 0)
+        self.assertTrue(result['output'] > 0)
+        # The HTML itself is retained, so at least a byte per byte.
+        self.assertTrue(result['render_retained'] >= 1)
+        self.assertTrue(result['token_peak'] >= result['token_retained'])
+
+    def test_within_budget(self):
+        results = [bench.measure_memory(lines) for lines in (100, 2000)]
+        self.assertEqual([], bench.check_budgets(results))
+
+
+class TestCheckBudgets(unittest.TestCase):
+    """
+    Checks results over budget are reported.
+    """
+
+    def test_over_budget(self):
+        result = {'lines': 10, 'token_retained': 250.0, 'token_peak': 1.0,
+            'render_retained': 1.0, 'render_peak': 1.0}
+        self.assertEqual([(10, 'token_retained', 250.0, 200)],
+            bench.check_budgets([result]))
+        self.assertEqual([], bench.check_budgets([result],
+            {'token_peak': 2.0}))
@@ -0,0 +1,81 @@
+"""
+Ensures the token cache and concurrent rendering helper work as expected.
+"""
+import unittest
+from checklistdsl.cache import TokenCache, render_forms
+from checklistdsl.parse import get_form
+
+
+SOURCE = """= A Heading =
+
+[] {doctor} Item 1
+() Item 2
+() Item 3
+"""
+
+
+class TestTokenCache(unittest.TestCase):
+    """
+    Checks the TokenCache class works correctly.
+    """
+
+    def test_caches_tokens(self):
+        """
+        The same tuple of tokens is returned for the same source.
+        """
+        cache = TokenCache()
+        tokens = cache.get_tokens(SOURCE)
+        self.assertEqual(tuple, type(tokens))
+        self.assertEqual(4, len(tokens))
+        self.assertTrue(tokens is cache.get_tokens(SOURCE))
+        self.assertEqual(1, len(cache))
+
+    def test_explicit_key(self):
+        """
+        Entries may be stored under an explicit key and invalidated.
+        """
+        cache = TokenCache()
+        cache.get_tokens(SOURCE, key='foo.chkl')
+        self.assertTrue('foo.chkl' in cache)
+        cache.invalidate('foo.chkl')
+        self.assertFalse('foo.chkl' in cache)
+
+    def test_clear(self):
+        """
+        Clearing the cache removes all entries.
+        """
+        cache = TokenCache()
+        cache.get_tokens(SOURCE)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class TestRenderForms(unittest.TestCase):
+    """
+    Checks the render_forms function works correctly.
+    """
+
+    def test_renders_in_order(self):
+        """
+        Forms are rendered concurrently but returned in the order of the jobs.
+        """
+        cache = TokenCache()
+        jobs = [(SOURCE, {'form_id': 'form%d' % i}) for i in range(20)]
+        result = render_forms(cache, jobs, 4)
+        self.assertEqual(20, len(result))
+        for i, html in enumerate(result):
+            self.assertTrue(html.startswith('<form id="form%d"' % i))
+        # All the jobs shared the one cached entry.
+        self.assertEqual(1, len(cache))
+
+    def test_shared_tokens_unchanged(self):
+        """
+        Rendering doesn't change the shared tokens (e.g. a deep heading
+        stays deep).
+        """
+        cache = TokenCache()
+        source = '======== Deep ========'
+        tokens = cache.get_tokens(source)
+        render_forms(cache, [(source, {'form_id': 'a'})] * 8)
+        self.assertEqual(8, tokens[0].size)
+        self.assertTrue('<h6>Deep</h6>' in get_form(tokens, 'a'))
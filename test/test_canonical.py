@@ -0,0 +1,157 @@
+"""
+Ensures checklists are put into their canonical form correctly.
+"""
+import unittest
+from checklistdsl.lex import Token, get_tokens
+from checklistdsl.cache import TokenCache
+from checklistdsl.differential import generate_corpus, fuzz_corpus
+from checklistdsl.canonical import (canonical_token, format_token,
+    format_tokens, canonicalize, canonical_hash, CanonicalStore)
+
+
+ORIGINAL = """= Heading =
+[] {doctor, nurse} Item
+---
+Some text
+"""
+
+COSMETIC = """
+
+=Heading====
+  // A comment
+[]   {NURSE,Doctor}   Item
+---------
+   Some text
+"""
+
+
+class TestFormat(unittest.TestCase):
+    """
+    Checks tokens are formatted correctly.
+    """
+
+    def test_heading(self):
+        self.assertEqual('== Title ==',
+            format_token(Token('HEADING', 'Title', size=2)))
+        self.assertEqual('====== Title ======',
+            format_token(Token('HEADING', 'Title', size=9)))
+        # No text, so the value is the whole line.
+        self.assertEqual('= =', format_token(Token('HEADING', '= =')))
+
+    def test_items(self):
+        self.assertEqual('[] {a, b} Item',
+            format_token(Token('AND_ITEM', 'Item', roles=['b', 'a'])))
+        self.assertEqual('() Choice',
+            format_token(Token('OR_ITEM', 'Choice')))
+        # A tab keeps a leading brace from being taken for roles.
+        self.assertEqual('[]\t{x} Foo',
+            format_token(Token('AND_ITEM', '{x} Foo')))
+
+    def test_break_and_text(self):
+        self.assertEqual('---', format_token(Token('BREAK', '-----')))
+        self.assertEqual('Some text', format_token(Token('TEXT',
+            'Some text')))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, format_token, Token('FOO', 'bar'))
+
+    def test_canonical_token(self):
+        self.assertEqual(Token('HEADING', 'x', size=6),
+            canonical_token(Token('HEADING', 'x', size=7)))
+        self.assertEqual(Token('OR_ITEM', 'x', roles=['a', 'b']),
+            canonical_token(Token('OR_ITEM', 'x', roles=['b', 'a'])))
+        self.assertEqual(Token('BREAK', b'---'),
+            canonical_token(Token('BREAK', b'-----')))
+        token = Token('TEXT', 'x')
+        self.assertTrue(token is canonical_token(token))
+
+    def test_format_tokens(self):
+        self.assertEqual(ORIGINAL, format_tokens(get_tokens(ORIGINAL)))
+        self.assertEqual(ORIGINAL.encode('utf-8'),
+            format_tokens(get_tokens(ORIGINAL.encode('utf-8'))))
+        self.assertEqual('', format_tokens([]))
+
+    def test_round_trip(self):
+        """
+        Lexing the canonical source gives the canonical tokens, whatever the
+        source.
+        """
+        extra = ['[]\t{x} Foo', '() {} {x} Foo', '[] {x Foo', '[] {a} Foo']
+        for source in generate_corpus(300) + fuzz_corpus(500) + extra:
+            for data in (source, source.encode('utf-8')):
+                tokens = get_tokens(data)
+                canonical = format_tokens(tokens)
+                self.assertEqual([canonical_token(token)
+                    for token in tokens], get_tokens(canonical))
+                self.assertEqual(canonical, canonicalize(canonical))
+
+    def test_invalid_utf8(self):
+        """
+        Bytes that aren't valid UTF-8 are kept as they are.
+        """
+        source = b'= caf\xe9 =\n[] {\xff} tea\xe9'
+        self.assertEqual(source + b'\n', format_tokens(get_tokens(source)))
+        self.assertNotEqual(canonical_hash(source),
+            canonical_hash(b'= caf\xe8 =\n[] {\xff} tea\xe9'))
+
+
+class TestCanonicalHash(unittest.TestCase):
+    """
+    Checks cosmetic differences don't change the hash.
+    """
+
+    def test_cosmetic(self):
+        self.assertEqual(ORIGINAL, canonicalize(COSMETIC))
+        self.assertEqual(canonical_hash(ORIGINAL), canonical_hash(COSMETIC))
+
+    def test_text_and_bytes(self):
+        self.assertEqual(canonical_hash(ORIGINAL),
+            canonical_hash(ORIGINAL.encode('utf-8')))
+
+    def test_meaningful(self):
+        self.assertNotEqual(canonical_hash(ORIGINAL),
+            canonical_hash(ORIGINAL.replace('Item', 'item')))
+        self.assertNotEqual(canonical_hash(ORIGINAL),
+            canonical_hash(ORIGINAL.replace('= Heading =', '== Heading ==')))
+
+
+class TestCanonicalStore(unittest.TestCase):
+    """
+    Checks the CanonicalStore class works correctly.
+    """
+
+    def test_dedupes(self):
+        store = CanonicalStore()
+        first = store.add('first', ORIGINAL)
+        second = store.add('second', COSMETIC)
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(store))
+        self.assertTrue('second' in store)
+        self.assertEqual(ORIGINAL, store.get_source('second'))
+        tokens = store.get_tokens('first')
+        self.assertTrue(tokens is store.get_tokens('second'))
+        self.assertEqual(1, len(store.tokens))
+
+    def test_given_cache(self):
+        """
+        An empty TokenCache passed in is used (not replaced).
+        """
+        tokens = TokenCache()
+        store = CanonicalStore(tokens=tokens)
+        self.assertTrue(store.tokens is tokens)
+        store.add('first', ORIGINAL)
+        store.get_tokens('first')
+        self.assertEqual(1, len(tokens))
+
+    def test_replace_and_remove(self):
+        store = CanonicalStore()
+        store.add('first', ORIGINAL)
+        store.add('second', ORIGINAL)
+        store.add('first', '[] Something else')
+        self.assertEqual(2, len(store))
+        store.get_tokens('first')
+        store.remove('first')
+        self.assertEqual(1, len(store))
+        self.assertEqual(0, len(store.tokens))
+        self.assertEqual(canonical_hash(ORIGINAL), store.get_hash('second'))
+        self.assertRaises(KeyError, store.get_source, 'first')
@@ -0,0 +1,129 @@
+"""
+Ensures the checklistdsl command works correctly.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from checklistdsl import cli
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import FRAGMENTS, get_form
+
+
+SOURCE = b"""= Heading =
+// A comment
+
+[] {nurse} Item 1
+[] Item 2
+() Choice 1
+Some text
+"""
+
+
+class TestProfile(unittest.TestCase):
+    """
+    Checks checklists are profiled correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.chkl')
+        with open(self.path, 'wb') as output:
+            output.write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile_lines(self):
+        lines = cli.profile_lines(SOURCE, repeat=1)
+        self.assertEqual([1, 2, 4, 5, 6, 7], [line['line'] for line in lines])
+        self.assertEqual(['HEADING', 'COMMENT', 'AND_ITEM', 'AND_ITEM',
+            'OR_ITEM', 'TEXT'], [line['type'] for line in lines])
+        self.assertEqual(r'\/\/(?P<value>.*)', lines[1]['pattern'])
+        # The dispatch table finds the right scanner first time.
+        self.assertEqual([1, 1, 1, 1, 1, 1], [line['tried'] for line in lines])
+        self.assertTrue(all(line['time'] >= 0 for line in lines))
+
+    def test_profile_lines_unmatched(self):
+        lines = cli.profile_lines('=\n--', repeat=1)
+        self.assertEqual([None, 'TEXT'], [line['type'] for line in lines])
+        self.assertEqual([None, r'(?P<value>[^=\/\[\(].*)'],
+            [line['pattern'] for line in lines])
+        self.assertEqual([2, 2], [line['tried'] for line in lines])
+
+    def test_profile_lines_unicode_whitespace(self):
+        """
+        Lines are stripped of non-ASCII whitespace as they are by the lexer.
+        """
+        source = u'\u2003[] Item\n\u00a0'
+        for data in (source, source.encode('utf-8')):
+            lines = cli.profile_lines(data, repeat=1)
+            self.assertEqual(['AND_ITEM'], [line['type'] for line in lines])
+
+    def test_profile_output(self):
+        tokens = get_tokens(SOURCE)
+        output = cli.profile_output(tokens)
+        self.assertEqual(set(['HEADING', 'AND_ITEM', 'OR_ITEM', 'TEXT',
+            'FORM']), set(output))
+        self.assertEqual(len(get_form(tokens, 'profile')),
+            sum(output.values()))
+        # The radio button is named with a uuid, as it is by get_form.
+        html = get_form(tokens, 'profile')
+        start = html.index(b'<label class="radio">')
+        end = html.index(b'<br/>', start) + len(b'<br/>')
+        self.assertEqual(end - start, output['OR_ITEM'])
+
+    def test_profile(self):
+        report = cli.profile(self.path, top=3, repeat=1)
+        self.assertEqual(len(SOURCE), report['bytes'])
+        self.assertEqual(5, report['tokens'])
+        self.assertEqual(2, report['token_types']['AND_ITEM'])
+        self.assertEqual(set(['read', 'lex', 'render', 'render_warm']),
+            set(report['stages']))
+        self.assertEqual(3, len(report['slowest_lines']))
+        self.assertEqual(3, len(report['functions']))
+        if cli.tracemalloc is None:
+            self.assertEqual(None, report['allocations'])
+        else:
+            self.assertTrue(report['allocations']['peak'] > 0)
+        text = cli.format_report(report)
+        self.assertIn('Slowest lines:', text)
+        self.assertIn('render_warm', text)
+        self.assertIn('AND_ITEM', text)
+
+    def test_profile_functions_cold(self):
+        """
+        Rendering is profiled from an empty fragment cache, so the fragments
+        are rendered even if they were already cached.
+        """
+        get_form(get_tokens(SOURCE), 'profile')
+        cli.profile_functions(SOURCE)
+        self.assertEqual(5, FRAGMENTS.misses)
+
+    def run_main(self, argv):
+        """
+        Return the exit status and output of the command.
+        """
+        output = tempfile.TemporaryFile('w+')
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            status = cli.main(argv)
+        finally:
+            sys.stdout = stdout
+        output.seek(0)
+        return status, output.read()
+
+    def test_main_text(self):
+        status, output = self.run_main(['profile', self.path, '--repeat',
+            '1'])
+        self.assertEqual(0, status)
+        self.assertIn('Stages:', output)
+
+    def test_main_json(self):
+        status, output = self.run_main(['profile', self.path, '--json',
+            '--repeat', '1'])
+        self.assertEqual(0, status)
+        self.assertEqual(5, json.loads(output)['tokens'])
@@ -0,0 +1,117 @@
+"""
+Ensures the pre-compressed form variants work as expected.
+"""
+import io
+import gzip
+import unittest
+import zlib
+from checklistdsl.compress import (CompressedForm, compress_form,
+    decompress_zdict, HAS_ZDICT, ZDICT)
+from checklistdsl.cache import RenderCache
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+
+
+SOURCE = '\n'.join(['[] {doctor} Item %d' % i for i in range(50)] +
+    ['() Choice %d' % i for i in range(10)])
+
+
+class TestCompressForm(unittest.TestCase):
+    """
+    Checks the compress_form function works correctly.
+    """
+
+    def test_variants_decompress(self):
+        """
+        Each of the variants decompresses to the original HTML.
+        """
+        html = get_form(get_tokens(SOURCE), 'test')
+        result = compress_form(html)
+        self.assertEqual(html.encode('utf-8'), result.html)
+        gzip_file = gzip.GzipFile(fileobj=io.BytesIO(result.gzip))
+        self.assertEqual(result.html, gzip_file.read())
+        self.assertEqual(result.html, zlib.decompress(result.deflate))
+        self.assertTrue(len(result.gzip) < len(result.html))
+        if HAS_ZDICT:
+            self.assertEqual(result.html, decompress_zdict(result.zdict))
+            self.assertTrue(len(result.zdict) <= len(result.deflate))
+        else:
+            self.assertEqual(None, result.zdict)
+
+    def test_deterministic(self):
+        """
+        The same HTML always compresses to the same bytes.
+        """
+        html = b'<form></form>'
+        self.assertEqual(compress_form(html).gzip, compress_form(html).gzip)
+
+    def test_zdict_contains_templates(self):
+        """
+        The preset dictionary is made from the static parts of the templates.
+        """
+        self.assertTrue(b'<label class="checkbox">' in ZDICT)
+        self.assertFalse(b'%(' in ZDICT)
+
+
+class TestCompressedForm(unittest.TestCase):
+    """
+    Checks content negotiation for compressed forms.
+    """
+
+    def setUp(self):
+        self.form = CompressedForm(b'html', b'gzip', b'deflate')
+
+    def test_negotiate_gzip(self):
+        self.assertEqual(('gzip', b'gzip'),
+            self.form.negotiate('deflate, gzip'))
+        self.assertEqual(('gzip', b'gzip'),
+            self.form.negotiate('deflate;q=0.5, gzip;q=0.8'))
+
+    def test_negotiate_quality(self):
+        """
+        The coding with the highest quality is used.
+        """
+        self.assertEqual(('deflate', b'deflate'),
+            self.form.negotiate('deflate, gzip;q=0.5'))
+
+    def test_negotiate_star(self):
+        """
+        "*" never picks a coding refused with q=0.
+        """
+        self.assertEqual(('gzip', b'gzip'), self.form.negotiate('*'))
+        self.assertEqual(('deflate', b'deflate'),
+            self.form.negotiate('*, gzip;q=0'))
+        self.assertEqual(('deflate', b'deflate'),
+            self.form.negotiate('gzip;q=0.2, *;q=0.5'))
+        self.assertEqual((None, b'html'),
+            self.form.negotiate('*;q=0, identity'))
+        self.assertEqual((None, b'html'),
+            self.form.negotiate('*, gzip;q=0, deflate;q=0'))
+
+    def test_negotiate_deflate(self):
+        self.assertEqual(('deflate', b'deflate'),
+            self.form.negotiate('gzip;q=0, deflate'))
+
+    def test_negotiate_identity(self):
+        self.assertEqual((None, b'html'), self.form.negotiate(None))
+        self.assertEqual((None, b'html'), self.form.negotiate('br'))
+
+
+class TestRenderCache(unittest.TestCase):
+    """
+    Checks the RenderCache class works correctly.
+    """
+
+    def test_caches_compressed_forms(self):
+        """
+        The same CompressedForm is returned for the same source and arguments.
+        """
+        cache = RenderCache()
+        form = cache.get_form(SOURCE, 'test', method='get')
+        self.assertTrue(form is cache.get_form(SOURCE, 'test', method='get'))
+        self.assertFalse(form is cache.get_form(SOURCE, 'other'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, len(cache.tokens))
+        self.assertTrue(form.html.startswith(b'<form id="test"'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
@@ -0,0 +1,97 @@
+"""
+Ensures the differences between versions of a checklist are found correctly.
+"""
+import unittest
+from checklistdsl.diff import (Change, ADDED, REMOVED, MODIFIED, diff_tokens,
+    diff_history, diff_corpus)
+from checklistdsl.lex import Token, get_tokens
+
+
+OLD = """= Heading =
+// A comment
+[] {doctor} Item 1
+[] Item 2
+() Choice 1
+() Choice 2
+"""
+
+
+class TestDiffTokens(unittest.TestCase):
+    """
+    Checks the diff_tokens function works correctly.
+    """
+
+    def test_no_changes(self):
+        """
+        Comments and whitespace aren't changes.
+        """
+        new = OLD.replace('// A comment', '\n  // Another comment  \n')
+        self.assertEqual([], diff_tokens(get_tokens(OLD), get_tokens(new)))
+
+    def test_added(self):
+        new = OLD.replace('[] Item 2', '[] Item 2\n[] Item 3')
+        result = diff_tokens(get_tokens(OLD), get_tokens(new))
+        self.assertEqual([Change(ADDED, None, 3, None,
+            Token('AND_ITEM', 'Item 3'))], result)
+
+    def test_removed(self):
+        new = OLD.replace('= Heading =', '')
+        result = diff_tokens(get_tokens(OLD), get_tokens(new))
+        self.assertEqual([Change(REMOVED, 0, None,
+            Token('HEADING', 'Heading', size=1), None)], result)
+
+    def test_modified(self):
+        new = OLD.replace('{doctor}', '{doctor, nurse}').replace(
+            '= Heading =', '== Heading ==').replace('Choice 2', 'Choice 3')
+        result = diff_tokens(get_tokens(OLD), get_tokens(new))
+        self.assertEqual(3, len(result))
+        self.assertEqual([MODIFIED] * 3, [c.kind for c in result])
+        self.assertEqual(('size', ), result[0].fields)
+        self.assertEqual(('roles', ), result[1].fields)
+        self.assertEqual(1, result[1].old_index)
+        self.assertEqual(('doctor', 'nurse'), result[1].new.roles)
+        self.assertEqual(('value', ), result[2].fields)
+
+    def test_type_change(self):
+        """
+        A token replaced by one of a different type is removed and added.
+        """
+        new = OLD.replace('[] Item 2', '() Item 2')
+        result = diff_tokens(get_tokens(OLD), get_tokens(new))
+        self.assertEqual([REMOVED, ADDED], [c.kind for c in result])
+        self.assertEqual(2, result[0].old_index)
+        self.assertEqual(2, result[1].new_index)
+
+    def test_uneven_replace(self):
+        old = [Token('TEXT', 'a'), Token('TEXT', 'b'), Token('TEXT', 'z')]
+        new = [Token('TEXT', 'c'), Token('TEXT', 'z')]
+        result = diff_tokens(old, new)
+        self.assertEqual([MODIFIED, REMOVED], [c.kind for c in result])
+        self.assertEqual((1, None), (result[1].old_index, result[1].new_index))
+
+    def test_repr(self):
+        change = Change(ADDED, None, 3, None, Token('TEXT', 'a'))
+        self.assertEqual('+3 TEXT: "a"', repr(change))
+
+
+class TestDiffHistory(unittest.TestCase):
+    """
+    Checks the diff_history and diff_corpus functions work correctly.
+    """
+
+    def test_diff_history(self):
+        versions = [get_tokens(OLD), get_tokens(OLD + '\n---'),
+            get_tokens(OLD)]
+        result = diff_history(versions)
+        self.assertEqual(2, len(result))
+        self.assertEqual(ADDED, result[0][0].kind)
+        self.assertEqual(REMOVED, result[1][0].kind)
+
+    def test_diff_corpus(self):
+        histories = {
+            'a': [get_tokens(OLD), get_tokens(OLD)],
+            'b': [get_tokens(OLD), get_tokens('[] {doctor} Item 1')],
+        }
+        result = diff_corpus(histories)
+        self.assertEqual([[]], result['a'])
+        self.assertEqual([REMOVED] * 4, [c.kind for c in result['b'][0]])
@@ -0,0 +1,122 @@
+"""
+Ensures the fast engine agrees with the reference engine and that the
+differential harness reports divergences correctly.
+"""
+import sys
+import tempfile
+import unittest
+from checklistdsl import differential
+from checklistdsl.differential import (Divergence, compare, normalise, run,
+    generate_corpus, fuzz_corpus)
+from checklistdsl.lex import Token
+from checklistdsl import reference
+
+
+class TestNormalise(unittest.TestCase):
+    """
+    Checks random names are replaced consistently.
+    """
+
+    def test_normalise(self):
+        first = '12345678-1234-1234-1234-123456789abc'
+        second = 'abcdef12-1234-1234-1234-123456789abc'
+        html = '%s %s %s' % (first, second, first)
+        self.assertEqual('uuid-1 uuid-2 uuid-1', normalise(html))
+        self.assertEqual(b'uuid-1 uuid-2 uuid-1',
+            normalise(html.encode('ascii')))
+
+
+class TestEnginesAgree(unittest.TestCase):
+    """
+    The fast engine produces the same results as the reference engine.
+    """
+
+    def test_generated(self):
+        sources = generate_corpus(300)
+        self.assertEqual(None, run(sources))
+        self.assertEqual(None, run(sources, form_id='My Form',
+            csrf_token='token', action='/'))
+
+    def test_fuzzed(self):
+        self.assertEqual(None, run(fuzz_corpus(1000)))
+
+    def test_corpora_are_deterministic(self):
+        self.assertEqual(generate_corpus(10), generate_corpus(10))
+        self.assertNotEqual(fuzz_corpus(10), fuzz_corpus(10, seed=1))
+
+
+class TestCompare(unittest.TestCase):
+    """
+    Checks divergences are found and reported.
+    """
+
+    def test_token_divergence(self):
+        original = reference.get_tokens
+
+        def wrong(data):
+            tokens = original(data)
+            tokens[1] = Token('TEXT', 'wrong')
+            return tokens
+        reference.get_tokens = wrong
+        try:
+            divergence = compare('[] a\n[] b\n[] c')
+        finally:
+            reference.get_tokens = original
+        self.assertEqual('tokens', divergence.stage)
+        self.assertEqual(1, divergence.index)
+        self.assertEqual(Token('TEXT', 'wrong'), divergence.reference)
+        self.assertEqual(Token('AND_ITEM', 'b'), divergence.fast)
+        self.assertIn('tokens at 1', str(divergence))
+
+    def test_form_divergence(self):
+        original = reference.get_form
+
+        def wrong(tokens, *args, **kwargs):
+            return original(tokens, *args, **kwargs).replace('<hr/>', '<hr>')
+        reference.get_form = wrong
+        try:
+            divergence = run(['= a =\n---'])
+        finally:
+            reference.get_form = original
+        self.assertTrue(isinstance(divergence, Divergence))
+        self.assertEqual('form', divergence.stage)
+        self.assertIn('<hr>', divergence.reference)
+        self.assertIn('<hr/>', divergence.fast)
+
+    def test_errors_reported(self):
+        """
+        An engine raising an exception is a divergence, even if the other
+        raises the same one.
+        """
+        original = differential.get_form
+
+        def broken(*args, **kwargs):
+            raise ValueError('broken')
+        differential.get_form = broken
+        try:
+            divergence = compare('[] a')
+        finally:
+            differential.get_form = original
+        self.assertEqual('form', divergence.stage)
+        self.assertEqual('raised ValueError', divergence.reference)
+        self.assertEqual('raised ValueError', divergence.fast)
+
+    def test_heading_without_text(self):
+        """
+        A heading without any text is rendered as it was typed.
+        """
+        self.assertEqual(None, compare('= ='))
+        self.assertIn('<p class="help-block">= =</p>',
+            reference.get_form(reference.get_tokens('= =')))
+
+    def test_main(self):
+        output = tempfile.TemporaryFile('w+')
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            differential.main(['20'])
+        finally:
+            sys.stdout = stdout
+        output.seek(0)
+        self.assertIn('The engines agree on all 40 checklists.',
+            output.read())
@@ -0,0 +1,99 @@
+"""
+Ensures fingerprints and ETags are computed correctly from tokens.
+"""
+import unittest
+from checklistdsl.fingerprint import get_fingerprint, get_etag, etag_matches
+from checklistdsl.lex import Token, get_tokens
+
+
+SOURCE = u"""= Caf\u00e9 =
+// A comment
+[] {doctor, nurse} Item 1
+() Choice 1
+() Choice 2
+---
+Some text
+"""
+
+
+class TestGetFingerprint(unittest.TestCase):
+    """
+    Checks the get_fingerprint function works correctly.
+    """
+
+    def test_stable(self):
+        """
+        The same tokens and options always give the same fingerprint.
+        """
+        self.assertEqual(get_fingerprint(get_tokens(SOURCE), 'test'),
+            get_fingerprint(get_tokens(SOURCE), 'test'))
+
+    def test_ignores_comments_and_whitespace(self):
+        """
+        Changes to the source that don't change the tokens don't change the
+        fingerprint.
+        """
+        other = SOURCE.replace('// A comment', '\n\n  // Another comment')
+        self.assertEqual(get_fingerprint(get_tokens(SOURCE)),
+            get_fingerprint(get_tokens(other)))
+
+    def test_text_and_bytes_match(self):
+        """
+        Tokens lexed from text and UTF-8 bytes have the same fingerprint.
+        """
+        self.assertEqual(get_fingerprint(get_tokens(SOURCE)),
+            get_fingerprint(get_tokens(SOURCE.encode('utf-8'))))
+
+    def test_changes_with_tokens(self):
+        """
+        Any change to a token's type, value, roles or size changes the
+        fingerprint.
+        """
+        base = get_fingerprint([Token('AND_ITEM', 'a', roles=['b'])])
+        others = [
+            [Token('OR_ITEM', 'a', roles=['b'])],
+            [Token('AND_ITEM', 'b', roles=['b'])],
+            [Token('AND_ITEM', 'a', roles=['c'])],
+            [Token('AND_ITEM', 'a')],
+            [Token('AND_ITEM', 'a', roles=['b', ''])],
+            [Token('AND_ITEM', 'a', roles=['b'], size=1)],
+        ]
+        for tokens in others:
+            self.assertNotEqual(base, get_fingerprint(tokens), tokens)
+
+    def test_heading_clamped(self):
+        """
+        Headings that render the same have the same fingerprint.
+        """
+        self.assertEqual(get_fingerprint([Token('HEADING', 'a', size=6)]),
+            get_fingerprint([Token('HEADING', 'a', size=9)]))
+
+    def test_changes_with_options(self):
+        """
+        The form_id and form attributes are part of the fingerprint.
+        """
+        tokens = get_tokens(SOURCE)
+        base = get_fingerprint(tokens, 'test')
+        self.assertNotEqual(base, get_fingerprint(tokens, 'other'))
+        self.assertNotEqual(base,
+            get_fingerprint(tokens, 'test', method='get'))
+        self.assertEqual(base, get_fingerprint(tokens, 'Test!'))
+
+
+class TestETag(unittest.TestCase):
+    """
+    Checks ETags are created and matched correctly.
+    """
+
+    def test_get_etag(self):
+        tokens = get_tokens(SOURCE)
+        etag = get_etag(tokens)
+        self.assertEqual('W/"%s"' % get_fingerprint(tokens), etag)
+
+    def test_etag_matches(self):
+        etag = 'W/"abc"'
+        self.assertTrue(etag_matches('"abc"', etag))
+        self.assertTrue(etag_matches('"xyz", W/"abc"', etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches('"xyz"', etag))
+        self.assertFalse(etag_matches(None, etag))
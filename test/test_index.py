@@ -0,0 +1,199 @@
+"""
+Ensures the inverted index of a corpus of checklists works correctly.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from checklistdsl.lex import Token, get_tokens
+from checklistdsl.index import CorpusIndex, get_terms, DOCUMENT
+
+
+THEATRE = """= Before Anaesthesia =
+[] {anaesthetist} Check the patient's allergies.
+[] {anaesthetist, nurse} Confirm the site.
+() {surgeon} Allergy checked
+"""
+
+WARD = """= Allergy Review =
+[] {nurse} Record any allergy.
+[] {anaesthetist} Review the airway.
+"""
+
+
+class TestGetTerms(unittest.TestCase):
+    """
+    Checks tokens are indexed under the right terms.
+    """
+
+    def test_item(self):
+        token = Token('AND_ITEM', 'Check the Allergy', ['doctor', 'nurse'])
+        self.assertEqual(set(['type:AND_ITEM', 'role:doctor', 'role:nurse',
+            'text:check', 'text:the', 'text:allergy']), get_terms(token))
+
+    def test_heading(self):
+        token = Token('HEADING', 'Consent', size=1)
+        self.assertEqual(set(['type:HEADING', 'heading:consent']),
+            get_terms(token))
+
+    def test_bytes(self):
+        token = get_tokens(b'[] {doctor} Item')[0]
+        self.assertEqual(set(['type:AND_ITEM', 'role:doctor', 'text:item']),
+            get_terms(token))
+
+    def test_non_ascii_role(self):
+        """
+        Roles are lower cased whether the tokens are text or bytes.
+        """
+        expected = set([u'type:AND_ITEM', u'role:\u00e9quipe', u'text:item'])
+        token = Token('AND_ITEM', b'Item', [u'\u00c9QUIPE'.encode('utf-8')])
+        self.assertEqual(expected, get_terms(token))
+        source = u'[] {\u00c9QUIPE} Item'
+        self.assertEqual(expected, get_terms(get_tokens(source)[0]))
+        self.assertEqual(expected,
+            get_terms(get_tokens(source.encode('utf-8'))[0]))
+
+
+class TestCorpusIndex(unittest.TestCase):
+    """
+    Checks the CorpusIndex class works correctly.
+    """
+
+    def setUp(self):
+        self.index = CorpusIndex()
+        self.index.add('theatre', get_tokens(THEATRE))
+        self.index.add('ward', get_tokens(WARD))
+
+    def test_token_scope(self):
+        """
+        By default the clauses must all match the same token.
+        """
+        result = self.index.search('role:anaesthetist text:allergies')
+        self.assertEqual({'theatre': [1]}, result)
+        # The ward mentions an allergy, but not in the anaesthetist's item.
+        self.assertEqual({}, self.index.search(
+            'role:anaesthetist text:allergy'))
+
+    def test_document_scope(self):
+        self.assertEqual(['ward'], self.index.search(
+            'role:anaesthetist text:airway', scope=DOCUMENT))
+        self.assertEqual(['theatre', 'ward'], self.index.search(
+            'role:anaesthetist text:allergy', scope=DOCUMENT))
+        self.assertEqual(['theatre', 'ward'], self.index.search(
+            'role:anaesthetist', scope=DOCUMENT))
+
+    def test_or(self):
+        result = self.index.search('text:allergy|text:allergies')
+        self.assertEqual({'theatre': [1, 3], 'ward': [1]}, result)
+
+    def test_not(self):
+        self.assertEqual({'theatre': [1, 2], 'ward': [2]},
+            self.index.search('role:anaesthetist -type:OR_ITEM'))
+        self.assertEqual({'theatre': [0, 3], 'ward': [0, 1]},
+            self.index.search('-role:anaesthetist'))
+        self.assertEqual(['theatre'], self.index.search(
+            'type:AND_ITEM -heading:allergy', scope=DOCUMENT))
+
+    def test_case_insensitive(self):
+        self.assertEqual({'ward': [0]}, self.index.search('HEADING:Allergy'))
+        self.assertEqual({}, self.index.search('type:heading'))
+
+    def test_empty_query(self):
+        self.assertRaises(ValueError, self.index.search, ' ')
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, self.index.search, 'allergy')
+        self.assertRaises(ValueError, self.index.search,
+            'text:allergy|allergies')
+        self.assertRaises(ValueError, self.index.search, '-colour:red')
+
+    def test_replace_and_remove(self):
+        self.index.add('ward', get_tokens('[] Something else'))
+        self.assertEqual(2, len(self.index))
+        self.assertEqual({}, self.index.search('heading:allergy'))
+        self.index.remove('ward')
+        self.index.remove('missing')
+        self.assertFalse('ward' in self.index)
+        self.assertFalse('text:something' in self.index.postings)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'index.json')
+            self.index.save(path)
+            loaded = CorpusIndex.load(path)
+            query = 'role:anaesthetist text:allergies'
+            self.assertEqual(self.index.search(query), loaded.search(query))
+            with open(path, 'w') as output:
+                output.write('[]')
+            self.assertRaises(ValueError, CorpusIndex.load, path)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestUpdateDirectory(unittest.TestCase):
+    """
+    Checks an index is brought up to date with a directory correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('theatre', THEATRE)
+        self.write('ward', WARD)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        path = os.path.join(self.directory, name + '.chkl')
+        with open(path, 'w') as output:
+            output.write(source)
+        # Make sure the modification time changes.
+        stamp = time.time() + len(source)
+        os.utime(path, (stamp, stamp))
+
+    def test_update_directory(self):
+        index = CorpusIndex()
+        self.assertEqual((['theatre', 'ward'], []),
+            index.update_directory(self.directory))
+        self.assertEqual(([], []), index.update_directory(self.directory))
+        self.write('ward', '[] {porter} Move the bed')
+        os.remove(os.path.join(self.directory, 'theatre.chkl'))
+        self.assertEqual((['ward'], ['theatre']),
+            index.update_directory(self.directory))
+        self.assertEqual({'ward': [0]}, index.search('role:porter'))
+
+    def test_update_directory_non_ascii_role(self):
+        path = os.path.join(self.directory, 'team.chkl')
+        with open(path, 'wb') as output:
+            output.write(u'[] {\u00c9QUIPE} Item'.encode('utf-8'))
+        index = CorpusIndex()
+        index.update_directory(self.directory)
+        self.assertEqual({'team': [0]}, index.search(u'role:\u00e9quipe'))
+        self.assertEqual({'team': [0]}, index.search(u'role:\u00c9quipe'))
+
+    def test_update_directory_invalid_utf8(self):
+        """
+        Bytes that aren't valid UTF-8 are replaced rather than raising an
+        error.
+        """
+        path = os.path.join(self.directory, 'latin.chkl')
+        with open(path, 'wb') as output:
+            output.write(b'[] {\xc9quipe} Caf\xe9 tea')
+        index = CorpusIndex()
+        self.assertEqual((['latin', 'theatre', 'ward'], []),
+            index.update_directory(self.directory))
+        self.assertEqual({'latin': [0]}, index.search('text:tea'))
+        self.assertEqual({'latin': [0]}, index.search(u'role:\ufffdquipe'))
+
+    def test_update_after_load(self):
+        """
+        A loaded index doesn't re-index unchanged files.
+        """
+        index = CorpusIndex()
+        index.update_directory(self.directory)
+        path = os.path.join(self.directory, 'index.json')
+        index.save(path)
+        loaded = CorpusIndex.load(path)
+        self.assertEqual(([], []), loaded.update_directory(self.directory))
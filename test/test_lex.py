@@ -2,8 +2,12 @@
 Checks that the ChecklistLexer class works as expected. Mainly full of sanity
 checks to make sure I've got the regex correct.
 """
+import copy
+import pickle
 import unittest
 from checklistdsl.lex import Token, get_tokens
+from checklistdsl.bench import ADVERSARIAL, lexing_growth
+from checklistdsl.engine import REFERENCE
 
 
 class TestToken(unittest.TestCase):
@@ -32,7 +36,7 @@ class TestToken(unittest.TestCase):
         result = Token(token, value, roles)
         self.assertEqual(token, result.token)
         self.assertEqual(value, result.value)
-        self.assertEqual(roles, result.roles)
+        self.assertEqual(tuple(roles), result.roles)
 
     def test_instantiation_with_size(self):
         """
@@ -54,6 +58,37 @@ class TestToken(unittest.TestCase):
         result = repr(token)
         self.assertEqual('foo: "bar"', result)
 
+    def test_immutable(self):
+        """
+        Ensure a token's attributes cannot be changed or removed once it has
+        been created.
+        """
+        token = Token('HEADING', 'foo', size=7)
+        self.assertRaises(AttributeError, setattr, token, 'size', 6)
+        self.assertRaises(AttributeError, delattr, token, 'value')
+        self.assertRaises(AttributeError, setattr, token, 'bar', 1)
+        self.assertEqual(7, token.size)
+
+    def test_equality_and_hash(self):
+        """
+        Tokens with the same attributes are equal and hash the same.
+        """
+        token1 = Token('AND_ITEM', 'foo', roles=['doctor'])
+        token2 = Token('AND_ITEM', 'foo', roles=('doctor', ))
+        token3 = Token('AND_ITEM', 'foo')
+        self.assertEqual(token1, token2)
+        self.assertEqual(hash(token1), hash(token2))
+        self.assertNotEqual(token1, token3)
+
+    def test_copy_and_pickle(self):
+        """
+        Ensure immutable tokens can still be copied and pickled.
+        """
+        token = Token('AND_ITEM', 'foo', roles=['doctor'], size=None)
+        self.assertEqual(token, copy.copy(token))
+        self.assertEqual(token, copy.deepcopy(token))
+        self.assertEqual(token, pickle.loads(pickle.dumps(token, 2)))
+
 
 class TestGetTokens(unittest.TestCase):
     """
@@ -200,7 +235,7 @@ class TestGetTokens(unittest.TestCase):
             "Got the wrong number of tokens: %s" % tokens)
         self.assertEqual("AND_ITEM", tokens[0].token)
         self.assertEqual("An item", tokens[0].value)
-        self.assertEqual(['doctor', 'nurse'], tokens[0].roles)
+        self.assertEqual(('doctor', 'nurse'), tokens[0].roles)
         self.assertEqual("AND_ITEM", tokens[1].token)
         self.assertEqual("An item", tokens[1].value)
         self.assertEqual(None, tokens[1].roles)
@@ -228,7 +263,7 @@ class TestGetTokens(unittest.TestCase):
             "Got the wrong number of tokens: %s" % tokens)
         self.assertEqual("OR_ITEM", tokens[0].token)
         self.assertEqual("An item", tokens[0].value)
-        self.assertEqual(['doctor', 'nurse'], tokens[0].roles)
+        self.assertEqual(('doctor', 'nurse'), tokens[0].roles)
         self.assertEqual("OR_ITEM", tokens[1].token)
         self.assertEqual("An item", tokens[1].value)
         self.assertEqual(None, tokens[1].roles)
@@ -245,3 +280,123 @@ class TestGetTokens(unittest.TestCase):
         data = "---"
         tokens = get_tokens(data)
         self.assertEqual("BREAK", tokens[0].token)
+        # Anything else after the minus signs makes it TEXT
+        data = "--- x"
+        tokens = get_tokens(data)
+        self.assertEqual("TEXT", tokens[0].token)
+
+    def test_unmatched_lines_ignored(self):
+        """
+        Lines that start like a token but don't match it are ignored.
+        """
+        data = "=foo\n/foo\n[foo\n(foo"
+        tokens = get_tokens(data)
+        self.assertEqual([], tokens)
+
+    def test_empty_value(self):
+        """
+        Tokens without a value get the whole line as their value (and lose
+        their roles and size).
+        """
+        tokens = get_tokens("[] {doctor}\n=  =")
+        self.assertEqual(Token('AND_ITEM', '[] {doctor}'), tokens[0])
+        self.assertEqual(Token('HEADING', '=  ='), tokens[1])
+
+    def test_roles_to_last_brace(self):
+        """
+        Roles run from the opening brace to the last closing brace.
+        """
+        tokens = get_tokens("() {A} b {C} d")
+        self.assertEqual(('a b c', ), tokens[0].roles)
+        self.assertEqual('d', tokens[0].value)
+
+    def test_bytes(self):
+        """
+        UTF-8 encoded bytes are lexed without decoding and produce tokens with
+        bytes values and roles.
+        """
+        data = (u"= Caf\u00e9 =\n// comment\n[] {Doctor, nurse} " +
+            u"Item \u2713\n---")
+        tokens = get_tokens(data.encode('utf-8'))
+        self.assertEqual(3, len(tokens))
+        self.assertEqual('HEADING', tokens[0].token)
+        self.assertEqual(u'Caf\u00e9'.encode('utf-8'), tokens[0].value)
+        self.assertEqual(1, tokens[0].size)
+        self.assertEqual('AND_ITEM', tokens[1].token)
+        self.assertEqual(u'Item \u2713'.encode('utf-8'), tokens[1].value)
+        self.assertEqual((b'doctor', b'nurse'), tokens[1].roles)
+        self.assertEqual('BREAK', tokens[2].token)
+        self.assertEqual(b'---', tokens[2].value)
+
+    def test_bytes_roles(self):
+        """
+        Non-ASCII bytes roles are lower cased in the same way as text roles.
+        """
+        data = u'[] {\u00c9QUIPE, Nurse} Item\n() {\u00c9quipe} Choice'
+        for engine in (None, REFERENCE):
+            text = get_tokens(data, engine=engine)
+            encoded = get_tokens(data.encode('utf-8'), engine=engine)
+            self.assertEqual((u'\u00e9quipe', u'nurse'), text[0].roles)
+            for text_token, bytes_token in zip(text, encoded):
+                self.assertEqual(tuple(role.encode('utf-8')
+                    for role in text_token.roles), bytes_token.roles)
+        # Invalid UTF-8 is still lower cased for ASCII.
+        self.assertEqual((b'\xff\xfeab', ), get_tokens(
+            b'[] {\xff\xfeAB} Item')[0].roles)
+
+    def test_bytes_unicode_whitespace(self):
+        """
+        Non-ASCII whitespace is stripped from bytes lines, values and roles in
+        the same way as from text, so both produce the same tokens.
+        """
+        data = (u'\u3000= \u00a0Caf\u00e9\u2003 =\n\u2003[] Item\u00a0\n' +
+            u'\u00a0() {\u2003Nurse\u3000} \u2003Choice\u2003 \n' +
+            u'\u00a0\u3000\n\u2028Some text\u0085\n\u2003---')
+        for engine in (None, REFERENCE):
+            text = get_tokens(data, engine=engine)
+            encoded = get_tokens(data.encode('utf-8'), engine=engine)
+            self.assertEqual(['HEADING', 'AND_ITEM', 'OR_ITEM', 'TEXT',
+                'BREAK'], [token.token for token in text])
+            self.assertEqual(u'Caf\u00e9', text[0].value)
+            self.assertEqual(len(text), len(encoded))
+            for text_token, bytes_token in zip(text, encoded):
+                self.assertEqual(text_token.token, bytes_token.token)
+                self.assertEqual(text_token.value.encode('utf-8'),
+                    bytes_token.value)
+                self.assertEqual(text_token.size, bytes_token.size)
+                self.assertEqual(text_token.roles and tuple(
+                    role.encode('utf-8') for role in text_token.roles),
+                    bytes_token.roles)
+
+
+class TestLinearTime(unittest.TestCase):
+    """
+    Ensures lexing takes time linear in the size of the input for the worst
+    case checklists in the benchmark corpus.
+    """
+
+    def test_adversarial_corpus(self):
+        """
+        Lexing ten times the input takes roughly ten times as long (a
+        quadratic lexer would take a hundred times as long). The bound is
+        generous to allow for noisy timings.
+        """
+        for name in ADVERSARIAL:
+            growth = lexing_growth(name, 100000, 10)
+            self.assertTrue(growth < 40,
+                "Lexing %s grew by %.1fx for 10x the input" % (name, growth))
+
+    def test_adversarial_tokens(self):
+        """
+        Sanity check the tokens produced from the adversarial corpus.
+        """
+        tokens = get_tokens(ADVERSARIAL['many_braces'](1000))
+        self.assertEqual('AND_ITEM', tokens[0].token)
+        self.assertEqual(None, tokens[0].roles)
+        tokens = get_tokens(ADVERSARIAL['nested_braces'](1000))
+        self.assertEqual('OR_ITEM', tokens[0].token)
+        self.assertEqual('item', tokens[0].value)
+        tokens = get_tokens(ADVERSARIAL['deep_heading'](1000))
+        self.assertEqual([], tokens)
+        tokens = get_tokens(ADVERSARIAL['long_break'](1000))
+        self.assertEqual(['BREAK', 'TEXT'], [t.token for t in tokens])
@@ -0,0 +1,148 @@
+"""
+Ensures untrusted checklists are lexed and rendered within their limits.
+"""
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.limits import (Limits, LimitExceeded, Cost,
+    get_tokens_limited, get_form_limited, render_untrusted)
+
+
+SOURCE = """= Heading =
+// A comment
+
+[] {doctor, nurse} Item 1
+() Choice 1
+() Choice 2
+"""
+
+UNLIMITED = Limits(None, None, None, None, None, None)
+
+
+class TestGetTokensLimited(unittest.TestCase):
+    """
+    Checks the get_tokens_limited function works correctly.
+    """
+
+    def test_same_as_get_tokens(self):
+        expected = get_tokens(SOURCE.encode('utf-8'))
+        self.assertEqual(expected, get_tokens_limited(SOURCE, UNLIMITED))
+        self.assertEqual(expected, get_tokens_limited(
+            SOURCE.encode('utf-8'), Limits()))
+
+    def test_cost(self):
+        cost = Cost()
+        get_tokens_limited(SOURCE, Limits(), cost)
+        self.assertEqual(len(SOURCE), cost.bytes_in)
+        # Not including the empty piece after the last newline.
+        self.assertEqual(6, cost.lines)
+        self.assertEqual(4, cost.tokens)
+
+    def test_max_bytes(self):
+        try:
+            get_tokens_limited(SOURCE, Limits(max_bytes=10))
+        except LimitExceeded as ex:
+            self.assertEqual('max_bytes', ex.name)
+            self.assertEqual(10, ex.limit)
+            self.assertIn('10', str(ex))
+        else:
+            self.fail('LimitExceeded not raised')
+        self.assertTrue(issubclass(LimitExceeded, ValueError))
+
+    def test_max_bytes_encoded(self):
+        """
+        The limit is on the size of the UTF-8 encoding of text sources.
+        """
+        source = u'\u00e9' * 6
+        get_tokens_limited(source, Limits(max_bytes=12))
+        self.assertRaises(LimitExceeded, get_tokens_limited, source,
+            Limits(max_bytes=11))
+
+    def test_max_lines(self):
+        """
+        Lexing stops as soon as the line limit is passed.
+        """
+        cost = Cost()
+        source = '[] item\n' * 1000
+        self.assertRaises(LimitExceeded, get_tokens_limited, source,
+            Limits(max_lines=10), cost)
+        self.assertEqual(11, cost.lines)
+        self.assertEqual(10, cost.tokens)
+        # A trailing newline doesn't start another line.
+        cost = Cost()
+        get_tokens_limited('[] item\n' * 10, Limits(max_lines=10), cost)
+        self.assertEqual(10, cost.lines)
+
+    def test_max_line_length(self):
+        source = '[] ok\n' + '[] ' + 'x' * 100
+        get_tokens_limited(source, Limits(max_line_length=103))
+        try:
+            get_tokens_limited(source, Limits(max_line_length=102))
+        except LimitExceeded as ex:
+            self.assertEqual('max_line_length', ex.name)
+            self.assertIn('Line 2', str(ex))
+        else:
+            self.fail('LimitExceeded not raised')
+
+    def test_max_tokens(self):
+        source = '[] item\n// comment\n' * 10
+        get_tokens_limited(source, Limits(max_tokens=10))
+        self.assertRaises(LimitExceeded, get_tokens_limited, source,
+            Limits(max_tokens=9))
+
+    def test_max_roles(self):
+        source = '[] {a, b, c} item'
+        get_tokens_limited(source, Limits(max_roles=3))
+        self.assertRaises(LimitExceeded, get_tokens_limited, source,
+            Limits(max_roles=2))
+
+
+class TestGetFormLimited(unittest.TestCase):
+    """
+    Checks the get_form_limited function works correctly.
+    """
+
+    def normalise(self, html):
+        """
+        Replace the random names of radio button groups.
+        """
+        tokens = html.split(b'name="')
+        return b'name="'.join([tokens[0]] + [b'"'.join([b'x'] +
+            token.split(b'"')[1:]) for token in tokens[1:]])
+
+    def test_same_as_get_form(self):
+        tokens = get_tokens(SOURCE.encode('utf-8'))
+        cost = Cost()
+        html = get_form_limited(tokens, Limits(), cost, 'form', 'token',
+            action='/submit')
+        expected = get_form(tokens, 'form', 'token', action='/submit')
+        self.assertEqual(self.normalise(expected), self.normalise(html))
+        self.assertEqual(len(html), cost.bytes_out)
+
+    def test_empty(self):
+        self.assertEqual(b'', get_form_limited([], Limits()))
+
+    def test_max_output(self):
+        tokens = get_tokens(b'[] item\n' * 100)
+        size = len(get_form_limited(tokens, UNLIMITED, form_id='f'))
+        get_form_limited(tokens, Limits(max_output=size), form_id='f')
+        self.assertRaises(LimitExceeded, get_form_limited, tokens,
+            Limits(max_output=size - 1), form_id='f')
+
+
+class TestRenderUntrusted(unittest.TestCase):
+    """
+    Checks the render_untrusted function works correctly.
+    """
+
+    def test_render(self):
+        html, cost = render_untrusted(SOURCE, form_id='form')
+        self.assertTrue(isinstance(html, bytes))
+        self.assertIn(b'<form id="form"', html)
+        self.assertEqual({'bytes_in': len(SOURCE), 'lines': 6, 'tokens': 4,
+            'bytes_out': len(html)}, cost.as_dict())
+        self.assertIn('tokens=4', repr(cost))
+
+    def test_limits(self):
+        self.assertRaises(LimitExceeded, render_untrusted, SOURCE,
+            Limits(max_output=10))
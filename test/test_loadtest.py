@@ -0,0 +1,75 @@
+"""
+Ensures the load test harness works correctly.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.loadtest import (make_checklist, parse_mix, percentile,
+    get_rss, run, main)
+
+
+class TestHelpers(unittest.TestCase):
+    """
+    Checks the helper functions work correctly.
+    """
+
+    def test_make_checklist(self):
+        source = make_checklist(100)
+        self.assertEqual(100, len(source.split('\n')))
+        self.assertEqual(source, make_checklist(100))
+        self.assertNotEqual(source, make_checklist(100, seed=1))
+        token_types = set(token.token for token in get_tokens(source))
+        self.assertTrue(set(['AND_ITEM', 'OR_ITEM', 'TEXT']) <= token_types)
+
+    def test_parse_mix(self):
+        self.assertEqual([('small', 2), ('large', 1)],
+            parse_mix('small:2, large'))
+        self.assertRaises(ValueError, parse_mix, 'huge:1')
+        self.assertRaises(ValueError, parse_mix, 'small:0')
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(None, percentile([], 50))
+
+    def test_get_rss(self):
+        rss = get_rss()
+        if rss is not None:
+            self.assertTrue(rss > 0)
+
+
+class TestRun(unittest.TestCase):
+    """
+    Checks a (small) load test runs and reports its results.
+    """
+
+    def test_run(self):
+        results = run(clients=2, requests=20, mix=[('small', 1)],
+            sample_interval=0.01)
+        self.assertEqual(20, results['completed'])
+        self.assertEqual(0, results['errors'])
+        self.assertEqual(20, results['latency']['count'])
+        self.assertTrue(results['latency']['p50'] <=
+            results['latency']['p99'])
+        self.assertEqual(20, results['latency_by_size']['small']['count'])
+        self.assertTrue(results['throughput'] > 0)
+        self.assertTrue(len(results['rss']['samples']) >= 2)
+        # Can be saved as JSON.
+        json.dumps(results)
+
+    def test_main_saves_json(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'results.json')
+            main(['--clients', '1', '--requests', '3', '--mix', 'small',
+                '--output', path])
+            with open(path) as results:
+                self.assertEqual(3, json.load(results)['completed'])
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,64 @@
+"""
+Ensures a checklist lexed in parallel gives the same tokens as serial lexing.
+"""
+import unittest
+from multiprocessing import Pool
+from checklistdsl.lex import get_tokens
+from checklistdsl.parallel import split_lines, get_tokens_parallel
+from checklistdsl.precompile import compile_form
+
+
+LINES = ['= Section =', '// comment', '', 'Some text', '[] {a, B} Item',
+    '() Choice one', '() Choice two', '() Choice three', '---']
+SOURCE = '\r\n'.join(LINES * 500)
+
+
+class TestSplitLines(unittest.TestCase):
+    """
+    Checks the split_lines function works correctly.
+    """
+
+    def test_splits_at_line_boundaries(self):
+        result = split_lines('aaa\nbbb\nccc\nddd', 2)
+        self.assertEqual(['aaa\nbbb', 'ccc\nddd'], result)
+
+    def test_rejoins_to_original(self):
+        for chunks in (1, 3, 7, 100, 100000):
+            result = split_lines(SOURCE, chunks)
+            self.assertTrue(len(result) <= chunks)
+            self.assertEqual(SOURCE, '\n'.join(result))
+
+    def test_bytes(self):
+        self.assertEqual([b'a', b'b'], split_lines(b'a\nb', 2))
+
+
+class TestGetTokensParallel(unittest.TestCase):
+    """
+    Checks the get_tokens_parallel function works correctly.
+    """
+
+    def test_small_data_lexed_serially(self):
+        self.assertEqual(get_tokens('[] a'), get_tokens_parallel('[] a'))
+
+    def test_same_as_serial(self):
+        """
+        Lexing in chunks (many of which split a group of OR items) gives the
+        same tokens and the same radio button groups as lexing serially.
+        """
+        expected = get_tokens(SOURCE)
+        result = get_tokens_parallel(SOURCE, processes=2, chunks=37,
+            min_size=0)
+        self.assertEqual(expected, result)
+        self.assertEqual(compile_form(expected).render('test'),
+            compile_form(result).render('test'))
+
+    def test_existing_pool_and_bytes(self):
+        pool = Pool(2)
+        try:
+            data = SOURCE.encode('utf-8')
+            result = get_tokens_parallel(data, chunks=10, pool=pool,
+                min_size=0)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(get_tokens(data), result)
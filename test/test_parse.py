@@ -1,10 +1,14 @@
 """
 Ensures the parser interprets the tokens correctly.
 """
+import io
 import unittest
 import re
-from checklistdsl.parse import get_tag, get_form, make_html_safe, make_id_safe
-from checklistdsl.lex import Token
+from checklistdsl.parse import (get_tag, get_form, write_form, make_html_safe,
+    make_id_safe, FragmentCache, SlugAllocator)
+from checklistdsl.registry import REGISTRY
+from checklistdsl import parse
+from checklistdsl.lex import Token, get_tokens
 
 
 class TestMakeHTMLSafe(unittest.TestCase):
@@ -57,6 +61,13 @@ class TestMakeHTMLSafe(unittest.TestCase):
             '&amp; a &#34;test&#34;')
         self.assertEqual(result, expected)
 
+    def test_bytes(self):
+        """
+        Bytes are escaped to bytes.
+        """
+        result = make_html_safe(b'<a href="x">&</a>')
+        self.assertEqual(b'&lt;a href=&#34;x&#34;&gt;&amp;&lt;/a&gt;', result)
+
 
 class TestMakeIdSafe(unittest.TestCase):
     """
@@ -83,6 +94,77 @@ class TestMakeIdSafe(unittest.TestCase):
         result = make_id_safe(raw)
         self.assertEqual('hello-world', result)
 
+    def test_bytes(self):
+        raw = b' Hello <World>!'
+        result = make_id_safe(raw)
+        self.assertEqual(b'hello-world', result)
+
+    def test_non_ascii(self):
+        """
+        Bytes give the UTF-8 encoded id of the same text.
+        """
+        raw = u'Caf\u00e9 \u00c9QUIPE!'
+        self.assertEqual(u'caf\u00e9-\u00e9quipe', make_id_safe(raw))
+        self.assertEqual(u'caf\u00e9-\u00e9quipe'.encode('utf-8'),
+            make_id_safe(raw.encode('utf-8')))
+        # Invalid bytes are dropped.
+        self.assertEqual(b'caf-x', make_id_safe(b'Caf\xff x'))
+
+    def test_memoized(self):
+        """
+        Text and bytes ids are memoized separately and the memo is bounded.
+        """
+        parse._SAFE_IDS.clear()
+        self.assertEqual(u'hello', make_id_safe(u'Hello'))
+        self.assertEqual(b'hello', make_id_safe(b'Hello'))
+        self.assertEqual({(type(u''), u'Hello'): u'hello',
+            (bytes, b'Hello'): b'hello'}, parse._SAFE_IDS)
+        size = parse._SAFE_IDS_SIZE
+        parse._SAFE_IDS_SIZE = 2
+        try:
+            make_id_safe(u'Another')
+        finally:
+            parse._SAFE_IDS_SIZE = size
+        self.assertEqual({(type(u''), u'Another'): u'another'},
+            parse._SAFE_IDS)
+
+
+class TestSlugAllocator(unittest.TestCase):
+    """
+    Checks the SlugAllocator class works correctly.
+    """
+
+    def test_unique(self):
+        allocator = SlugAllocator()
+        self.assertEqual(['sign-in', 'sign-in-2', 'sign-in-3', 'other'],
+            allocator.allocate_all(['Sign-in', 'Sign in', 'sign in!',
+                'Other']))
+        self.assertTrue('sign-in-2' in allocator)
+        self.assertEqual('sign-in-4', allocator.allocate('SIGN IN'))
+
+    def test_suffix_taken(self):
+        """
+        A title whose id looks like an allocated suffix gets its own suffix.
+        """
+        allocator = SlugAllocator()
+        self.assertEqual(['a', 'a-2', 'a-2-2', 'a-3'],
+            allocator.allocate_all(['a', 'a', 'a 2', 'a']))
+        allocator = SlugAllocator()
+        self.assertEqual(['a-2', 'a', 'a-3'],
+            allocator.allocate_all(['a 2', 'a', 'a']))
+
+    def test_deterministic(self):
+        titles = ['Check', 'check', '!!', '', 'Check']
+        self.assertEqual(SlugAllocator().allocate_all(titles),
+            SlugAllocator().allocate_all(titles))
+        self.assertEqual(['check', 'check-2', 'form', 'form-2', 'check-3'],
+            SlugAllocator().allocate_all(titles))
+
+    def test_bytes(self):
+        allocator = SlugAllocator()
+        self.assertEqual([b'sign-in', b'sign-in-2'],
+            allocator.allocate_all([b'Sign-in', b'Sign in']))
+
 
 class TestGetForm(unittest.TestCase):
     """
@@ -246,6 +328,54 @@ class TestGetForm(unittest.TestCase):
         expected = '<form id="test" action="/foo" method="get">'
         self.assertTrue(expected in result)
 
+    def test_bytes(self):
+        """
+        Tokens lexed from bytes are rendered to UTF-8 encoded bytes that are
+        the same as the encoded result of rendering text.
+        """
+        source = u"= Caf\u00e9 =\n[] {nurse} <Item>\n() a\n() b\n---\nText"
+        result = get_form(get_tokens(source.encode('utf-8')), 'test', 'abc')
+        self.assertTrue(isinstance(result, bytes))
+        expected = get_form(get_tokens(source), 'test', 'abc')
+        regex = re.compile(r'name="[\w-]{36}"')
+        self.assertEqual(regex.sub('', expected),
+            regex.sub('', result.decode('utf-8')))
+
+
+class TestWriteForm(unittest.TestCase):
+    """
+    Checks the write_form function works correctly.
+    """
+
+    def test_returns_zero_no_tokens(self):
+        """
+        Nothing is written if there are no tokens.
+        """
+        out = bytearray()
+        self.assertEqual(0, write_form(out, []))
+        self.assertEqual(0, len(out))
+
+    def test_writes_to_bytearray(self):
+        """
+        The form is appended to a bytearray and the number of bytes written is
+        returned.
+        """
+        tokens = get_tokens(b"= Heading =\n[] Item")
+        out = bytearray(b'prefix')
+        count = write_form(out, tokens, 'test', method='get')
+        expected = get_form(tokens, 'test', method='get')
+        self.assertEqual(len(expected), count)
+        self.assertEqual(b'prefix' + expected, bytes(out))
+
+    def test_writes_to_file(self):
+        """
+        The form can also be written to a file-like object.
+        """
+        tokens = get_tokens(b"[] Item")
+        out = io.BytesIO()
+        write_form(out, tokens, 'test', 'abc')
+        self.assertEqual(get_form(tokens, 'test', 'abc'), out.getvalue())
+
 
 class TestGetTag(unittest.TestCase):
     """
@@ -299,6 +429,8 @@ class TestGetTag(unittest.TestCase):
         token = Token('HEADING', 'A header', size=7)
         result = get_tag(token)
         self.assertEqual('<h6>A header</h6>', result)
+        # The token itself is left unchanged.
+        self.assertEqual(7, token.size)
 
     def test_and_item(self):
         """
@@ -368,3 +500,95 @@ class TestGetTag(unittest.TestCase):
         token = Token('FOO', 'bar')
         result = get_tag(token)
         self.assertEqual('', result)
+
+
+class TestFragmentCache(unittest.TestCase):
+    """
+    Checks the FragmentCache class works correctly.
+    """
+
+    def test_same_as_get_tag(self):
+        """
+        Cached fragments are the same as those rendered by get_tag.
+        """
+        cache = FragmentCache()
+        tokens = [Token('HEADING', 'A <header>', size=9),
+            Token('AND_ITEM', 'Foo', roles=['bar', 'baz']),
+            Token('OR_ITEM', 'Foo'), Token('BREAK', '---'),
+            Token('TEXT', 'Some text'), Token('FOO', 'bar'),
+            Token('AND_ITEM', b'Foo', roles=[b'bar'])]
+        for i in range(2):
+            for token in tokens:
+                self.assertEqual(get_tag(token, 'name_value'),
+                    cache.get_tag(token, 'name_value'))
+                self.assertEqual(get_tag(token, 'other'),
+                    cache.get_tag(token, 'other'))
+        self.assertEqual(len(tokens), len(cache))
+
+    def test_no_name(self):
+        """
+        Without a name the fragment is the same as that of get_tag.
+        """
+        cache = FragmentCache()
+        for token in (Token('AND_ITEM', u'Foo'), Token('OR_ITEM', b'Foo'),
+                Token('TEXT', u'Foo')):
+            self.assertEqual(get_tag(token), cache.get_tag(token))
+
+    def test_text_and_bytes_kept_apart(self):
+        """
+        Text and bytes tokens with the same (ASCII) value have their own
+        fragments (Python 2 treats them as equal keys).
+        """
+        cache = FragmentCache()
+        text = cache.get_tag(Token('TEXT', u'same'))
+        self.assertFalse(isinstance(text, bytes))
+        self.assertTrue(isinstance(cache.get_tag(Token('TEXT', b'same')),
+            bytes))
+        self.assertEqual(2, len(cache))
+
+    def test_stats(self):
+        cache = FragmentCache()
+        self.assertEqual(0.0, cache.stats()['hit_rate'])
+        token = Token('AND_ITEM', 'Foo')
+        for name in ('a', 'b', 'c', 'd'):
+            cache.get_tag(token, name)
+        stats = cache.stats()
+        self.assertEqual(3, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.75, stats['hit_rate'])
+        self.assertEqual(1, stats['size'])
+        cache.clear()
+        self.assertEqual(0, cache.stats()['hits'])
+        self.assertEqual(0, len(cache))
+
+    def test_bounded(self):
+        """
+        The oldest fragments are evicted when the cache is full.
+        """
+        cache = FragmentCache(maxsize=2)
+        first = Token('TEXT', 'first')
+        cache.get_tag(first)
+        cache.get_tag(Token('TEXT', 'second'))
+        cache.get_tag(Token('TEXT', 'third'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.stats()['evictions'])
+        cache.get_tag(first)
+        self.assertEqual(0, cache.stats()['hits'])
+        self.assertEqual(4, cache.stats()['misses'])
+
+    def test_disabled(self):
+        cache = FragmentCache(maxsize=0)
+        self.assertEqual('<hr/>', cache.get_tag(Token('BREAK', '---')))
+        self.assertEqual(0, len(cache))
+
+    def test_cleared_when_renderers_change(self):
+        cache = FragmentCache()
+        token = Token('BREAK', '---')
+        cache.get_tag(token)
+        renderer = REGISTRY.renderers['BREAK']
+        REGISTRY.set_renderer('BREAK', lambda token, name: '<hr>')
+        try:
+            self.assertEqual('<hr>', cache.get_tag(token))
+        finally:
+            REGISTRY.set_renderer('BREAK', renderer)
+        self.assertEqual('<hr/>', cache.get_tag(token))
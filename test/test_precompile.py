@@ -0,0 +1,162 @@
+"""
+Ensures pre-compiled forms render the same forms as get_form.
+"""
+import re
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.precompile import compile_form, get_radio_name
+from checklistdsl.store import Layout
+
+
+SOURCE = """= A Heading =
+Some <text>.
+[] {doctor} Item 1
+[] Item 2
+() Choice 1
+() Choice 2
+---
+() Choice 3
+"""
+
+
+def normalise_names(html):
+    """
+    Replace the name attributes of radio buttons with their order of
+    appearance so forms with different radio button names can be compared.
+    """
+    names = {}
+
+    def replace(match):
+        name = names.setdefault(match.group(1), len(names))
+        return 'type="radio" name="%d"' % name
+    return re.sub(r'type="radio" name="([^"]+)"', replace, html)
+
+
+class TestCompileForm(unittest.TestCase):
+    """
+    Checks the compile_form function and CompiledForm class work correctly.
+    """
+
+    def test_no_tokens(self):
+        self.assertEqual(None, compile_form([]))
+
+    def test_same_as_get_form(self):
+        """
+        A compiled form renders the same HTML as get_form, apart from the
+        names of the radio buttons.
+        """
+        tokens = get_tokens(SOURCE)
+        compiled = compile_form(tokens, method='get')
+        for form_id, csrf_token in (('Test', None), ('test', '123')):
+            expected = get_form(tokens, form_id, csrf_token, method='get')
+            result = compiled.render(form_id, csrf_token)
+            self.assertEqual(normalise_names(expected),
+                normalise_names(result))
+
+    def test_bytes(self):
+        """
+        Bytes tokens compile to a form that renders bytes.
+        """
+        tokens = get_tokens(SOURCE.encode('utf-8'))
+        result = compile_form(tokens).render('test', '123')
+        expected = compile_form(get_tokens(SOURCE)).render('test', '123')
+        self.assertEqual(expected.encode('utf-8'), result)
+
+    def test_radio_names(self):
+        """
+        Each group of radio buttons is named after the form_id.
+        """
+        compiled = compile_form(get_tokens(SOURCE))
+        self.assertEqual(2, compiled.groups)
+        result = compiled.render('test')
+        names = re.findall(r'type="radio" name="([^"]+)"', result)
+        self.assertEqual(['test-1', 'test-1', 'test-2'], names)
+        self.assertEqual('test-2', get_radio_name('test', 2))
+
+    def test_random_form_id(self):
+        """
+        Without a form_id each render gets a new random one.
+        """
+        compiled = compile_form(get_tokens(SOURCE))
+        regex = re.compile(r'id="([\w-]+)"')
+        first = regex.findall(compiled.render())
+        second = regex.findall(compiled.render())
+        self.assertNotEqual(first, second)
+        self.assertEqual(36, len(first[0]))
+
+
+class TestRenderState(unittest.TestCase):
+    """
+    Checks compiled forms are rendered with the state of a submission.
+    """
+
+    def checked(self, html):
+        """
+        Return the values of the checked inputs (by name) in the HTML.
+        """
+        regex = r'name="([^"]+)" value="([^"]+)" checked="checked">'
+        result = {}
+        for name, value in re.findall(regex, html):
+            result.setdefault(name, set()).add(value)
+        return result
+
+    def test_no_state(self):
+        compiled = compile_form(get_tokens(SOURCE))
+        self.assertEqual(compiled.render('test'),
+            compiled.render('test', state={}))
+        self.assertNotIn('checked', compiled.render('test'))
+
+    def test_state(self):
+        compiled = compile_form(get_tokens(SOURCE))
+        state = {
+            'test': set(['Item 2', 'Not an item']),
+            'test-2': set(['Choice 3']),
+            'other': set(['Item 1']),
+        }
+        html = compiled.render('Test', state=state)
+        self.assertEqual({'test': set(['Item 2']),
+            'test-2': set(['Choice 3'])}, self.checked(html))
+        self.assertIn('value="Item 2" checked="checked">Item 2</input>', html)
+        # Apart from the checked attributes nothing changes.
+        self.assertEqual(compiled.render('Test'),
+            html.replace(' checked="checked"', ''))
+
+    def test_bytes(self):
+        tokens = get_tokens(SOURCE.encode('utf-8'))
+        html = compile_form(tokens).render('test', state={
+            'test-1': set([b'Choice 2'])})
+        self.assertIn(b'value="Choice 2" checked="checked">', html)
+
+    def test_escaped_value(self):
+        tokens = get_tokens('[] Fish & <chips>\n() A "quote"')
+        html = compile_form(tokens).render('test', state={
+            'test': set(['Fish & <chips>']), 'test-1': set(['A "quote"'])})
+        self.assertEqual(2, html.count('checked="checked"'))
+
+    def test_invalid_utf8(self):
+        """
+        Values that aren't valid UTF-8 are matched by their replacement
+        characters (as they are in a store).
+        """
+        tokens = get_tokens(b'[] caf\xe9\n[] tea')
+        compiled = compile_form(tokens)
+        self.assertEqual((u'caf\ufffd', u'tea'),
+            tuple(value for position, group, value in compiled.checks))
+        html = compiled.render('test', state={'test': set([u'caf\ufffd'])})
+        self.assertIn(b'value="caf\xe9" checked="checked">', html)
+        state = Layout(tokens, 'test').decode(b'\x01')
+        self.assertEqual(html, compiled.render('test', state=state))
+
+    def test_store_round_trip(self):
+        """
+        A submission decoded from a store renders as it was submitted.
+        """
+        tokens = get_tokens(SOURCE)
+        layout = Layout(tokens, 'test')
+        state = {'test': set(['Item 1']), 'test-1': set(['Choice 2']),
+            'test-2': set()}
+        html = compile_form(tokens).render('test',
+            state=layout.decode(layout.encode(state)))
+        self.assertEqual({'test': set(['Item 1']),
+            'test-1': set(['Choice 2'])}, self.checked(html))
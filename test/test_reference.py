@@ -0,0 +1,124 @@
+"""
+Ensures the reference engine and the engine switch work correctly.
+"""
+import unittest
+from checklistdsl import engine
+from checklistdsl.engine import FAST, REFERENCE, get_engine, set_default
+from checklistdsl.lex import Token, get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl import reference
+
+
+class TestEngine(unittest.TestCase):
+    """
+    Checks engines are selected correctly.
+    """
+
+    def tearDown(self):
+        set_default(FAST)
+
+    def test_get_engine(self):
+        self.assertEqual(FAST, get_engine())
+        self.assertEqual(REFERENCE, get_engine(REFERENCE))
+        self.assertRaises(ValueError, get_engine, 'turbo')
+
+    def test_set_default(self):
+        set_default(REFERENCE)
+        self.assertEqual(REFERENCE, engine.DEFAULT)
+        self.assertEqual(REFERENCE, get_engine())
+        self.assertRaises(ValueError, set_default, 'turbo')
+        self.assertEqual(REFERENCE, engine.DEFAULT)
+
+    def test_get_tokens(self):
+        """
+        The reference engine is used when asked for by name or by default.
+        """
+        calls = []
+        original = reference.get_tokens
+
+        def fake(data):
+            calls.append(data)
+            return original(data)
+        reference.get_tokens = fake
+        try:
+            get_tokens('[] item', engine=REFERENCE)
+            get_tokens('[] item')
+            set_default(REFERENCE)
+            get_tokens('[] item')
+            get_tokens('[] item', engine=FAST)
+        finally:
+            reference.get_tokens = original
+        self.assertEqual(2, len(calls))
+
+    def test_get_form(self):
+        tokens = get_tokens('[] item')
+        expected = reference.get_form(tokens, 'form', action='/')
+        self.assertEqual(expected, get_form(tokens, 'form', engine=REFERENCE,
+            action='/'))
+        self.assertRaises(ValueError, get_form, tokens, engine='turbo')
+
+
+class TestReferenceGetTokens(unittest.TestCase):
+    """
+    Checks the reference lexer has the DSL's original semantics.
+    """
+
+    def test_tokens(self):
+        source = '\n'.join([
+            '== Heading ==',
+            '// Comment',
+            '[] {Doctor, NURSE} Item',
+            '() Choice',
+            '---',
+            'Some text',
+        ])
+        self.assertEqual([
+            Token('HEADING', 'Heading', size=2),
+            Token('AND_ITEM', 'Item', roles=['doctor', 'nurse']),
+            Token('OR_ITEM', 'Choice'),
+            Token('BREAK', '---'),
+            Token('TEXT', 'Some text'),
+        ], reference.get_tokens(source))
+
+    def test_empty_value(self):
+        """
+        A token with no value has the whole line as its value.
+        """
+        self.assertEqual([Token('AND_ITEM', '[] {a}')],
+            reference.get_tokens('  [] {a}  '))
+
+    def test_bytes(self):
+        self.assertEqual([Token('AND_ITEM', b'Item', roles=[b'doctor'])],
+            reference.get_tokens(b'[] {DOCTOR} Item'))
+
+
+class TestReferenceGetForm(unittest.TestCase):
+    """
+    Checks the reference renderer has the DSL's original semantics.
+    """
+
+    def test_heading_clamped(self):
+        """
+        Headings are clamped to h6 without changing the token.
+        """
+        token = Token('HEADING', 'Title', size=9)
+        self.assertEqual('<h6>Title</h6>', reference.get_tag(token))
+        self.assertEqual(9, token.size)
+
+    def test_form(self):
+        tokens = reference.get_tokens('[] a\n() b\n() c\n[] d')
+        html = reference.get_form(tokens, 'My Form', 'token')
+        self.assertTrue(html.startswith('<form id="my-form" '))
+        self.assertIn('value="token"', html)
+        self.assertEqual(2, html.count('name="my-form"'))
+        # The radio buttons share a name.
+        names = html.split('type="radio" name="')
+        self.assertEqual(names[1][:36], names[2][:36])
+
+    def test_empty(self):
+        self.assertEqual('', reference.get_form([]))
+
+    def test_bytes(self):
+        html = reference.get_form(reference.get_tokens(b'[] a'), 'f')
+        self.assertTrue(isinstance(html, bytes))
+        self.assertIn(b'name="f"', html)
@@ -0,0 +1,131 @@
+"""
+Ensures the token type registry works as expected.
+"""
+import unittest
+from checklistdsl.registry import Registry, REGISTRY, IGNORE, register, \
+    unregister
+from checklistdsl.lex import Token, get_tokens
+from checklistdsl.parse import get_tag, get_form, make_html_safe
+
+
+def render_timed(token, name):
+    template = '<p class="timed">%s</p>'
+    if isinstance(token.value, bytes):
+        template = template.encode('ascii')
+    return template % make_html_safe(token.value)
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Checks the Registry class works correctly.
+    """
+
+    def test_register_needs_scanner_or_pattern(self):
+        registry = Registry()
+        self.assertRaises(ValueError, registry.register, 'FOO')
+        self.assertRaises(ValueError, registry.register, 'FOO',
+            scanner=lambda line, literals: None, pattern='foo')
+        self.assertRaises(ValueError, registry.register, 'FOO',
+            lead=u'\u00e9', pattern='foo')
+
+    def test_dispatch_table(self):
+        """
+        Each lead character maps to the token types that could match it,
+        highest precedence first, followed by those without a lead.
+        """
+        registry = Registry()
+        registry.register('A', lead='ab', pattern='a')
+        registry.register('B', lead='b', pattern='b', precedence=10)
+        registry.register('C', pattern='c')
+        table, fallbacks = registry.get_dispatch()
+        self.assertEqual(['a', 'b'], sorted(table))
+        self.assertEqual(2, len(table['a']))
+        self.assertEqual(3, len(table['b']))
+        self.assertTrue(table['b'][0] is registry.types['B'].scanner)
+        self.assertTrue(table['b'][1] is registry.types['A'].scanner)
+        self.assertEqual((registry.types['C'].scanner, ), fallbacks)
+        # Keys are bytes for the bytes table.
+        table, fallbacks = registry.get_dispatch(True)
+        self.assertTrue(b'a' in table)
+        # Changes recompile the table.
+        registry.unregister('B')
+        table, fallbacks = registry.get_dispatch()
+        self.assertEqual(2, len(table['b']))
+
+    def test_renderers(self):
+        registry = Registry()
+        registry.register('A', lead='a', pattern='a', named=True)
+        self.assertEqual({}, registry.renderers)
+        registry.set_renderer('A', render_timed)
+        self.assertEqual({'A': render_timed}, registry.renderers)
+        self.assertEqual(frozenset(['A']), registry.named)
+        self.assertEqual(frozenset(), registry.grouped)
+        # Re-registering keeps the renderer unless a new one is given.
+        registry.register('A', lead='a', pattern='a')
+        self.assertEqual({'A': render_timed}, registry.renderers)
+
+    def test_builtin_types(self):
+        """
+        The built-in token types are registered with single lead characters
+        so each line is only tried against one of them (and text).
+        """
+        table, fallbacks = REGISTRY.get_dispatch()
+        for char in '=/[(-':
+            self.assertEqual(2, len(table[char]))
+        self.assertEqual(1, len(fallbacks))
+
+
+class TestExtensions(unittest.TestCase):
+    """
+    Checks that extra token types registered with the default registry are
+    lexed and rendered.
+    """
+
+    def tearDown(self):
+        for name in ('TIMED_ITEM', 'SIGNATURE', 'NOTE'):
+            if name in REGISTRY.types:
+                unregister(name)
+
+    def test_pattern_extension(self):
+        register('TIMED_ITEM', lead='@', renderer=render_timed,
+            pattern=r'@ *(?P<roles>{.*}|) *(?P<value>.*)')
+        tokens = get_tokens('@ {Nurse} 10:00 Give medicine\n@\n@x')
+        self.assertEqual(Token('TIMED_ITEM', '10:00 Give medicine',
+            roles=['nurse']), tokens[0])
+        # No value gives the whole line.
+        self.assertEqual(Token('TIMED_ITEM', '@'), tokens[1])
+        self.assertEqual('<p class="timed">x</p>', get_tag(tokens[2]))
+        # Lines the extension doesn't match are still text.
+        register('TIMED_ITEM', lead='@', pattern=r'@ (?P<value>.*)')
+        self.assertEqual(Token('TEXT', '@x'), get_tokens('@x')[0])
+        # Bytes work too.
+        self.assertEqual(Token('TIMED_ITEM', b'x'), get_tokens(b'@ x')[0])
+        self.assertEqual(b'<p class="timed">x</p>',
+            get_tag(get_tokens(b'@ x')[0]))
+
+    def test_ignored_extension(self):
+        register('NOTE', lead='#', pattern='#', ignore=True)
+        self.assertEqual([], get_tokens('# A note'))
+
+    def test_scanner_extension(self):
+        """
+        A named extension gets the form's name attribute.
+        """
+        def scan(line, literals):
+            if line.startswith('sign:'):
+                return Token('SIGNATURE', line[5:].strip())
+
+        def render(token, name):
+            return '<input type="text" name="%s" value="%s"/>' % (name,
+                make_html_safe(token.value))
+        register('SIGNATURE', lead='s', scanner=scan, renderer=render,
+            named=True)
+        tokens = get_tokens('sign: Doctor\nsome text')
+        self.assertEqual(['SIGNATURE', 'TEXT'], [t.token for t in tokens])
+        result = get_form(tokens, 'test')
+        self.assertTrue('<input type="text" name="test" value="Doctor"/>'
+            in result)
+
+    def test_ignore_sentinel(self):
+        register('NOTE', lead='#', scanner=lambda line, literals: IGNORE)
+        self.assertEqual([], get_tokens('#'))
@@ -0,0 +1,198 @@
+"""
+Ensures submissions are stored and read back correctly.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.precompile import compile_form
+from checklistdsl.store import Layout, SubmissionStore, HEADER_SIZE
+
+
+SOURCE = """= Heading =
+[] Item 1
+[] Item 2
+() Choice 1
+() Choice 2
+Some text
+() Choice 3
+[] Item 3
+"""
+
+
+class TestLayout(unittest.TestCase):
+    """
+    Checks the layout of a checklist's inputs is worked out correctly.
+    """
+
+    def test_layout(self):
+        layout = Layout(get_tokens(SOURCE), 'my form')
+        self.assertEqual('my-form', layout.form_id)
+        self.assertEqual(['Item 1', 'Item 2', 'Item 3'], layout.checkboxes)
+        self.assertEqual([('my-form-1', ['Choice 1', 'Choice 2']),
+            ('my-form-2', ['Choice 3'])], layout.groups)
+        # One byte of bits and one byte per group.
+        self.assertEqual(3, layout.row_size)
+
+    def test_names_match_compiled_form(self):
+        """
+        The names are those used by a compiled form with the same form id.
+        """
+        html = compile_form(get_tokens(SOURCE)).render('my-form')
+        layout = Layout(get_tokens(SOURCE), 'my-form')
+        self.assertIn('name="my-form"', html)
+        for name, values in layout.groups:
+            self.assertIn('name="%s"' % name, html)
+
+    def test_bytes(self):
+        """
+        Tokens lexed from bytes have the same layout.
+        """
+        self.assertEqual(Layout(get_tokens(SOURCE), 'x').digest,
+            Layout(get_tokens(SOURCE.encode('utf-8')), 'x').digest)
+
+    def test_invalid_utf8(self):
+        """
+        Bytes that aren't valid UTF-8 are replaced rather than raising an
+        error.
+        """
+        layout = Layout(get_tokens(b'[] caf\xe9\n() tea'), 'x')
+        self.assertEqual([u'caf\ufffd'], layout.checkboxes)
+        self.assertEqual([('x-1', [u'tea'])], layout.groups)
+
+    def test_digest(self):
+        tokens = get_tokens(SOURCE)
+        self.assertEqual(Layout(tokens, 'x').digest,
+            Layout(tokens, 'x').digest)
+        self.assertNotEqual(Layout(tokens, 'x').digest,
+            Layout(tokens, 'y').digest)
+        self.assertNotEqual(Layout(tokens, 'x').digest,
+            Layout(tokens[:-1], 'x').digest)
+
+    def test_round_trip(self):
+        layout = Layout(get_tokens(SOURCE), 'x')
+        state = {
+            'x': set(['Item 1', 'Item 3']),
+            'x-1': set(['Choice 2']),
+        }
+        row = layout.encode(state)
+        self.assertEqual(3, len(row))
+        expected = {'x': set(['Item 1', 'Item 3']), 'x-1': set(['Choice 2']),
+            'x-2': set()}
+        self.assertEqual(expected, layout.decode(row))
+
+    def test_unknown_values_ignored(self):
+        layout = Layout(get_tokens(SOURCE), 'x')
+        row = layout.encode({'x': set(['Nope']), 'x-1': set(['Nope']),
+            'y': set(['Item 1'])})
+        self.assertEqual(b'\x00\x00\x00', row)
+
+    def test_wide_group(self):
+        """
+        Groups of more than 254 radio buttons take two bytes.
+        """
+        source = '\n'.join(['() Choice %d' % i for i in range(300)])
+        layout = Layout(get_tokens(source), 'x')
+        self.assertEqual(2, layout.row_size)
+        row = layout.encode({'x-1': set(['Choice 299'])})
+        self.assertEqual({'x': set(), 'x-1': set(['Choice 299'])},
+            layout.decode(row))
+
+
+class TestSubmissionStore(unittest.TestCase):
+    """
+    Checks the SubmissionStore class works correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'submissions')
+        self.layout = Layout(get_tokens(SOURCE), 'x')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_read(self):
+        with SubmissionStore(self.path, self.layout) as store:
+            self.assertEqual(0, len(store))
+            self.assertEqual(0, store.append({'x': set(['Item 2'])}))
+            self.assertEqual(1, store.append({'x-2': set(['Choice 3'])}))
+            self.assertEqual(2, len(store))
+            self.assertEqual(set(['Item 2']), store[0]['x'])
+            self.assertEqual(set(['Choice 3']), store[-1]['x-2'])
+            self.assertRaises(IndexError, store.get_row, 2)
+        self.assertEqual(HEADER_SIZE + 2 * self.layout.row_size,
+            os.path.getsize(self.path))
+
+    def test_reopen(self):
+        with SubmissionStore(self.path, self.layout) as store:
+            store.append_many([{'x': set(['Item 1'])}] * 10)
+        with SubmissionStore(self.path, self.layout) as store:
+            self.assertEqual(10, len(store))
+            self.assertEqual(10, store.append({}))
+            self.assertEqual(11, len(list(store)))
+
+    def test_reads_see_appends(self):
+        """
+        The mmap is remapped as the file grows.
+        """
+        with SubmissionStore(self.path, self.layout) as store:
+            store.append({'x': set(['Item 1'])})
+            self.assertEqual(1, len(list(store.scan())))
+            store.append({'x': set(['Item 2'])})
+            self.assertEqual(set(['Item 2']), store[1]['x'])
+
+    def test_scan_during_remap(self):
+        """
+        A scan that's under way keeps reading the old mmap after an append
+        causes the file to be remapped.
+        """
+        with SubmissionStore(self.path, self.layout) as store:
+            store.append_many([{'x': set(['Item 1'])}] * 3)
+            rows = iter(store)
+            self.assertEqual(set(['Item 1']), next(rows)['x'])
+            store.append({'x': set(['Item 2'])})
+            self.assertEqual(set(['Item 2']), store[-1]['x'])
+            self.assertEqual([set(['Item 1'])] * 2,
+                [state['x'] for state in rows])
+
+    def test_different_layout(self):
+        SubmissionStore(self.path, self.layout).close()
+        other = Layout(get_tokens(SOURCE), 'y')
+        self.assertRaises(ValueError, SubmissionStore, self.path, other)
+
+    def test_torn_row(self):
+        """
+        A partial row at the end of the file is truncated when it's opened.
+        """
+        with SubmissionStore(self.path, self.layout) as store:
+            store.append({'x': set(['Item 1'])})
+        with open(self.path, 'ab') as output:
+            output.write(b'\x01')
+        with SubmissionStore(self.path, self.layout) as store:
+            self.assertEqual(1, store.append({'x': set(['Item 3'])}))
+            self.assertEqual([set(['Item 1']), set(['Item 3'])],
+                [state['x'] for state in store])
+        self.assertEqual(HEADER_SIZE + 2 * self.layout.row_size,
+            os.path.getsize(self.path))
+
+    def test_no_inputs(self):
+        layout = Layout(get_tokens('= Heading =\nSome text'), 'x')
+        self.assertEqual(0, layout.row_size)
+        self.assertRaises(ValueError, SubmissionStore, self.path, layout)
+
+    def test_not_a_store(self):
+        with open(self.path, 'wb') as output:
+            output.write(b'{"some": "json"}')
+        self.assertRaises(ValueError, SubmissionStore, self.path,
+            self.layout)
+
+    def test_totals(self):
+        with SubmissionStore(self.path, self.layout) as store:
+            store.append_many([
+                {'x': set(['Item 1', 'Item 3']), 'x-1': set(['Choice 1'])},
+                {'x': set(['Item 3']), 'x-1': set(['Choice 2'])},
+                {'x': set(['Item 3']), 'x-2': set(['Choice 3'])},
+            ])
+            self.assertEqual(([1, 0, 3], [[1, 1], [1]]), store.totals())
@@ -0,0 +1,104 @@
+"""
+Ensures checklists fed a chunk at a time are lexed and rendered correctly.
+"""
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.parse import get_form
+from checklistdsl.limits import LimitExceeded
+from checklistdsl.differential import normalise
+from checklistdsl.stream import PushLexer, PushRenderer
+
+
+SOURCE = (u'= Heading =\r\n// A comment\r\n\r\n[] {nurse} Item 1\r\n' +
+    u'() Choice 1\n() Choice 2\nSome text\n[] Caf\u00e9\n() Choice 3')
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestPushLexer(unittest.TestCase):
+    """
+    Checks the PushLexer class works correctly.
+    """
+
+    def lex(self, pieces):
+        lexer = PushLexer()
+        tokens = []
+        for piece in pieces:
+            tokens.extend(lexer.feed(piece))
+        tokens.extend(lexer.close())
+        return tokens
+
+    def test_any_chunk_size(self):
+        """
+        Lines split anywhere (including within a \\r\\n) make no difference.
+        """
+        for data in (SOURCE, SOURCE.encode('utf-8')):
+            expected = get_tokens(data)
+            for size in range(1, len(data) + 1):
+                self.assertEqual(expected, self.lex(chunks(data, size)))
+
+    def test_tokens_emitted_early(self):
+        lexer = PushLexer()
+        self.assertEqual(get_tokens('[] Item 1'),
+            lexer.feed('[] Item 1\n[] Ite'))
+        self.assertEqual(6, lexer.pending)
+        self.assertEqual(get_tokens('[] Item 2'), lexer.feed('m 2\n'))
+        self.assertEqual(0, lexer.pending)
+        self.assertEqual([], lexer.feed(''))
+        self.assertEqual([], lexer.close())
+
+    def test_first_feed(self):
+        lexer = PushLexer()
+        self.assertEqual(get_tokens('[] Item 1'), lexer.feed('[] Item 1\n'))
+
+    def test_closed(self):
+        lexer = PushLexer()
+        lexer.close()
+        self.assertRaises(ValueError, lexer.feed, 'more')
+
+    def test_max_line_length(self):
+        lexer = PushLexer(max_line_length=10)
+        lexer.feed('[] short\n[] 456789')
+        self.assertRaises(LimitExceeded, lexer.feed, 'xx')
+
+
+class TestPushRenderer(unittest.TestCase):
+    """
+    Checks the PushRenderer class works correctly.
+    """
+
+    def render(self, pieces, **kwargs):
+        renderer = PushRenderer(**kwargs)
+        html = [renderer.feed(piece) for piece in pieces]
+        html.append(renderer.close())
+        return pieces[0][:0].join(html)
+
+    def test_same_as_get_form(self):
+        """
+        Radio button groups span feeds.
+        """
+        for data in (SOURCE, SOURCE.encode('utf-8')):
+            expected = normalise(get_form(get_tokens(data), 'my-form',
+                'token', action='/'))
+            for size in (1, 7, 20, len(data)):
+                html = self.render(chunks(data, size), form_id='my-form',
+                    csrf_token='token', action='/')
+                self.assertEqual(expected, normalise(html))
+
+    def test_no_form_id(self):
+        expected = normalise(get_form(get_tokens(SOURCE)))
+        self.assertEqual(expected, normalise(self.render(chunks(SOURCE, 5))))
+
+    def test_emits_early(self):
+        renderer = PushRenderer(form_id='f')
+        self.assertEqual('', renderer.feed('= Head'))
+        html = renderer.feed('ing =\n[] It')
+        self.assertTrue(html.startswith('<form id="f"'))
+        self.assertTrue(html.endswith('<h1>Heading</h1>'))
+        self.assertTrue(renderer.close().endswith('</form>'))
+
+    def test_empty(self):
+        self.assertEqual('', self.render(['// nothing\n', '\n']))
+        self.assertEqual(b'', self.render([b'\n']))
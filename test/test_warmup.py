@@ -0,0 +1,114 @@
+"""
+Ensures the pre-fork warm up works correctly.
+"""
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+from checklistdsl.lex import get_tokens
+from checklistdsl.precompile import compile_form
+from checklistdsl.wsgi import ChecklistApp
+from checklistdsl.warmup import (warm_up, warm_up_app, freeze_heap,
+    get_memory, measure_workers)
+
+
+SOURCES = {
+    'one': '= Heading =\n[] Item 1\n() Choice 1\n() Choice 2',
+    'two': b'Some text\n[] {doctor} Item',
+    'empty': '// Nothing here',
+}
+
+
+class TestWarmUp(unittest.TestCase):
+    """
+    Checks the warm_up function works correctly.
+    """
+
+    def test_corpus(self):
+        corpus = warm_up(SOURCES, freeze=False)
+        self.assertEqual(3, len(corpus))
+        self.assertEqual(['empty', 'one', 'two'], corpus.names())
+        self.assertTrue('one' in corpus)
+        self.assertEqual(tuple(get_tokens(SOURCES['one'])),
+            corpus.get_tokens('one'))
+        self.assertEqual(compile_form(get_tokens(SOURCES['one'])).render('x'),
+            corpus.get_form('one', 'x'))
+        self.assertEqual(compile_form(get_tokens(SOURCES['two'])).render('x'),
+            corpus.get_form('two', 'x'))
+        self.assertEqual('', corpus.get_form('empty'))
+        self.assertNotEqual(corpus.get_fingerprint('one'),
+            corpus.get_fingerprint('two'))
+
+    def test_immutable(self):
+        """
+        The structures built by warm_up are tuples so they can't be changed
+        after they're shared.
+        """
+        corpus = warm_up(SOURCES, freeze=False)
+        self.assertTrue(isinstance(corpus.get_tokens('one'), tuple))
+        compiled = corpus.get_compiled('one')
+        self.assertTrue(isinstance(compiled.parts, tuple))
+        self.assertTrue(isinstance(compiled.slots, tuple))
+        # Rendering doesn't change the compiled form.
+        parts = compiled.parts
+        compiled.render('x', 'token')
+        self.assertTrue(parts is compiled.parts)
+
+    def test_invalid_utf8(self):
+        corpus = warm_up({'latin': b'[] caf\xe9'}, freeze=False)
+        self.assertIn(b'value="caf\xe9"', corpus.get_form('latin', 'x'))
+
+    def test_attributes(self):
+        corpus = warm_up(SOURCES, freeze=False, method='post')
+        self.assertIn('method="post"', corpus.get_form('one', 'x'))
+
+    def test_freeze_heap(self):
+        frozen = freeze_heap()
+        try:
+            self.assertEqual(hasattr(gc, 'freeze'), frozen)
+            if frozen:
+                self.assertTrue(gc.get_freeze_count() > 0)
+        finally:
+            if frozen:
+                gc.unfreeze()
+
+
+class TestWarmUpApp(unittest.TestCase):
+    """
+    Checks a ChecklistApp is warmed up correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'one.chkl'), 'w') as output:
+            output.write(SOURCES['one'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_warm_up_app(self):
+        app = ChecklistApp(self.directory)
+        warm_up_app(app, freeze=False)
+        entry = app.get_entry('one')
+        self.assertNotEqual(None, entry.static)
+        self.assertIn(b'Item 1', entry.static.html)
+
+
+class TestMeasure(unittest.TestCase):
+    """
+    Checks the memory of processes can be measured.
+    """
+
+    def test_get_memory(self):
+        memory = get_memory()
+        if memory is None:
+            self.skipTest('Needs /proc/self/smaps_rollup')
+        self.assertTrue(memory['rss'] > 0)
+        self.assertTrue(memory['private'] <= memory['rss'])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Needs os.fork')
+    def test_measure_workers(self):
+        result = measure_workers(lambda: None, 2)
+        self.assertEqual(2, len(result))
+        self.assertEqual(get_memory() is None, result[0] is None)
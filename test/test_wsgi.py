@@ -0,0 +1,207 @@
+"""
+Ensures the WSGI application serves checklists correctly.
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from wsgiref.util import setup_testing_defaults
+from wsgiref.validate import validator
+from checklistdsl.wsgi import ChecklistApp
+
+
+class TestChecklistApp(unittest.TestCase):
+    """
+    Checks the ChecklistApp class works correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('first', '= First =\n[] Item 1\n() a\n() b')
+        self.write('second', '= Second =\n[] Item 2')
+        with open(os.path.join(self.directory, 'ignored.txt'), 'w') as f:
+            f.write('[] Not a checklist')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source, mtime=None):
+        path = os.path.join(self.directory, name + '.chkl')
+        with open(path, 'w') as f:
+            f.write(source)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def request(self, app, path, **environ):
+        """
+        Make a request and return the status, headers and body.
+        """
+        environ['PATH_INFO'] = path
+        environ['SCRIPT_NAME'] = ''
+        environ.setdefault('QUERY_STRING', '')
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        result = validator(app)(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            result.close()
+        return response['status'], response['headers'], body
+
+    def test_serves_checklist(self):
+        app = ChecklistApp(self.directory)
+        status, headers, body = self.request(app, '/first')
+        self.assertEqual('200 OK', status)
+        self.assertEqual('text/html; charset=utf-8', headers['Content-Type'])
+        self.assertTrue(b'<form id="first"' in body)
+        self.assertTrue(b'<h1>First</h1>' in body)
+        self.assertTrue(b'name="first-1"' in body)
+        self.assertEqual(str(len(body)), headers['Content-Length'])
+
+    def test_index(self):
+        app = ChecklistApp(self.directory)
+        status, headers, body = self.request(app, '/')
+        self.assertEqual('200 OK', status)
+        self.assertTrue(b'<a href="first">' in body)
+        self.assertTrue(b'<a href="second">' in body)
+        self.assertFalse(b'ignored' in body)
+
+    def test_index_quotes_names(self):
+        """
+        Names are URL quoted in the links' hrefs.
+        """
+        self.write('a b#1?', '[] Item')
+        app = ChecklistApp(self.directory)
+        status, headers, body = self.request(app, '/')
+        self.assertTrue(b'<a href="a%20b%231%3F">a b#1?</a>' in body)
+
+    def test_not_found(self):
+        app = ChecklistApp(self.directory)
+        self.assertEqual('404 Not Found', self.request(app, '/missing')[0])
+        self.assertEqual('404 Not Found',
+            self.request(app, '/../first')[0])
+        self.assertEqual('404 Not Found', self.request(app, '/ignored')[0])
+
+    def test_method_not_allowed(self):
+        app = ChecklistApp(self.directory)
+        status, headers, body = self.request(app, '/first',
+            REQUEST_METHOD='POST')
+        self.assertEqual('405 Method Not Allowed', status)
+
+    def test_head(self):
+        app = ChecklistApp(self.directory)
+        body = self.request(app, '/first')[2]
+        status, headers, empty = self.request(app, '/first',
+            REQUEST_METHOD='HEAD')
+        self.assertEqual(b'', empty)
+        self.assertEqual(str(len(body)), headers['Content-Length'])
+
+    def test_gzip(self):
+        app = ChecklistApp(self.directory)
+        plain = self.request(app, '/first')[2]
+        status, headers, body = self.request(app, '/first',
+            HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', headers['Content-Encoding'])
+        self.assertEqual(plain, gzip.GzipFile(fileobj=io.BytesIO(body)).read())
+
+    def test_injects_csrf_token_and_form_id(self):
+        app = ChecklistApp(self.directory,
+            csrf_token=lambda environ: environ['QUERY_STRING'],
+            form_id=lambda environ, name: name + ' form', method='get')
+        status, headers, body = self.request(app, '/first',
+            QUERY_STRING='abc', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertTrue(b'<form id="first-form"' in body)
+        self.assertTrue(b'method="get"' in body)
+        self.assertTrue(b'name="csrfmiddlewaretoken" value="abc"' in body)
+
+    def test_conditional_get(self):
+        app = ChecklistApp(self.directory)
+        status, headers, body = self.request(app, '/first')
+        etag = headers['ETag']
+        status, headers, body = self.request(app, '/first',
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual('304 Not Modified', status)
+        self.assertEqual(b'', body)
+        # Another checklist has another ETag.
+        status, headers, body = self.request(app, '/second',
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual('200 OK', status)
+
+    def test_conditional_get_csrf_token(self):
+        """
+        Pages with a CSRF token are never answered with a 304 (the cached
+        page would have an old token).
+        """
+        etag = self.request(ChecklistApp(self.directory), '/first')[1]['ETag']
+        app = ChecklistApp(self.directory,
+            csrf_token=lambda environ: environ['QUERY_STRING'])
+        for if_none_match in (etag, '*'):
+            status, headers, body = self.request(app, '/first',
+                QUERY_STRING='new', HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual('200 OK', status)
+            self.assertFalse('ETag' in headers)
+            self.assertTrue(b'value="new"' in body)
+
+    def test_reloads_changed_files_only(self):
+        app = ChecklistApp(self.directory, poll_interval=0)
+        app.refresh()
+        first = app.get_entry('first')
+        second = app.get_entry('second')
+        self.write('first', '= Changed =\n[] Item 1', mtime=1000000)
+        self.write('third', '= Third =')
+        os.remove(os.path.join(self.directory, 'second.chkl'))
+        self.assertFalse(first is app.get_entry('first'))
+        self.assertEqual('Changed', app.get_entry('first').tokens[0].value
+            .decode('utf-8'))
+        self.assertEqual(None, app.get_entry('second'))
+        self.assertTrue(app.get_entry('third') is not None)
+        # Unchanged files are not lexed again.
+        self.assertTrue(app.get_entry('third') is app.get_entry('third'))
+
+    def test_invalid_utf8(self):
+        """
+        A checklist that isn't valid UTF-8 is served (as are the others).
+        """
+        with open(os.path.join(self.directory, 'latin.chkl'), 'wb') as f:
+            f.write(b'[] caf\xe9')
+        app = ChecklistApp(self.directory)
+        self.assertEqual('200 OK', self.request(app, '/first')[0])
+        status, headers, body = self.request(app, '/latin')
+        self.assertEqual('200 OK', status)
+        self.assertIn(b'value="caf\xe9"', body)
+
+    def test_unreadable_file(self):
+        """
+        A checklist that can't be read is left out and the others are still
+        served.
+        """
+        os.mkdir(os.path.join(self.directory, 'broken.chkl'))
+        app = ChecklistApp(self.directory)
+        self.assertEqual('200 OK', self.request(app, '/first')[0])
+        self.assertEqual('404 Not Found', self.request(app, '/broken')[0])
+        status, headers, body = self.request(app, '/')
+        self.assertTrue(b'<a href="second">' in body)
+        self.assertFalse(b'broken' in body)
+
+    def test_preload(self):
+        app = ChecklistApp(self.directory, poll_interval=3600)
+        app.preload()
+        entry = app.get_entry('first')
+        self.assertNotEqual(None, entry.static)
+        status, headers, body = self.request(app, '/first')
+        self.assertEqual(entry.static.html, body)
+
+    def test_poll_interval(self):
+        app = ChecklistApp(self.directory, poll_interval=3600)
+        app.refresh()
+        self.write('third', '= Third =')
+        self.assertEqual(None, app.get_entry('third'))
+        app.refresh(force=True)
+        self.assertTrue(app.get_entry('third') is not None)